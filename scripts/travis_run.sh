@@ -53,6 +53,8 @@ activate_env "./$ZDS_VENV"
 
 	run_script "coverage_backend"
 
+	run_script "markdown_benchmark"
+
 	run_script "lint_backend"
 
 	run_script "build_documentation"
@@ -69,6 +69,7 @@ if [[ "$1" == "coverage_backend" ]] && [[ "$ZDS_TEST_JOB" == *"zds."* ]]; then
             --keepdb \
             --settings zds.settings.ci_test \
             --exclude-tag=front \
+            --exclude-tag=benchmark \
             ${ZDS_TEST_JOB/front/}; exVal=$?
 
         gateway "!! Test failed" $exVal
@@ -79,6 +80,19 @@ if [[ "$1" == "coverage_backend" ]] && [[ "$ZDS_TEST_JOB" == *"zds."* ]]; then
 fi
 
 
+# markdown benchmark (against a zmarkdown stand-in, the real server is not needed)
+if [[ "$1" == "markdown_benchmark" ]] && [[ "$ZDS_TEST_JOB" == *"zds.utils"* ]]; then
+    zds_fold_start "markdown_benchmark" "* Measure the markdown rendering pipeline"
+        python manage.py test \
+            --settings zds.settings.ci_test \
+            --tag=benchmark \
+            --keepdb; exVal=$?
+
+        gateway "!! Benchmark failed" $exVal
+    zds_fold_end
+fi
+
+
 # print zmarkdown log
 if [[ "$1" == "print_zmarkdown_log" ]] && [[ "$ZDS_TEST_JOB" == *"zds."* ]]; then
     zds_fold_start "zmarkdown_log" "* Print zmarkdown log"
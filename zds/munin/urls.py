@@ -1,6 +1,7 @@
 from django.urls import re_path
 
-from zds.munin.views import total_topics, total_posts, total_mps, total_tutorials, total_articles, total_opinions
+from zds.munin.views import total_topics, total_posts, total_mps, total_tutorials, total_articles, total_opinions, \
+    zmd_circuit_breaker, zmd_rendering
 
 
 urlpatterns = [
@@ -10,4 +11,6 @@ urlpatterns = [
     re_path(r'^total_tutorials/$', total_tutorials, name='total_tutorial'),
     re_path(r'^total_articles/$', total_articles, name='total_articles'),
     re_path(r'^total_opinions/$', total_opinions, name='total_opinions'),
+    re_path(r'^zmd_circuit_breaker/$', zmd_circuit_breaker, name='zmd_circuit_breaker'),
+    re_path(r'^zmd_rendering/$', zmd_rendering, name='zmd_rendering'),
 ]
@@ -2,6 +2,8 @@ from munin.helpers import muninview
 from zds.forum.models import Topic, Post
 from zds.mp.models import PrivateTopic, PrivatePost
 from zds.tutorialv2.models.database import PublishableContent, ContentReaction
+from zds.utils.zmd.breaker import zmd_breaker, STATE_VALUES
+from zds.utils.zmd.metrics import zmd_metrics, MemorySink, DURATION_BUCKETS
 
 
 @muninview(config="""graph_title Total Topics
@@ -62,3 +64,43 @@ def total_opinions(request):
             ('featured', opinions.filter(sha_picked__isnull=False).count()),
             ('published', opinions.filter(sha_public__isnull=False).count()),
             ('converted', opinions.filter(converted_to__sha_public__isnull=False).count())]
+
+
+@muninview(config="""graph_title zmarkdown circuit breaker
+graph_vlabel count
+state.label State (0 closed, 1 half-open, 2 open)
+failures.label Consecutive failures
+opened.label Openings
+rejected.label Rejected requests""")
+def zmd_circuit_breaker(request):
+    stats = zmd_breaker.stats()
+    return [('state', STATE_VALUES[stats['state']]),
+            ('failures', stats['failures']),
+            ('opened', stats['opened']),
+            ('rejected', stats['rejected'])]
+
+
+ZMD_BUCKETS = ['le_{}'.format(str(bound).replace('.', '_')) for bound in DURATION_BUCKETS] + ['inf']
+
+
+def _zmd_rendering_config():
+    lines = ['graph_title zmarkdown renderings',
+             'graph_vlabel requests per ${graph_period}',
+             'requests.label Requests',
+             'errors.label Errors (no answer or 5xx)',
+             'retries.label Retries']
+    for name, bound in zip(ZMD_BUCKETS, DURATION_BUCKETS):
+        lines.append('{}.label Durations up to {}s'.format(name, bound))
+    lines.append('inf.label Durations above {}s'.format(DURATION_BUCKETS[-1]))
+    for name in ['requests', 'errors', 'retries'] + ZMD_BUCKETS:
+        lines += ['{}.type DERIVE'.format(name), '{}.min 0'.format(name)]
+    return '\n'.join(lines)
+
+
+@muninview(config=_zmd_rendering_config())
+def zmd_rendering(request):
+    sink = zmd_metrics.get_sink(MemorySink)
+    stats = sink.stats() if sink is not None else MemorySink().stats()
+    return [('requests', stats['requests']),
+            ('errors', stats['errors']),
+            ('retries', stats['retries'])] + list(zip(ZMD_BUCKETS, stats['buckets']))
@@ -85,6 +85,12 @@ ZDS_APP = {
                 'S-Évolution'
             ]
         },
+        # how the downloaded files (PDF, EPUB...) are sent: by Django (``FileResponseBackend``), or by the front
+        # server (``XAccelRedirectBackend`` with the ``root`` and ``location`` options, ``XSendfileBackend``)
+        'file_serving': {
+            'backend': 'zds.utils.file_serving.FileResponseBackend',
+            'options': {},
+        },
         'licenses': {
             'logo': {
                 'code': 'CC-BY',
@@ -165,6 +171,51 @@ ZDS_APP = {
         # or 'extra_content_generation_policy': 'NOTHING'
         'extra_content_generation_policy': 'WATCHDOG',
         'extra_content_watchdog_dir': BASE_DIR / 'watchdog-build',
+        # generate the formats (zip, html, epub, pdf) at the same time, each in its own process (but one after the
+        # other inside a transaction, which the processes would not see)
+        'extra_content_generation_parallel': True,
+        # in seconds, the generation of a format is stopped after this delay (only when generated in parallel)
+        'extra_content_generation_timeouts': {
+            'default': 300,
+            'zip': 60,
+            'html': 120,
+            'pdf': 900,
+        },
+        # job runner of the publication_watchdog command, several watchdogs (on several hosts) can share the queue
+        'watchdog': {
+            # number of exports run at the same time by a watchdog
+            'workers': 2,
+            # maximum number of exports of a given format run at the same time by a watchdog
+            'format_concurrency': {
+                'pdf': 1,
+            },
+            # wake the watchdogs of the host up when exports are requested (through Unix sockets created in
+            # extra_content_watchdog_dir), instead of waiting for the next scan
+            'wakeup': True,
+            # in seconds, delay between two scans of the queue (for the exports requested on other hosts)
+            'poll_interval': 60,
+            # in seconds, a running export whose watchdog did not give news for this long is requested again
+            'stale_after': 120,
+            'max_attempts': 3,
+            # in seconds, delay before the first retry of a failed export, doubled for each new attempt
+            'retry_backoff': 30,
+            'retry_backoff_max': 3600,
+        },
+        # only render the texts which changed since the last publication
+        'incremental_publication': True,
+        # number of published versions of a content kept on disk (the public one and the previous ones, which may
+        # still be read by requests started before a new publication)
+        'public_versions_kept': 2,
+        # versions of contents kept in memory by each process, to avoid reading their manifest again (0 to disable)
+        'version_cache': {
+            'max_entries': 200,
+            # total number of containers and extracts of the cached versions
+            'max_nodes': 50000,
+            # write the tree of the public versions in a form faster to load than their manifest when publishing
+            'pickle_public_versions': True,
+        },
+        # git repositories kept open (with their git cat-file processes) by each thread, 0 to open them each time
+        'repository_pool_size': 8,
         'max_tree_depth': 3,
         'default_licence_pk': 7,
         'content_per_page': 42,
@@ -189,7 +240,12 @@ ZDS_APP = {
             'full': BASE_DIR / 'dist' / 'css' / 'zmd.css',
             'katex': BASE_DIR / 'dist' / 'css' / 'katex.min.css'
         },
-        'latex_template_repo': 'NOT_EXISTING_DIR'
+        'latex_template_repo': 'NOT_EXISTING_DIR',
+        # PDF already built for a LaTeX document (with the same images and class files), set to None to disable
+        'latex_build_cache_dir': BASE_DIR / 'latex-build-cache',
+        'latex_build_cache_size': 200,
+        # lualatex is run until the auxiliary files (toc, references...) do not change, at most this number of times
+        'latex_max_passes': 4,
     },
     'forum': {
         'posts_per_page': 21,
@@ -271,7 +327,51 @@ ZDS_APP = {
     'display_search_bar': True,
     'zmd': {
         'server': 'http://127.0.0.1:27272',
-        'disable_pings': False
+        'disable_pings': False,
+        'render_cache': {
+            'enabled': True,
+            # in-process LRU tier
+            'local_size': 512,
+            'local_ttl': 60 * 5,
+            # shared tier, set 'shared_cache' to None to disable it
+            'shared_cache': 'default',
+            'shared_ttl': 60 * 60 * 24,
+            # bigger texts are not cached (memcached refuses values above 1 MB anyway)
+            'max_input_size': 500000,
+            'key_prefix': 'zmd-render',
+        },
+        'session_pool': {
+            # maximum number of keep-alive connections to the server, per thread
+            'pool_size': 10,
+            'keep_alive': True,
+            # in seconds, latex may be really long to generate but it is also restrained by server configuration
+            'timeouts': {
+                '/html': 10,
+                '/epub': 10,
+                '/latex': 120,
+                '/latex-document': 120,
+            },
+        },
+        # maximum number of concurrent requests sent by ``render_markdown_batch``, for the whole process
+        'batch_workers': 4,
+        'circuit_breaker': {
+            # consecutive failures before requests are not sent anymore
+            'failure_threshold': 5,
+            # seconds before a probe request is sent again
+            'reset_timeout': 30,
+            # delay before the first retry, doubled (up to `backoff_max`) and randomized for the next ones
+            'backoff_base': 0.1,
+            'backoff_max': 2,
+        },
+        'metrics': {
+            # dotted paths of the classes receiving the measures of each request sent to the server, add
+            # 'zds.utils.zmd.metrics.LoggingSink' to log each of them
+            'sinks': [
+                'zds.utils.zmd.metrics.MemorySink',
+            ],
+            # renderings longer than this (in seconds) are logged with the view which requested them
+            'slow_threshold': 2,
+        },
     },
     'stats_ga_viewid': 'ga:86962671',
     'very_top_banner': {}
@@ -7,3 +7,6 @@ CACHES = {
         'LOCATION': '/tmp/django_cache',
     }
 }
+
+# the file based cache outlives the test runs: renderings faked by a test must not be reused by the others
+ZDS_APP['zmd']['render_cache']['shared_cache'] = None
@@ -2,6 +2,7 @@ from django.contrib import admin
 
 from zds.tutorialv2.models.database import PublishableContent, Validation, ContentReaction, PublishedContent, \
     PickListOperation, ContentRead, PublicationEvent, ContentContributionRole
+from zds.tutorialv2.publication_metrics import format_metrics
 
 
 class PublishableContentAdmin(admin.ModelAdmin):
@@ -58,7 +59,22 @@ class ContentReadAdmin(admin.ModelAdmin):
 
 
 class PublicationEventAdmin(admin.ModelAdmin):
-    list_display = ('published_object', 'date', 'state_of_processing', 'format_requested')
+
+    def duration(self, obj):
+        duration = obj.get_metrics().get('duration')
+        return '{:.1f} s'.format(duration) if duration is not None else '-'
+
+    duration.short_description = 'durée'
+
+    def stages(self, obj):
+        return format_metrics(obj.get_metrics())
+
+    stages.short_description = 'étapes'
+
+    list_display = ('published_object', 'date', 'state_of_processing', 'format_requested', 'attempts', 'worker',
+                    'duration', 'stages')
+    list_filter = ('state_of_processing', 'format_requested')
+    readonly_fields = ('duration', 'stages')
     ordering = ('published_object', 'date', 'state_of_processing')
     search_fields = ('state_of_processing', 'published_object__title', 'date')
 
@@ -0,0 +1,104 @@
+import hashlib
+import logging
+import os
+import shutil
+from pathlib import Path
+from urllib import parse
+
+logger = logging.getLogger(__name__)
+
+
+class AssetStager:
+    """
+    Put files (mostly images of galleries) in a build directory without copying them: they are hard-linked, and
+    only copied when they are on another filesystem (or links are not allowed). Copied files are deduplicated by
+    content, a file identical to an already copied one is linked to the copy.
+
+    .. attention::
+        Staged files may share their data with the original ones, they must not be modified in place.
+    """
+
+    def __init__(self):
+        self._copies = {}  # (size, sha256) -> path of a copy in a build directory
+        self.linked = 0
+        self.copied = 0
+
+    @staticmethod
+    def _get_content_key(file_path):
+        hasher = hashlib.sha256()
+        with open(str(file_path), 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        return file_path.stat().st_size, hasher.hexdigest()
+
+    def stage(self, source, destination, overwrite=True):
+        """
+        :param source: the file to stage
+        :type source: pathlib.Path
+        :param destination: its path in the build directory
+        :type destination: pathlib.Path
+        :param overwrite: whether an existing destination (which is not already the source) is replaced
+        :return: whether the destination is now the source
+        :rtype: bool
+        """
+        source, destination = Path(source), Path(destination)
+        if destination.exists():
+            if os.path.samefile(str(source), str(destination)):
+                return True
+            if not overwrite:
+                return False
+            destination.unlink()
+        try:
+            os.link(str(source), str(destination))
+            self.linked += 1
+            return True
+        except OSError:
+            pass
+
+        content_key = self._get_content_key(source)
+        copy = self._copies.get(content_key)
+        if copy is not None:
+            try:
+                os.link(str(copy), str(destination))
+                self.linked += 1
+                return True
+            except OSError:
+                pass
+        shutil.copy2(str(source), str(destination))
+        self._copies[content_key] = destination
+        self.copied += 1
+        return True
+
+    def stage_directory(self, source_dir, destination_dir, keep=None, overwrite=True):
+        """
+        Stage the files of ``source_dir`` (and of its subdirectories) in ``destination_dir``, without hierarchy.
+
+        :param keep: if given, only stage the files whose name it accepts
+        :type keep: callable
+        :return: the number of staged files
+        :rtype: int
+        """
+        staged = 0
+        source_dir = Path(source_dir)
+        if not source_dir.is_dir():
+            return staged
+        for file_path in source_dir.iterdir():
+            if file_path.is_dir():
+                staged += self.stage_directory(file_path, destination_dir, keep, overwrite)
+            elif keep is None or keep(file_path.name):
+                try:
+                    staged += self.stage(file_path, Path(destination_dir, file_path.name), overwrite)
+                except OSError as e:
+                    logger.warning('could not stage %s: %s', file_path, e)
+        return staged
+
+
+def referenced_in(text):
+    """
+    :param text: a markdown or HTML document
+    :return: a function telling whether a file name is referenced by the document
+    :rtype: callable
+    """
+    def is_referenced(name):
+        return name in text or parse.quote(name) in text
+    return is_referenced
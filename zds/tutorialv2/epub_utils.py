@@ -1,19 +1,35 @@
 import contextlib
+import html
 import logging
 import os
 import re
-import shutil
+import zipfile
 from collections import namedtuple
 from urllib import parse
 from os import path
-from bs4 import BeautifulSoup
 from pathlib import Path
 from shutil import copy
 from django.template.loader import render_to_string
 from django.conf import settings
 
-from zds.tutorialv2.publish_container import publish_container
+from zds.tutorialv2.asset_staging import AssetStager, referenced_in
+from zds.tutorialv2.publication_metrics import record_stage
+from zds.tutorialv2.publish_container import publish_container, render_container_fragments
+from zds.tutorialv2.utils import get_blob_shas
 from zds.utils import slugify
+from zds.utils.templatetags.emarkdown import epub_markdown_options
+from zds.utils.zip_stream import get_compress_type
+
+logger = logging.getLogger(__name__)
+
+DirTuple = namedtuple('DirTuple', ['absolute', 'relative'])
+
+# an attribute of a tag (with or without value), and a start tag (the ``<`` of the texts are escaped in HTML)
+ATTRIBUTE_RE = re.compile(r"""(?P<before>\s+(?P<name>[^\s=/>]+)\s*=\s*)(?P<value>"[^"]*"|'[^']*'|[^\s>"']+)"""
+                          r'|\s+[^\s=/>]+')
+TAG_RE = re.compile(r"""<(?P<name>[a-zA-Z][\w:-]*)"""
+                    r"""(?P<attributes>(?:\s+[^\s=/>]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s>"']+))?)*)"""
+                    r'\s*(?P<end>/?)>')
 
 
 def __build_mime_type_conf():
@@ -49,7 +65,21 @@ def __traverse_and_identify_images(image_dir):
         yield ebook_image_path, identifier, media_type_map.get(ext.lower(), 'image/png')
 
 
-def build_html_chapter_file(published_object, versioned_object, working_dir, root_dir, image_handler):
+def get_image_directory(working_dir, root_dir):
+    """
+    :param working_dir: the directory of the chapters
+    :type working_dir: pathlib.Path
+    :param root_dir: the root directory of the ebook
+    :type root_dir: pathlib.Path
+    :return: the absolute path of the image directory of the ebook, and its path relative to ``root_dir``
+    :rtype: DirTuple
+    """
+    img_dir = working_dir.parent / 'images'
+    return DirTuple(str(img_dir.absolute()), str(img_dir.relative_to(root_dir)))
+
+
+def build_html_chapter_file(published_object, versioned_object, working_dir, root_dir, image_handler,
+                            rendered_fragments=None):
     """
     Parses the full html file, extracts the ``<hX>`` tags and splits their content into new files.
     Yields all the produced files.
@@ -63,15 +93,17 @@ def build_html_chapter_file(published_object, versioned_object, working_dir, roo
     :param published_object: the published content as saved in database
     :type published_object: zds.tutorialv2.models.models_database.PublishedContent
     :type image_handler: ImageHandling
+    :param rendered_fragments: texts of the content rendered for the ebook, see ``render_container_fragments``
+    :type rendered_fragments: dict
     :return: a generator of tuples composed as ``[splitted_html_file_relative_path, chapter-identifier, chapter-title]``
     """
-    DirTuple = namedtuple('DirTuple', ['absolute', 'relative'])
-    img_dir = working_dir.parent / 'images'
+    image_directory = get_image_directory(working_dir, root_dir)
     path_to_title_dict = publish_container(published_object, str(working_dir), versioned_object,
                                            template='tutorialv2/export/ebook/chapter.html',
                                            file_ext='xhtml', image_callback=image_handler.handle_images,
-                                           image_directory=DirTuple(str(img_dir.absolute()),
-                                                                    str(img_dir.relative_to(root_dir))),
+                                           markdown_options=epub_markdown_options(image_directory),
+                                           rendered_fragments=rendered_fragments,
+                                           image_directory=image_directory,
                                            relative='.', intro_ccl_template='tutorialv2/export/ebook/introduction.html')
     for container_path, title in path_to_title_dict.items():
         # TODO: check if a function exists in the std lib to get rid of `root_dir + '/'`
@@ -111,6 +143,71 @@ def build_nav_xhtml(working_dir, content, chapters):
                                                                   'chapters': chapters}))
 
 
+def render_ebook_fragments(published_content_entity, versioned, markdown_options):
+    """
+    Render the texts of the content for the ebook. The texts which did not change since the previous EPUB (same git
+    blob) are not rendered again, unless ``ZDS_APP['content']['incremental_publication']`` is ``False``.
+
+    :type published_content_entity: zds.tutorialv2.models.database.PublishedContent
+    :param versioned: the public version
+    :type versioned: zds.tutorialv2.models.versioned.VersionedContent
+    :type markdown_options: dict
+    :return: the SHA of the git blob of each file, and the rendered texts (see ``render_container_fragments``)
+    :rtype: tuple
+    """
+    from zds.tutorialv2.publication_utils import load_rendered_fragments, EPUB_RENDERED_FRAGMENTS_FILE
+    blob_shas = get_blob_shas(versioned.repository, versioned.current_version)
+    html_by_blob_sha = {}
+    if settings.ZDS_APP['content']['incremental_publication']:
+        html_by_blob_sha = load_rendered_fragments(published_content_entity, markdown_options,
+                                                   EPUB_RENDERED_FRAGMENTS_FILE)
+    return blob_shas, render_container_fragments(versioned, markdown_options, blob_shas, html_by_blob_sha)
+
+
+def dump_ebook_fragments(published_content_entity, markdown_options, blob_shas, rendered_fragments,
+                         downloaded_images):
+    """
+    Store the texts rendered for the ebook, for the next EPUB. The texts using images downloaded by zmarkdown
+    are not stored, since their images would not be downloaded again.
+
+    :param downloaded_images: names of the images downloaded while rendering the texts
+    :type downloaded_images: set
+    """
+    from zds.tutorialv2.publication_utils import dump_rendered_fragments, EPUB_RENDERED_FRAGMENTS_FILE
+    reusable_fragments = {
+        text_path: (text, rendered) for text_path, (text, rendered) in rendered_fragments.items()
+        if not any(map(referenced_in(str(rendered)), downloaded_images))
+    }
+    with contextlib.suppress(OSError):
+        dump_rendered_fragments(published_content_entity.get_prod_path(), markdown_options, blob_shas,
+                                reusable_fragments, EPUB_RENDERED_FRAGMENTS_FILE)
+
+
+def write_epub_archive(ebook_dir, final_file_path):
+    """
+    Write the ebook directly in its archive, with the ``mimetype`` file first and not compressed, as required by
+    the EPUB standard. The archive replaces ``final_file_path`` atomically.
+
+    :type ebook_dir: pathlib.Path
+    :type final_file_path: pathlib.Path
+    """
+    mimetype_conf = __build_mime_type_conf()
+    tmp_file_path = final_file_path.with_name(final_file_path.name + '.tmp')
+    try:
+        with zipfile.ZipFile(str(tmp_file_path), 'w') as archive:
+            archive.write(str(ebook_dir / mimetype_conf['filename']), mimetype_conf['filename'],
+                          compress_type=zipfile.ZIP_STORED)
+            for file_path in sorted(ebook_dir.rglob('*')):
+                name = file_path.relative_to(ebook_dir).as_posix()
+                if file_path.is_file() and name != mimetype_conf['filename']:
+                    archive.write(str(file_path), name, compress_type=get_compress_type(name))
+        os.replace(str(tmp_file_path), str(final_file_path))
+    except OSError:
+        with contextlib.suppress(OSError):
+            tmp_file_path.unlink()
+        raise
+
+
 def build_ebook(published_content_entity, working_dir, final_file_path):
     ops_dir = Path(working_dir, 'ebook', 'OPS')
     text_dir_path = Path(ops_dir, 'Text')
@@ -132,48 +229,50 @@ def build_ebook(published_content_entity, working_dir, final_file_path):
 
     mimetype_conf = __build_mime_type_conf()
     mime_path = Path(working_dir, 'ebook', mimetype_conf['filename'])
-    with contextlib.suppress(FileExistsError, FileNotFoundError):
-        for img in published_content_entity.content.gallery.get_gallery_path().iterdir():
-            shutil.copy(str(img), str(target_image_dir))
-
     with mime_path.open(mode='w', encoding='utf-8') as mimefile:
         mimefile.write(mimetype_conf['content'])
     image_handler = ImageHandling()
+    versioned = published_content_entity.content.load_version(sha=published_content_entity.sha_public)
+    markdown_options = epub_markdown_options(get_image_directory(text_dir_path, Path(working_dir, 'ebook')))
+    blob_shas, rendered_fragments = render_ebook_fragments(published_content_entity, versioned, markdown_options)
+    # nothing else is in the image directory yet
+    dump_ebook_fragments(published_content_entity, markdown_options, blob_shas, rendered_fragments,
+                         {image.name for image in target_image_dir.iterdir()})
     chapters = list(
-        build_html_chapter_file(published_content_entity.content,
-                                published_content_entity.content.load_version(sha=published_content_entity.sha_public),
+        build_html_chapter_file(published_content_entity.content, versioned,
                                 working_dir=text_dir_path,
-                                root_dir=Path(working_dir, 'ebook'), image_handler=image_handler))
+                                root_dir=Path(working_dir, 'ebook'), image_handler=image_handler,
+                                rendered_fragments=rendered_fragments))
     build_toc_ncx(chapters, published_content_entity, ops_dir)
     copy_or_create_empty(settings.ZDS_APP['content']['epub_stylesheets']['toc'], style_dir_path, 'toc.css')
     copy_or_create_empty(settings.ZDS_APP['content']['epub_stylesheets']['full'], style_dir_path, 'zmd.css')
     copy_or_create_empty(settings.ZDS_APP['content']['epub_stylesheets']['katex'], style_dir_path, 'katex.css')
-    style_images_path = settings.BASE_DIR / 'dist' / 'images'
-    smiley_images_path = settings.BASE_DIR / 'dist' / 'smileys' / 'svg'
-    if style_images_path.exists():
-        import_asset(style_images_path, target_image_dir)
-    if smiley_images_path.exists():
-        import_asset(smiley_images_path, target_image_dir)
-    images = list(__traverse_and_identify_images(target_image_dir))
     image_handler.names.add('sprite.png')
+    # only the images used by the chapters are put in the ebook, see ``ImageHandling.handle_images``
+    stager = AssetStager()
+    stager.stage_directory(published_content_entity.content.gallery.get_gallery_path(), target_image_dir,
+                           keep=image_handler.names.__contains__)
+    import_asset(settings.BASE_DIR / 'dist' / 'images', target_image_dir, image_handler.names, stager)
+    import_asset(settings.BASE_DIR / 'dist' / 'smileys' / 'svg', target_image_dir, image_handler.names, stager)
+    images = list(__traverse_and_identify_images(target_image_dir))
     images = image_handler.remove_unused_image(target_image_dir, images)
     build_content_opf(published_content_entity, chapters, images, ops_dir)
     build_container_xml(meta_inf_dir_path)
     build_nav_xhtml(ops_dir, published_content_entity, chapters)
+    with record_stage('archive'):
+        write_epub_archive(Path(working_dir, 'ebook'), Path(final_file_path))
 
-    zip_logger = logging.getLogger(__name__ + '.zip')
-    zip_logger.setLevel(logging.WARN)
-    shutil.make_archive(str(final_file_path), format='zip', root_dir=str(Path(working_dir, 'ebook')),
-                        logger=zip_logger)
-    shutil.move(str(final_file_path) + '.zip', str(final_file_path))
 
+def import_asset(style_images_path, target_image_dir, names=None, stager=None):
+    """
+    Stage the images of ``style_images_path`` (and of its subdirectories) in ``target_image_dir``.
 
-def import_asset(style_images_path, target_image_dir):
-    for img_path in style_images_path.iterdir():
-        if img_path.is_file():
-            shutil.copy2(str(img_path), str(target_image_dir))
-        else:
-            import_asset(img_path, target_image_dir)
+    :param names: if given, only the images with one of these names are staged
+    :type names: set
+    :type stager: zds.tutorialv2.asset_staging.AssetStager
+    """
+    stager = stager or AssetStager()
+    stager.stage_directory(style_images_path, target_image_dir, keep=names.__contains__ if names is not None else None)
 
 
 def copy_or_create_empty(src_path, dst_path, default_name):
@@ -189,35 +288,61 @@ class ImageHandling:
         self.names = set()
         self.url_scheme_matcher = re.compile(r'^https?://')
 
+    def get_image_path(self, image_url):
+        """
+        :param image_url: the ``src`` of an image
+        :return: the path of the image in the image directory of the ebook
+        :rtype: str
+        """
+        if self.url_scheme_matcher.search(image_url):
+            splitted = parse.urlsplit(image_url)
+            final_path = splitted.path
+        elif image_url.startswith(settings.MEDIA_URL):
+            final_path = Path(image_url).name
+        elif Path(image_url).is_absolute() and 'images' in image_url:
+            root = Path(image_url)
+            while root.name != 'images':
+                root = root.parent
+            final_path = str(Path(image_url).relative_to(root))
+        else:
+            final_path = Path(image_url).name
+        return str(final_path).replace('%20', '_')
+
     def handle_images(self, relative_path):
+        """
+        :param relative_path: path of the ebook root from the chapter
+        :return: a function rewriting the ``src`` of the images of a chapter to the image directory of the ebook
+            (and deduplicating the ``id``), in one pass over the tags, without parsing the whole document
+        :rtype: callable
+        """
         def handle_image_path_with_good_img_dir_path(html_code):
-            soup_parser = BeautifulSoup(html_code, 'lxml')
-            for image in soup_parser.find_all('img'):
-                if not image.get('src', ''):
-                    continue
-                image_url = image['src']
-                if self.url_scheme_matcher.search(image_url):
-                    splitted = parse.urlsplit(image_url)
-                    final_path = splitted.path
-                elif image_url.startswith(settings.MEDIA_URL):
-                    final_path = Path(image_url).name
-                elif Path(image_url).is_absolute() and 'images' in image_url:
-                    root = Path(image_url)
-                    while root.name != 'images':
-                        root = root.parent
-                    final_path = str(Path(image_url).relative_to(root))
+            ids = set()
+
+            def replace_attribute(tag_name, match):
+                attribute_name = (match.group('name') or '').lower()
+                if match.group('value') is None or attribute_name not in ('src', 'id'):
+                    return match.group(0)
+                value = html.unescape(match.group('value').strip('"\''))
+                if attribute_name == 'src':
+                    if tag_name != 'img' or not value:
+                        return match.group(0)
+                    value = relative_path + '/images/' + self.get_image_path(value)
+                    self.names.add(Path(value).name)
                 else:
-                    final_path = Path(image_url).name
-                image_path_in_ebook = relative_path + '/images/' + str(final_path).replace('%20', '_')
-                image['src'] = str(image_path_in_ebook)
-                self.names.add(Path(image_path_in_ebook).name)
-            ids = {}
-            for element in soup_parser.find_all(name=None, attrs={'id': (lambda s: True)}):
-                while element.get('id', None) and element['id'] in ids:
-                    element['id'] += '-1'
-                if element.get('id', None):
-                    ids[element['id']] = True
-            return soup_parser.prettify('utf-8').decode('utf-8')
+                    if not value:
+                        return match.group(0)
+                    while value in ids:
+                        value += '-1'
+                    ids.add(value)
+                return '{}"{}"'.format(match.group('before'), html.escape(value))
+
+            def replace_tag(match):
+                tag_name = match.group('name').lower()
+                attributes = ATTRIBUTE_RE.sub(lambda attribute: replace_attribute(tag_name, attribute),
+                                              match.group('attributes'))
+                return '<{}{}{}>'.format(match.group('name'), attributes, match.group('end'))
+
+            return TAG_RE.sub(replace_tag, html_code)
         return handle_image_path_with_good_img_dir_path
 
     def remove_unused_image(self, image_path: Path, imglist):
@@ -0,0 +1,143 @@
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# files written by lualatex (and makeglossaries) and read by the next pass: the document converged once they do
+# not change anymore
+AUXILIARY_EXTENSIONS = ('.aux', '.toc', '.lof', '.lot', '.out', '.glo', '.gls', '.ist')
+
+
+def _hash_file(hasher, file_path):
+    with open(str(file_path), 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            hasher.update(chunk)
+
+
+def hash_paths(paths, hasher=None):
+    """
+    Hash the content (and the relative name) of files, and of every file of directories.
+
+    :param paths: files or directories, the missing ones are ignored
+    :type paths: list[pathlib.Path]
+    :param hasher: a ``hashlib`` object to update, a new SHA-256 one by default
+    :return: the hasher
+    """
+    hasher = hasher or hashlib.sha256()
+    for root in paths:
+        root = Path(root)
+        if root.is_dir():
+            files = sorted(file for file in root.rglob('*') if file.is_file())
+        elif root.is_file():
+            files = [root]
+        else:
+            continue
+        for file in files:
+            hasher.update(str(file.relative_to(root.parent)).encode('utf-8') + b'\0')
+            _hash_file(hasher, file)
+    return hasher
+
+
+def get_auxiliary_hashes(latex_file_path):
+    """
+    :param latex_file_path: path of the ``.tex`` file
+    :return: the hash of each auxiliary file of the document, by extension
+    :rtype: dict
+    """
+    base_path = os.path.splitext(str(latex_file_path))[0]
+    hashes = {}
+    for extension in AUXILIARY_EXTENSIONS:
+        with_extension = Path(base_path + extension)
+        if with_extension.is_file():
+            hashes[extension] = hash_paths([with_extension]).hexdigest()
+    return hashes
+
+
+class LatexBuildCache:
+    """
+    Keep the last PDF built for each LaTeX document, so that a document which did not change (same LaTeX, same
+    images, same class files) is not compiled again. Entries are named after the key of the build, the least
+    recently used ones are removed once there are more than ``max_entries``.
+    """
+
+    def __init__(self, directory, max_entries=200):
+        self.directory = Path(directory) if directory else None
+        self.max_entries = max_entries
+
+    @classmethod
+    def from_settings(cls):
+        content_settings = settings.ZDS_APP['content']
+        return cls(content_settings.get('latex_build_cache_dir'), content_settings.get('latex_build_cache_size', 200))
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    @staticmethod
+    def get_key(latex_file_path, extension, dependencies):
+        """
+        :param latex_file_path: path of the ``.tex`` file
+        :param extension: extension of the built file
+        :param dependencies: files and directories used by the build (images, class files...)
+        :return: the key of the build
+        :rtype: str
+        """
+        hasher = hashlib.sha256(extension.encode('utf-8') + b'\0')
+        _hash_file(hasher, latex_file_path)
+        return hash_paths(dependencies, hasher).hexdigest()
+
+    def _get_path(self, key, extension):
+        return self.directory / (key + extension)
+
+    def get(self, key, extension, destination):
+        """
+        Copy the file built for ``key`` to ``destination``, if it is known.
+
+        :return: whether the file was found
+        :rtype: bool
+        """
+        if not self.enabled:
+            return False
+        cached_path = self._get_path(key, extension)
+        try:
+            shutil.copyfile(str(cached_path), str(destination))
+            os.utime(str(cached_path))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key, extension, built_file_path):
+        """
+        Store the file built for ``key``.
+        """
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=str(self.directory), suffix='.tmp')
+        os.close(file_descriptor)
+        try:
+            shutil.copyfile(str(built_file_path), temporary_path)
+            # the entry is complete before it can be read
+            os.replace(temporary_path, str(self._get_path(key, extension)))
+        except OSError:
+            logger.exception('could not store %s in the LaTeX build cache', built_file_path)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temporary_path)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = [entry for entry in self.directory.iterdir() if entry.suffix != '.tmp']
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            with contextlib.suppress(FileNotFoundError):
+                entry.unlink()
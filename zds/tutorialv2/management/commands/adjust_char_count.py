@@ -1,18 +1,40 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 from django.core.management.base import BaseCommand
+from django.db import connection
 
 from zds.tutorialv2.models.database import PublishedContent
+from zds.utils.zmd.stats import count_file_signs
+
+logger = logging.getLogger(__name__)
+
+
+def count_signs_or_none(md_file_path):
+    try:
+        return count_file_signs(md_file_path)
+    except OSError as e:
+        logger.warning('could not get file %s to compute nb letters (error=%s)', md_file_path, e)
+        return None
 
 
 class Command(BaseCommand):
     """
     `python manage.py adjust_char_count`; set the number of characters for every published content.
 
+    Characters are counted locally (see ``zds.utils.zmd.stats``), by batches of contents which are processed by
+    several worker processes.
     """
 
     help = 'Set the number of characters for every published content'
 
     def add_arguments(self, parser):
         parser.add_argument('--id', dest='id', type=str)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='number of processes counting the characters (default: number of CPUs)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='number of contents counted and saved together')
 
     def handle(self, *args, **options):
         opt = options.get('id')
@@ -22,8 +44,24 @@ class Command(BaseCommand):
         else:
             query = PublishedContent.objects.filter(must_redirect=False)
 
-        for content in query:
-            self.stdout.write('Processing « {} »...'.format(content.title()))
-            content.char_count = content.get_char_count()
-            content.save()
-            self.stdout.write('  It got {} letters.'.format(content.char_count))
+        contents = list(query.order_by('pk'))
+        batch_size = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+
+        if workers > 1 and len(contents) > 1:
+            # the workers do not use the database, but must not inherit its connection
+            connection.close()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                self.adjust(contents, batch_size, lambda paths: executor.map(count_signs_or_none, paths))
+        else:
+            self.adjust(contents, batch_size, lambda paths: map(count_signs_or_none, paths))
+
+    def adjust(self, contents, batch_size, count):
+        for start in range(0, len(contents), batch_size):
+            batch = contents[start:start + batch_size]
+            paths = [os.path.join(content.get_extra_contents_directory(), content.content_public_slug + '.md')
+                     for content in batch]
+            for content, char_count in zip(batch, count(paths)):
+                content.char_count = char_count
+                self.stdout.write('« {} » got {} letters.'.format(content.content_public_slug, char_count))
+            PublishedContent.objects.bulk_update(batch, ['char_count'])
@@ -0,0 +1,58 @@
+from collections import OrderedDict, defaultdict
+
+from django.core.management import BaseCommand
+
+from zds.tutorialv2.models.database import PublicationEvent
+from zds.tutorialv2.publication_metrics import format_metrics, format_memory
+
+
+class Command(BaseCommand):
+    help = 'Show the time spent in each stage of the last publications and exports, and their peak memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--content', type=int, action='append', dest='contents', default=[],
+                            help='only the publications of this content (id of the published content)')
+        parser.add_argument('--format', dest='formats', action='append', default=[],
+                            help='only this format ("publication" for the publications themselves)')
+        parser.add_argument('--limit', type=int, default=20, help='number of events (default: 20)')
+        parser.add_argument('--summary', action='store_true',
+                            help='show the mean and maximum duration of each stage, by format, instead of the events')
+
+    def handle(self, *args, contents=(), formats=(), limit=20, summary=False, **options):
+        events = PublicationEvent.objects \
+            .exclude(metrics__isnull=True) \
+            .select_related('published_object') \
+            .order_by('-date', '-pk')
+        if contents:
+            events = events.filter(published_object__content_pk__in=contents)
+        if formats:
+            events = events.filter(format_requested__in=formats)
+        events = list(events[:limit])
+
+        if summary:
+            self.show_summary(events)
+        else:
+            for event in events:
+                metrics = event.get_metrics()
+                self.stdout.write('{:%Y-%m-%d %H:%M} {} [{}] {} {:.1f}s: {}'.format(
+                    event.date, event.published_object.content_public_slug, event.format_requested,
+                    event.state_of_processing, metrics.get('duration', 0), format_metrics(metrics)))
+
+    def show_summary(self, events):
+        durations = defaultdict(lambda: defaultdict(list))
+        peak_memories = defaultdict(list)
+        for event in events:
+            metrics = event.get_metrics()
+            durations[event.format_requested]['total'].append(metrics.get('duration', 0))
+            for name, seconds in metrics.get('stages', {}).items():
+                durations[event.format_requested][name].append(seconds)
+            peak_memories[event.format_requested].append(
+                max(metrics.get('peak_memory') or 0, metrics.get('children_peak_memory') or 0))
+
+        for format_requested, stages in sorted(durations.items()):
+            self.stdout.write('{} ({} événements, mémoire max {})'.format(
+                format_requested, len(stages['total']), format_memory(max(peak_memories[format_requested]))))
+            stages = OrderedDict(sorted(stages.items(), key=lambda stage: sum(stage[1]), reverse=True))
+            for name, values in stages.items():
+                self.stdout.write('  {:<20} moyenne {:>8.2f}s  max {:>8.2f}s'.format(
+                    name, sum(values) / len(values), max(values)))
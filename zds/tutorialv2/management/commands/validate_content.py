@@ -15,6 +15,8 @@ class Command(BaseCommand):
         parser.add_argument('content', type=Command.id_validator)
         parser.add_argument('--major', dest='is_major', action='store_true')
         parser.add_argument('--source', dest='source', type=str, default='')
+        parser.add_argument('--full-rebuild', dest='full_rebuild', action='store_true',
+                            help='render every text again, even those which did not change since the last publication')
 
     @staticmethod
     def id_validator(content_pk):
@@ -31,12 +33,12 @@ class Command(BaseCommand):
 
         return content
 
-    def handle(self, *args, content: PublishableContent, is_major=False, **options):
+    def handle(self, *args, content: PublishableContent, is_major=False, full_rebuild=False, **options):
         content.current_validation = Validation.objects.filter(content=content, status='PENDING_V').first()
         versioned = content.load_version(sha=content.current_validation.version)
         is_update = content.sha_public
         try:
-            published = publish_content(content, versioned, is_major_update=is_major)
+            published = publish_content(content, versioned, is_major_update=is_major, full_rebuild=full_rebuild)
         except FailureDuringPublication as e:
             self.stdout.write('Publication failed')
             logging.getLogger(__name__).exception('Failure during publication', exc_info=e)
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.11 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorialv2', '0030_contentsuggestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publicationevent',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='nombre de tentatives'),
+        ),
+        migrations.AddField(
+            model_name='publicationevent',
+            name='error',
+            field=models.TextField(blank=True, null=True, verbose_name='dernière erreur'),
+        ),
+        migrations.AddField(
+            model_name='publicationevent',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='dernier signe de vie du worker'),
+        ),
+        migrations.AddField(
+            model_name='publicationevent',
+            name='retry_after',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='nouvelle tentative après'),
+        ),
+        migrations.AddField(
+            model_name='publicationevent',
+            name='worker',
+            field=models.CharField(blank=True, max_length=120, null=True, verbose_name='worker'),
+        ),
+    ]
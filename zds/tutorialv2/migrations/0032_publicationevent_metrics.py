@@ -0,0 +1,18 @@
+# Generated by Django 2.2.11 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorialv2', '0031_publicationevent_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publicationevent',
+            name='metrics',
+            field=models.TextField(blank=True, null=True, verbose_name='mesures'),
+        ),
+    ]
@@ -11,6 +11,7 @@ from django.views.generic import View
 from zds.forum.models import Topic
 from zds.tutorialv2.models.database import PublishableContent, PublishedContent, ContentRead
 from zds.tutorialv2.utils import mark_read
+from zds.utils.file_serving import get_file_serving_backend
 
 
 class SingleContentViewMixin(object):
@@ -514,7 +515,9 @@ class DownloadViewMixin(View):
     (inspired from https://djangosnippets.org/snippets/2549/ and
     http://stackoverflow.com/questions/16286666/send-a-file-through-django-class-based-views)
 
-    You just need to override `get_contents()` to make it works
+    You just need to override `get_contents()` to make it works. It returns the bytes of the file, or an iterator
+    over them to stream the file. If the file is on the disk, override `get_file_path()` instead: the file is then
+    sent by the backend of ``ZDS_APP['site']['file_serving']``, without being read in memory.
     """
     mimetype = None
     filename = None
@@ -528,14 +531,29 @@ class DownloadViewMixin(View):
     def get_contents(self):
         pass
 
+    def get_file_path(self):
+        """
+        :return: the path of the file to send, or ``None`` to send the result of ``get_contents()``
+        """
+        return None
+
     def get(self, context, **response_kwargs):
         """
         Access to a file with only get method then write the file content in response stream.
         Properly sets Content-Type and Content-Disposition headers
         """
-        response = HttpResponse(content_type=self.get_mimetype())
+        file_path = self.get_file_path()
+        if file_path is not None:
+            return get_file_serving_backend().serve(self.request, file_path, self.get_mimetype(),
+                                                    {'Content-Disposition': 'filename=' + self.get_filename()})
+
+        contents = self.get_contents()
+        if contents is None or isinstance(contents, (bytes, str)):
+            response = HttpResponse(content_type=self.get_mimetype())
+            response.write(contents)
+        else:
+            response = StreamingHttpResponse(contents, content_type=self.get_mimetype())
         response['Content-Disposition'] = 'filename=' + self.get_filename()
-        response.write(self.get_contents())
 
         return response
 
@@ -18,7 +18,7 @@ from django.utils.http import urlencode
 from django.utils.translation import ugettext_lazy as _
 from elasticsearch_dsl import Mapping, Q as ES_Q
 from elasticsearch_dsl.field import Text, Keyword, Date, Boolean
-from git import Repo, BadObject
+from git import BadObject
 from gitdb.exc import BadName
 from uuslug import uuslug
 
@@ -32,11 +32,15 @@ from zds.tutorialv2.managers import PublishedContentManager, PublishableContentM
 from zds.tutorialv2.models import TYPE_CHOICES, STATUS_CHOICES, CONTENT_TYPES_REQUIRING_VALIDATION, PICK_OPERATIONS
 from zds.tutorialv2.models.mixins import TemplatableContentModelMixin, OnlineLinkableContentMixin
 from zds.tutorialv2.models.versioned import NotAPublicVersion
-from zds.tutorialv2.utils import get_content_from_json, BadManifestError
+from zds.tutorialv2.public_versions import remove_public_version
+from zds.tutorialv2.publication_metrics import load_metrics
+from zds.tutorialv2.repositories import get_repository
+from zds.tutorialv2.utils import get_content_from_json, BadManifestError, get_blob
+from zds.tutorialv2.version_cache import draft_versions, public_versions, is_commit_sha, load_public_tree, \
+    pickle_public_versions
 from zds.utils import get_current_user
 from zds.utils.models import SubCategory, Licence, HelpWriting, Comment, Tag
-from zds.utils.templatetags.emarkdown import render_markdown_stats
-from zds.utils.tutorials import get_blob
+from zds.utils.zmd.stats import count_file_signs
 
 ALLOWED_TYPES = ['pdf', 'md', 'html', 'epub', 'zip', 'tex']
 logger = logging.getLogger(__name__)
@@ -362,16 +366,27 @@ class PublishableContent(models.Model, TemplatableContentModelMixin):
             if sha != public.sha_public:
                 raise NotAPublicVersion
 
-            with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as manifest:
-                json = json_handler.loads(manifest.read())
-                versioned = get_content_from_json(
-                    json,
-                    public.sha_public,
-                    slug,
-                    public=True,
-                    max_title_len=max_title_length,
-                    hint_licence=self.licence,
-                )
+            # the public versions only change when the content is published again, in a new directory
+            key = (self.pk, sha, os.path.realpath(path))
+            versioned = public_versions.get(key)
+            if versioned is None:
+                versioned = load_public_tree(path) if pickle_public_versions() else None
+                if versioned is None:
+                    with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as manifest:
+                        json = json_handler.loads(manifest.read())
+                        versioned = get_content_from_json(
+                            json,
+                            public.sha_public,
+                            slug,
+                            public=True,
+                            max_title_len=max_title_length,
+                            hint_licence=self.licence,
+                        )
+                else:
+                    self.refresh_licence(versioned)
+                public_versions.set(key, versioned)
+            else:
+                self.refresh_licence(versioned)
 
         else:  # draft version, use the repository (slower, but allows manipulation)
             path = self.get_repo_path()
@@ -379,20 +394,39 @@ class PublishableContent(models.Model, TemplatableContentModelMixin):
             if not os.path.isdir(path):
                 raise OSError(path)
 
-            repo = Repo(path)
-            data = get_blob(repo.commit(sha).tree, 'manifest.json')
-            try:
-                json = json_handler.loads(data)
-                logger.debug('loaded json')
-            except ValueError:
-                raise BadManifestError(
-                    _('Une erreur est survenue lors de la lecture du manifest.json, est-ce du JSON ?'))
-
-            versioned = get_content_from_json(json, sha, self.slug, max_title_len=max_title_length)
+            # the commits never change, so a version already loaded can be reused (unlike a branch or HEAD)
+            cacheable = is_commit_sha(sha)
+            versioned = draft_versions.get((path, sha)) if cacheable else None
+            if versioned is None:
+                repo = get_repository(path)
+                data = get_blob(repo.commit(sha).tree, 'manifest.json')
+                try:
+                    json = json_handler.loads(data)
+                    logger.debug('loaded json')
+                except ValueError:
+                    raise BadManifestError(
+                        _('Une erreur est survenue lors de la lecture du manifest.json, est-ce du JSON ?'))
+
+                versioned = get_content_from_json(json, sha, self.slug, max_title_len=max_title_length)
+                if cacheable:
+                    draft_versions.set((path, sha), versioned)
+            else:
+                self.refresh_licence(versioned)
 
         self.insert_data_in_versioned(versioned)
         return versioned
 
+    def refresh_licence(self, versioned):
+        """Take the licence of a version loaded from a cache from the database, since it may have changed
+
+        :param versioned: the version
+        """
+        if versioned.licence is not None:
+            if self.licence is not None and self.licence.code == versioned.licence.code:
+                versioned.licence = self.licence
+            else:
+                versioned.licence = Licence.objects.filter(code=versioned.licence.code).first()
+
     def insert_data_in_versioned(self, versioned):
         """Insert some additional data from database in a VersionedContent
 
@@ -546,8 +580,7 @@ class PublishableContent(models.Model, TemplatableContentModelMixin):
         if os.path.exists(self.get_repo_path()):
             shutil.rmtree(self.get_repo_path(), False)
         if self.in_public() and self.public_version:
-            if os.path.exists(self.public_version.get_prod_path()):
-                shutil.rmtree(self.public_version.get_prod_path())
+            remove_public_version(self.public_version.get_prod_path())
 
         Validation.objects.filter(content=self).delete()
 
@@ -911,11 +944,9 @@ class PublishedContent(AbstractESDjangoIndexable, TemplatableContentModelMixin,
             md_file_path = os.path.join(self.get_extra_contents_directory(), self.content_public_slug + '.md')
 
         try:
-            with open(md_file_path, encoding='utf-8') as md_file_handler:
-                content = md_file_handler.read()
             current_content = PublishedContent.objects.filter(content_pk=self.content_pk, must_redirect=False).first()
             if current_content:
-                return render_markdown_stats(content)
+                return count_file_signs(md_file_path)
         except OSError as e:
             logger.warning('could not get file %s to compute nb letters (error=%s)', md_file_path, e)
 
@@ -1340,10 +1371,25 @@ class PublicationEvent(models.Model):
     # 25 for formats such as "printable.pdf", if tomorrow we want other "long" formats this will be ready
     format_requested = models.CharField(blank=False, null=False, max_length=25)
     created = models.DateTimeField(verbose_name='date de création', name='date', auto_now_add=True)
+    # claim of the job by a watchdog (see ``zds.tutorialv2.publication_jobs``)
+    worker = models.CharField(verbose_name='worker', max_length=120, null=True, blank=True)
+    heartbeat = models.DateTimeField(verbose_name='dernier signe de vie du worker', null=True, blank=True)
+    attempts = models.PositiveIntegerField(verbose_name='nombre de tentatives', default=0)
+    retry_after = models.DateTimeField(verbose_name='nouvelle tentative après', null=True, blank=True)
+    error = models.TextField(verbose_name='dernière erreur', null=True, blank=True)
+    # JSON, see ``zds.tutorialv2.publication_metrics.PublicationMetrics``
+    metrics = models.TextField(verbose_name='mesures', null=True, blank=True)
 
     def __str__(self):
         return '{}: {} - {}'.format(self.published_object.title(), self.format_requested, self.state_of_processing)
 
+    def get_metrics(self):
+        """
+        :return: the time spent in each stage and the peak memory of the publication or the export
+        :rtype: dict
+        """
+        return load_metrics(self.metrics)
+
 
 class ContentContributionRole(models.Model):
     """
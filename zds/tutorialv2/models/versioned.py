@@ -3,7 +3,6 @@ import copy
 from pathlib import Path
 
 from zds import json_handler
-from git import Repo
 import os
 import shutil
 import codecs
@@ -19,7 +18,9 @@ from zds.tutorialv2.models.mixins import TemplatableContentModelMixin
 from zds.tutorialv2.utils import default_slug_pool, export_content, get_commit_author, InvalidOperationError
 from zds.utils.misc import compute_hash
 from zds.tutorialv2.models import SINGLE_CONTAINER_CONTENT_TYPES, CONTENT_TYPES_BETA, CONTENT_TYPES_REQUIRING_VALIDATION
-from zds.tutorialv2.utils import get_blob, InvalidSlugError, check_slug
+from zds.tutorialv2.repositories import get_repository
+from zds.tutorialv2.utils import get_blob, InvalidSlugError, check_slug, get_blob_shas, read_blobs, \
+    normalize_blob_path
 from zds.utils.templatetags.emarkdown import emarkdown
 
 
@@ -426,8 +427,7 @@ class Container:
         :rtype: str
         """
         if self.introduction:
-            return get_blob(self.top_container().repository.commit(self.top_container().current_version).tree,
-                            self.introduction.replace('\\', '/')) or ''
+            return self.top_container().get_version_text(self.introduction) or ''
         return ''
 
     def get_conclusion(self):
@@ -436,8 +436,7 @@ class Container:
         :rtype: str
         """
         if self.conclusion:
-            return get_blob(self.top_container().repository.commit(self.top_container().current_version).tree,
-                            self.conclusion.replace('\\', '/')) or ''
+            return self.top_container().get_version_text(self.conclusion) or ''
         return ''
 
     def get_introduction_online(self):
@@ -1014,9 +1013,7 @@ class Extract:
         :rtype: str
         """
         if self.text:
-            return get_blob(
-                self.container.top_container().repository.commit(self.container.top_container().current_version).tree,
-                self.text.replace('\\', '/'))
+            return self.container.top_container().get_version_text(self.text)
         return ''
 
     def compute_hash(self):
@@ -1223,11 +1220,43 @@ class VersionedContent(Container, TemplatableContentModelMixin):
             self.slug_repository = slug
 
         if self.slug != '' and os.path.exists(self.get_path()):
-            self.repository = Repo(self.get_path())
+            self.repository = get_repository(self.get_path())
 
     def __str__(self):
         return self.title
 
+    def load_texts(self, blob_shas=None):
+        """Read all the files of the version at once (see ``read_blobs``), so that the following calls to
+        ``get_text()``, ``get_introduction()`` and ``get_conclusion()`` of its containers and extracts do not read
+        them one by one from the repository. Useful before going through the whole content.
+
+        :param blob_shas: the SHA of the files of the version, as returned by ``get_blob_shas``, if already known
+        :type blob_shas: dict
+        """
+        if blob_shas is None:
+            blob_shas = get_blob_shas(self.repository, self.current_version)
+        contents = read_blobs(self.repository, set(blob_shas.values()))
+        texts = {}
+        for path, blob_sha in blob_shas.items():
+            with contextlib.suppress(KeyError, UnicodeDecodeError):
+                texts[path] = contents[blob_sha].decode()
+        self._loaded_texts = (self.current_version, texts)
+
+    def get_version_text(self, path):
+        """
+        :param path: path of a file of the version, as found in the manifest
+        :return: the content of the file (read from the texts loaded by ``load_texts()`` if any), ``None`` if there
+            is no such file
+        :rtype: str
+        """
+        loaded_texts = getattr(self, '_loaded_texts', None)
+        # the texts loaded before a commit are the ones of the previous version
+        if loaded_texts is not None and loaded_texts[0] == self.current_version:
+            text = loaded_texts[1].get(normalize_blob_path(path))
+            if text is not None:
+                return text
+        return get_blob(self.repository.commit(self.current_version).tree, path.replace('\\', '/'))
+
     def get_absolute_url(self, version=None):
         return TemplatableContentModelMixin.get_absolute_url(self, version)
 
@@ -1367,7 +1396,7 @@ class VersionedContent(Container, TemplatableContentModelMixin):
             self.slug = slug
             new_path = self.get_path(use_current_slug=True)
             shutil.move(old_path, new_path)
-            self.repository = Repo(new_path)
+            self.repository = get_repository(new_path)
             self.slug_repository = slug
 
         return self.repo_update(title, introduction, conclusion, commit_message=commit_message, do_commit=do_commit)
@@ -0,0 +1,117 @@
+import contextlib
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+from zds.utils import get_current_request
+
+logger = logging.getLogger(__name__)
+
+# directory of ``repo_public_path`` containing the versions of each published content
+VERSIONS_DIRNAME = '.versions'
+
+
+def get_versions_directory(prod_path):
+    """
+    :param prod_path: the public path of a content, see ``PublishedContent.get_prod_path``
+    :return: the directory containing the published versions of the content
+    :rtype: pathlib.Path
+    """
+    prod_path = Path(prod_path)
+    return prod_path.parent / VERSIONS_DIRNAME / prod_path.name
+
+
+def switch_public_version(build_path, prod_path, version_name):
+    """
+    Make the version built in ``build_path`` the public one. The version is moved (not copied) to the versions
+    directory of the content, and ``prod_path`` becomes a symbolic link to it, replaced atomically, so that the
+    content is never missing. The old versions are then removed, see ``schedule_versions_cleaning``.
+
+    :param build_path: the directory where the version was built
+    :param prod_path: the public path of the content
+    :param version_name: a name for the version, unique among the versions of the content
+    :return: the path of the version
+    :rtype: pathlib.Path
+    """
+    prod_path = Path(prod_path)
+    versions_directory = get_versions_directory(prod_path)
+    versions_directory.mkdir(parents=True, exist_ok=True)
+    version_path = versions_directory / version_name
+    os.rename(str(build_path), str(version_path))
+
+    if prod_path.is_dir() and not prod_path.is_symlink():
+        # published before the versions existed: this one is moved aside, the content is missing for an instant
+        os.rename(str(prod_path), str(versions_directory / (version_name + '-previous')))
+
+    link_path = prod_path.with_name('.{}-{}'.format(prod_path.name, version_name))
+    os.symlink(os.path.relpath(str(version_path), str(prod_path.parent)), str(link_path))
+    os.replace(str(link_path), str(prod_path))
+    logger.debug('%s now points to %s', prod_path, version_path)
+
+    schedule_versions_cleaning(versions_directory, settings.ZDS_APP['content'].get('public_versions_kept', 2))
+    return version_path
+
+
+def remove_public_version(prod_path):
+    """
+    Remove the public path of a content, then its versions (see ``schedule_versions_cleaning``).
+
+    :param prod_path: the public path of the content
+    """
+    prod_path = Path(prod_path)
+    if prod_path.is_symlink():
+        prod_path.unlink()
+    elif prod_path.is_dir():
+        shutil.rmtree(str(prod_path))
+    versions_directory = get_versions_directory(prod_path)
+    if versions_directory.is_dir():
+        schedule_versions_cleaning(versions_directory, 0)
+
+
+def clean_versions(versions_directory, keep):
+    """
+    Remove the versions of a content, except the public one and the ``keep - 1`` most recent others (which may
+    still be read by requests started before the switch). The versions are ordered by name, which starts with the
+    date of the publication: the files written in a version later on do not change the order.
+
+    :param versions_directory: the versions directory of the content, see ``get_versions_directory``
+    :param keep: number of versions to keep, including the public one
+    :return: the removed versions
+    :rtype: list[pathlib.Path]
+    """
+    versions_directory = Path(versions_directory)
+    prod_path = versions_directory.parent.parent / versions_directory.name
+    current = prod_path.resolve() if prod_path.is_symlink() else None
+    versions = sorted((version for version in versions_directory.iterdir() if version.resolve() != current),
+                      key=lambda version: version.name, reverse=True)
+    removed = versions[max(0, keep - (1 if current is not None else 0)):]
+    for version in removed:
+        shutil.rmtree(str(version), ignore_errors=True)
+    if current is None and keep <= 0:
+        with contextlib.suppress(OSError):
+            versions_directory.rmdir()
+    return removed
+
+
+def _clean_versions_quietly(versions_directory, keep):
+    try:
+        clean_versions(versions_directory, keep)
+    except OSError:
+        logger.exception('could not remove the old versions of %s', versions_directory)
+
+
+def schedule_versions_cleaning(versions_directory, keep):
+    """
+    Run ``clean_versions`` in a background thread when handling a request, so that the response does not wait for
+    the removal of the files. The thread is not a daemon one: the process waits for it before exiting. Elsewhere
+    (management commands, watchdog...), the versions are removed before returning.
+    """
+    if get_current_request() is None:
+        _clean_versions_quietly(versions_directory, keep)
+    else:
+        threading.Thread(target=_clean_versions_quietly, args=(versions_directory, keep),
+                         name='versions-cleaning').start()
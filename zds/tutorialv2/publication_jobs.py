@@ -0,0 +1,281 @@
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from zds.tutorialv2.models.database import PublicationEvent
+from zds.tutorialv2.publication_metrics import PublicationMetrics
+from zds.tutorialv2.publication_utils import PublicatorRegistry
+from zds.tutorialv2.publication_wakeup import WakeUpChannel, get_wakeup_dir
+
+logger = logging.getLogger(__name__)
+
+
+def get_worker_id():
+    """
+    :return: an identifier of the current process, unique among the hosts sharing the queue
+    :rtype: str
+    """
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def run_publicator(publication_event):
+    """
+    Build the export requested by ``publication_event`` (in a worker thread). Its metrics are stored (as JSON) in
+    ``publication_event.metrics``, even if it fails, the runner saves them with the result.
+
+    :type publication_event: zds.tutorialv2.models.database.PublicationEvent
+    :raise Exception: any error of the publicator
+    """
+    metrics = PublicationMetrics()
+    try:
+        content = publication_event.published_object
+        publicator = PublicatorRegistry.get(publication_event.format_requested)
+
+        extra_content_dir = content.get_extra_contents_directory()
+        building_extra_content_path = Path(str(Path(extra_content_dir).parent) + '__building',
+                                           'extra_contents', content.content_public_slug)
+        building_extra_content_path.mkdir(parents=True, exist_ok=True)
+        base_name = str(building_extra_content_path)
+        with metrics.activate():
+            publicator.publish(base_name + '.md', base_name)
+    finally:
+        publication_event.metrics = metrics.dumps()
+        if threading.current_thread() is not threading.main_thread():
+            # otherwise, each worker thread would keep its own database connection open
+            connection.close()
+
+
+class PublicationJobRunner:
+    """
+    Run the exports requested through ``PublicationEvent`` (see ``WatchdogFilePublicator``).
+
+    A job is claimed by setting its state to ``RUNNING`` and its ``worker`` with a conditional ``UPDATE`` (the
+    candidates being locked with ``SELECT … FOR UPDATE SKIP LOCKED`` where the database supports it), so several
+    runners, on several hosts, can share the queue. While a job runs, its runner refreshes its ``heartbeat``: the
+    jobs of a runner which stopped doing so are requested again. A failed job is retried after an exponential
+    backoff, up to ``max_attempts`` times, and then marked as ``FAILURE``.
+
+    Only the main thread uses the database, the exports themselves are built in a pool of ``workers`` threads.
+
+    If ``wakeup`` is set, the runner waits for new jobs on a ``WakeUpChannel``, notified when exports are requested
+    on the same host and when a job ends, the queue being still scanned every ``poll_interval`` seconds.
+    """
+
+    def __init__(self, workers=2, format_concurrency=None, poll_interval=10, stale_after=120, max_attempts=3,
+                 retry_backoff=30, retry_backoff_max=3600, worker_id=None, wakeup=False):
+        """
+        :param workers: number of exports built at the same time
+        :param format_concurrency: maximum number of exports built at the same time, by format
+        :type format_concurrency: dict
+        :param poll_interval: in seconds, delay between two scans of the queue
+        :param stale_after: in seconds, delay without heartbeat after which a running job is requested again
+        :param max_attempts: number of attempts before a job is marked as failed
+        :param retry_backoff: in seconds, delay before the first retry, doubled for each new attempt
+        :param retry_backoff_max: in seconds, maximum delay before a retry
+        :param worker_id: identifier of the runner, see ``get_worker_id``
+        :param wakeup: whether the runner is woken up when exports are requested, see ``notify_watchdogs``
+        """
+        self.workers = max(1, workers)
+        self.format_concurrency = dict(format_concurrency or {})
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.worker_id = worker_id or get_worker_id()
+        self.wakeup = wakeup
+        self.wakeup_channel = None
+        self.running = {}  # future -> publication event
+
+    @classmethod
+    def from_settings(cls, **kwargs):
+        """
+        :param kwargs: override the values of ``ZDS_APP['content']['watchdog']`` (``None`` values are ignored)
+        """
+        config = dict(settings.ZDS_APP['content'].get('watchdog', {}))
+        config.update({key: value for key, value in kwargs.items() if value is not None})
+        return cls(**config)
+
+    def get_retry_delay(self, attempts):
+        """
+        :param attempts: number of attempts already made
+        :return: the delay before the next attempt
+        :rtype: datetime.timedelta
+        """
+        return timedelta(seconds=min(self.retry_backoff * 2 ** (max(attempts, 1) - 1), self.retry_backoff_max))
+
+    def _get_saturated_formats(self, running_formats):
+        return [format_requested for format_requested, limit in self.format_concurrency.items()
+                if running_formats[format_requested] >= limit]
+
+    def claim(self, limit):
+        """
+        Claim up to ``limit`` requested jobs, in the order of their request, without exceeding the concurrency
+        limit of their format.
+
+        :return: the claimed publication events
+        :rtype: list[zds.tutorialv2.models.database.PublicationEvent]
+        """
+        now = datetime.now()
+        running_formats = Counter(event.format_requested for event in self.running.values())
+        claimed = []
+        with transaction.atomic():
+            candidates = PublicationEvent.objects \
+                .filter(state_of_processing='REQUESTED') \
+                .filter(Q(retry_after__isnull=True) | Q(retry_after__lte=now)) \
+                .exclude(format_requested__in=self._get_saturated_formats(running_formats)) \
+                .order_by('date', 'pk')
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            # a few more candidates than needed, some of them may be of a saturated format
+            for pk, format_requested in candidates.values_list('pk', 'format_requested')[:limit * 4]:
+                if len(claimed) >= limit:
+                    break
+                if format_requested in self._get_saturated_formats(running_formats):
+                    continue
+                # the state is checked again, in case another runner claimed the job in the meantime
+                updated = PublicationEvent.objects \
+                    .filter(pk=pk, state_of_processing='REQUESTED') \
+                    .update(state_of_processing='RUNNING', worker=self.worker_id, heartbeat=now, retry_after=None,
+                            attempts=F('attempts') + 1)
+                if updated:
+                    claimed.append(pk)
+                    running_formats[format_requested] += 1
+
+        return list(PublicationEvent.objects
+                    .select_related('published_object', 'published_object__content',
+                                    'published_object__content__image')
+                    .filter(pk__in=claimed)
+                    .order_by('date', 'pk'))
+
+    def beat(self):
+        """
+        Refresh the heartbeat of the running jobs of this runner.
+        """
+        if self.running:
+            PublicationEvent.objects \
+                .filter(pk__in=[event.pk for event in self.running.values()], worker=self.worker_id) \
+                .update(heartbeat=datetime.now())
+
+    def reclaim_stale_jobs(self):
+        """
+        Request again (or mark as failed) the running jobs whose runner did not refresh the heartbeat for
+        ``stale_after`` seconds, probably because it died.
+        """
+        limit = datetime.now() - timedelta(seconds=self.stale_after)
+        stale_jobs = PublicationEvent.objects \
+            .filter(state_of_processing='RUNNING') \
+            .filter(Q(heartbeat__isnull=True) | Q(heartbeat__lt=limit))
+        for publication_event in stale_jobs:
+            logger.warning('export %s of %s was left by %s', publication_event.format_requested,
+                           publication_event.published_object_id, publication_event.worker)
+            self.fail(publication_event, 'worker {} stopped'.format(publication_event.worker))
+
+    def fail(self, publication_event, error, **changes):
+        """
+        Schedule a new attempt of the job, or mark it as failed if it was attempted ``max_attempts`` times.
+
+        :type publication_event: zds.tutorialv2.models.database.PublicationEvent
+        :param error: the reason of the failure
+        :param changes: other fields to update
+        """
+        if publication_event.attempts < self.max_attempts:
+            changes.update({
+                'state_of_processing': 'REQUESTED',
+                'retry_after': datetime.now() + self.get_retry_delay(publication_event.attempts),
+                'worker': None,
+                'heartbeat': None,
+            })
+        else:
+            changes['state_of_processing'] = 'FAILURE'
+        return self._finish(publication_event, error=str(error), **changes)
+
+    def _finish(self, publication_event, **changes):
+        updated = PublicationEvent.objects \
+            .filter(pk=publication_event.pk, state_of_processing='RUNNING', worker=publication_event.worker) \
+            .update(**changes)
+        if not updated:
+            logger.warning('export %s of %s was claimed again by another worker', publication_event.format_requested,
+                           publication_event.published_object_id)
+        return bool(updated)
+
+    def collect(self):
+        """
+        Record the result of the finished jobs.
+        """
+        for future in [future for future in self.running if future.done()]:
+            publication_event = self.running.pop(future)
+            error = future.exception()
+            if error is None:
+                self._finish(publication_event, state_of_processing='SUCCESS', error=None,
+                             metrics=publication_event.metrics)
+            else:
+                logger.error('error while producing %s of %s', publication_event.format_requested,
+                             publication_event.published_object.title(), exc_info=error)
+                self.fail(publication_event, '{}: {}'.format(type(error).__name__, error),
+                          metrics=publication_event.metrics)
+
+    def run_once(self, executor):
+        """
+        Record the finished jobs, then start new ones if some workers are free.
+
+        :type executor: concurrent.futures.Executor
+        """
+        self.collect()
+        self.beat()
+        self.reclaim_stale_jobs()
+        free_workers = self.workers - len(self.running)
+        if free_workers > 0:
+            for publication_event in self.claim(free_workers):
+                logger.info('Export %s -- format=%s', publication_event.published_object.title(),
+                            publication_event.format_requested)
+                future = executor.submit(run_publicator, publication_event)
+                self.running[future] = publication_event
+                future.add_done_callback(self._wake_up)
+
+    def _wake_up(self, future):
+        if self.wakeup_channel is not None:
+            self.wakeup_channel.wake_up()
+
+    def wait(self):
+        """
+        Wait for a job to finish, for new jobs to be requested or for the next scan of the queue.
+        """
+        if self.wakeup_channel is not None:
+            self.wakeup_channel.wait(self.poll_interval)
+        elif self.running:
+            wait(list(self.running), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+        else:
+            time.sleep(self.poll_interval)
+
+    def run(self):
+        wakeup_dir = get_wakeup_dir() if self.wakeup else None
+        if wakeup_dir is not None:
+            self.wakeup_channel = WakeUpChannel(wakeup_dir, self.worker_id).open()
+        try:
+            with ThreadPoolExecutor(self.workers) as executor:
+                try:
+                    while True:
+                        try:
+                            self.run_once(executor)
+                        except Exception:
+                            logger.exception('error while scanning the publication queue')
+                            # the connection may be broken, a new one is opened for the next scan
+                            connection.close()
+                        self.wait()
+                except KeyboardInterrupt:
+                    executor.shutdown(wait=False)
+        finally:
+            if self.wakeup_channel is not None:
+                self.wakeup_channel.close()
+                self.wakeup_channel = None
@@ -0,0 +1,188 @@
+import contextlib
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from zds import json_handler
+
+try:
+    import resource
+except ImportError:  # not on Unix
+    resource = None
+
+_current = threading.local()
+
+
+def get_peak_memory():
+    """
+    :return: the peak resident memory of the current process, in KiB (``None`` if unknown). It is a high-water
+        mark: the peak of the whole life of the process.
+    :rtype: int
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class PublicationMetrics:
+    """
+    Time spent in each stage of a publication or an export, and peak memory of the process and of its children
+    (``lualatex``...).
+
+    The stages are recorded by ``record_stage`` in the thread where the metrics are active (see ``activate``),
+    so the code of the publication does not need to pass them around.
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.children_peak_memory = None
+        self.start = time.monotonic()
+        self.duration = None
+        self.initial_peak_memory = get_peak_memory()
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Make these metrics the ones of the current thread while the context is active, and stop the clock when
+        it ends.
+        """
+        previous = getattr(_current, 'metrics', None)
+        _current.metrics = self
+        try:
+            yield self
+        finally:
+            _current.metrics = previous
+            self.duration = time.monotonic() - self.start
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Add the time spent in the context to the stage ``name``.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + time.monotonic() - start
+
+    def add_child(self, peak_memory):
+        """
+        :param peak_memory: peak resident memory of a child process, in KiB
+        """
+        self.children_peak_memory = max(self.children_peak_memory or 0, peak_memory)
+
+    def as_dict(self):
+        """
+        :return: the metrics, the durations being in seconds and the memory in KiB
+        :rtype: dict
+        """
+        duration = self.duration if self.duration is not None else time.monotonic() - self.start
+        peak_memory = get_peak_memory()
+        return {
+            'duration': round(duration, 3),
+            'stages': OrderedDict((name, round(seconds, 3)) for name, seconds in self.stages.items()),
+            'peak_memory': peak_memory,
+            # if the peak was reached before, the publication did not use more memory than what it was
+            'peak_memory_reached': peak_memory is not None and peak_memory > self.initial_peak_memory,
+            'children_peak_memory': self.children_peak_memory,
+        }
+
+    def dumps(self):
+        return json_handler.dumps(self.as_dict())
+
+
+def get_current_metrics():
+    """
+    :return: the metrics active in the current thread, if any
+    :rtype: PublicationMetrics
+    """
+    return getattr(_current, 'metrics', None)
+
+
+@contextlib.contextmanager
+def record_stage(name):
+    """
+    Add the time spent in the context to the stage ``name`` of the metrics active in the current thread, if any.
+    """
+    metrics = get_current_metrics()
+    if metrics is None:
+        yield
+    else:
+        with metrics.stage(name):
+            yield
+
+
+def load_metrics(text):
+    """
+    :param text: metrics, as stored by ``PublicationMetrics.dumps``
+    :return: the metrics, or an empty dictionary if there are none
+    :rtype: dict
+    """
+    if not text:
+        return {}
+    try:
+        return json_handler.loads(text)
+    except ValueError:
+        return {}
+
+
+def format_memory(kib):
+    """
+    :param kib: an amount of memory, in KiB
+    :rtype: str
+    """
+    if kib is None:
+        return '-'
+    return '{:.0f} MiB'.format(kib / 1024)
+
+
+def format_metrics(metrics):
+    """
+    :param metrics: metrics, as returned by ``load_metrics``
+    :return: the stages, from the longest one, and the peak memories, in one line
+    :rtype: str
+    """
+    if not metrics:
+        return '-'
+    stages = sorted(metrics.get('stages', {}).items(), key=lambda stage: stage[1], reverse=True)
+    text = ', '.join('{} {:.2f}s'.format(name, seconds) for name, seconds in stages) or '-'
+    text += ' ; mémoire {}'.format(format_memory(metrics.get('peak_memory')))
+    if metrics.get('children_peak_memory') is not None:
+        text += ' (processus fils {})'.format(format_memory(metrics['children_peak_memory']))
+    return text
+
+
+def run_command(command, cwd, timeout=None):
+    """
+    Run a shell command whose output is not needed, and record its peak memory in the active metrics.
+
+    :param command: the shell command
+    :param cwd: its working directory
+    :param timeout: in seconds, after which the command is killed
+    :return: its exit code
+    :rtype: int
+    :raise subprocess.TimeoutExpired: if it ran longer than ``timeout``
+    """
+    process = subprocess.Popen(command, shell=True, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not hasattr(os, 'wait4'):
+        return process.wait(timeout)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    delay = 0.01
+    while True:
+        # unlike ``Popen.wait``, ``wait4`` gives the resources used by the process (and the ones it waited for)
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        if deadline is not None and time.monotonic() > deadline:
+            process.kill()
+            process.wait()
+            raise subprocess.TimeoutExpired(command, timeout)
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    metrics = get_current_metrics()
+    if metrics is not None:
+        metrics.add_child(usage.ru_maxrss)
+    return process.returncode
@@ -1,30 +1,50 @@
 import contextlib
 import copy
 import logging
+import multiprocessing
 import os
 import shutil
+import signal
 import subprocess
-import zipfile
+import time
+from collections import namedtuple
 from datetime import datetime
 from os import makedirs, path
 from pathlib import Path
 
 import requests
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, transaction
 from django.template.loader import render_to_string
 from django.utils import translation
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
+from zds import json_handler
 from zds.notification import signals
+from zds.tutorialv2.asset_staging import AssetStager, referenced_in
 from zds.tutorialv2.epub_utils import build_ebook
+from zds.tutorialv2.latex_build import LatexBuildCache, get_auxiliary_hashes
 from zds.tutorialv2.models.database import ContentReaction, PublishedContent, PublicationEvent
-from zds.tutorialv2.publish_container import publish_container
+from zds.tutorialv2.public_versions import switch_public_version, remove_public_version
+from zds.tutorialv2.publication_metrics import PublicationMetrics, record_stage, run_command, get_current_metrics
+from zds.tutorialv2.publication_wakeup import notify_watchdogs
+from zds.tutorialv2.publish_container import publish_container, render_container_fragments
 from zds.tutorialv2.signals import content_unpublished
+from zds.tutorialv2.utils import get_blob_shas, normalize_blob_path, iter_version_zip, get_content_from_json
+from zds.tutorialv2.version_cache import public_versions, pickle_public_versions, dump_public_tree
 from zds.utils.forums import send_post, lock_topic
 from zds.utils.templatetags.emarkdown import render_markdown, MD_PARSING_ERROR
 from zds.utils.templatetags.smileys_def import SMILEYS_BASE_PATH, LICENSES_BASE_PATH
 
 logger = logging.getLogger(__name__)
+
+# HTML of the texts of a published version, by git blob SHA, see ``publish_content``
+RENDERED_FRAGMENTS_FILE = 'rendered_fragments.json'
+# the same for the EPUB, see ``build_ebook``
+EPUB_RENDERED_FRAGMENTS_FILE = 'rendered_fragments_epub.json'
+# ``format_requested`` of the events recording the publications themselves (see ``publish_content``)
+PUBLICATION_EVENT_FORMAT = 'publication'
+
 licences = {
     'by-nc-nd': 'by-nc-nd.svg',
     'by-nc-sa': 'by-nc-sa.svg',
@@ -43,7 +63,7 @@ def notify_update(db_object, is_update, is_major):
         signals.new_content.send(sender=db_object.__class__, instance=db_object, by_email=False)
 
 
-def publish_content(db_object, versioned, is_major_update=True):
+def publish_content(db_object, versioned, is_major_update=True, full_rebuild=False):
     """
     Publish a given content.
 
@@ -51,18 +71,34 @@ def publish_content(db_object, versioned, is_major_update=True):
         create a manifest.json without the introduction and conclusion if not needed. Also remove the 'text' field
         of extracts.
 
+    Unless ``full_rebuild`` is set (or ``ZDS_APP['content']['incremental_publication']`` is ``False``), the texts
+    which did not change since the last publication (same git blob) are not rendered again: their HTML is read
+    from the ``RENDERED_FRAGMENTS_FILE`` of the published version.
+
     :param db_object: Database representation of the content
     :type db_object: zds.tutorialv2.models.database.PublishableContent
     :param versioned: version of the content to publish
     :type versioned: zds.tutorialv2.models.versioned.VersionedContent
     :param is_major_update: if set to `True`, will update the publication date
     :type is_major_update: bool
+    :param full_rebuild: if set to `True`, render every text again
+    :type full_rebuild: bool
     :raise FailureDuringPublication: if something goes wrong
     :return: the published representation
     :rtype: zds.tutorialv2.models.database.PublishedContent
     """
+    metrics = PublicationMetrics()
+    with metrics.activate():
+        public_version = _publish_content(db_object, versioned, is_major_update, full_rebuild)
+    # the time spent in each stage is recorded as a publication event (see ``PublicationMetrics``)
+    logger.info('%s published in %.1fs: %s', versioned.slug, metrics.duration, metrics.as_dict())
+    PublicationEvent.objects.create(state_of_processing='SUCCESS', published_object=public_version,
+                                    format_requested=PUBLICATION_EVENT_FORMAT, metrics=metrics.dumps())
+    return public_version
 
-    from zds.tutorialv2.models.database import PublishedContent
+
+def _publish_content(db_object, versioned, is_major_update, full_rebuild):
+    from zds.tutorialv2.models.database import PublishedContent, PublishableContent
 
     if is_major_update:
         versioned.pubdate = datetime.now()
@@ -74,9 +110,30 @@ def publish_content(db_object, versioned, is_major_update=True):
         shutil.rmtree(tmp_path)  # remove previous attempt, if any
 
     # render HTML:
-    altered_version = copy.deepcopy(versioned)
-    publish_container(db_object, tmp_path, altered_version)
-    altered_version.dump_json(path.join(tmp_path, 'manifest.json'))
+    with record_stage('git load'):
+        blob_shas = get_blob_shas(versioned.repository, versioned.current_version)
+        # all the texts are read for the HTML and the markdown file, the copy keeps them
+        versioned.load_texts(blob_shas)
+    with record_stage('deepcopy'):
+        altered_version = copy.deepcopy(versioned)
+    markdown_options = {'disable_jsfiddle': not db_object.js_support}
+    html_by_blob_sha = {}
+    if not full_rebuild and settings.ZDS_APP['content']['incremental_publication']:
+        html_by_blob_sha = load_rendered_fragments(db_object.public_version, markdown_options)
+    rendered_fragments = render_container_fragments(altered_version, markdown_options, blob_shas, html_by_blob_sha)
+    with record_stage('html render'):
+        publish_container(db_object, tmp_path, altered_version, markdown_options=markdown_options,
+                          rendered_fragments=rendered_fragments)
+    with record_stage('manifest dump'):
+        altered_version.dump_json(path.join(tmp_path, 'manifest.json'))
+        if pickle_public_versions():
+            public_tree = get_content_from_json(
+                json_handler.loads(altered_version.get_json()), versioned.current_version, versioned.slug, public=True,
+                max_title_len=PublishableContent._meta.get_field('title').max_length)
+            dump_public_tree(public_tree, tmp_path)
+        dump_rendered_fragments(tmp_path, markdown_options, blob_shas, rendered_fragments)
+        if not full_rebuild and settings.ZDS_APP['content']['incremental_publication']:
+            keep_rendered_fragments(db_object.public_version, tmp_path, EPUB_RENDERED_FRAGMENTS_FILE)
 
     # make room for 'extra contents'
     build_extra_contents_path = path.join(tmp_path, settings.ZDS_APP['content']['extra_contents_dirname'])
@@ -92,8 +149,10 @@ def publish_content(db_object, versioned, is_major_update=True):
     with contextlib.suppress(OSError):
         Path(Path(md_file_path).parent, 'images').mkdir()
     is_update = False
+    previous_prod_path = None
 
     if db_object.public_version:
+        previous_prod_path = db_object.public_version.get_prod_path()
         is_update, public_version = update_existing_publication(db_object, versioned)
     else:
         public_version = PublishedContent()
@@ -105,9 +164,9 @@ def publish_content(db_object, versioned, is_major_update=True):
     public_version.content = db_object
     public_version.must_reindex = True
     public_version.save()
-    with contextlib.suppress(FileExistsError):
-        makedirs(public_version.get_extra_contents_directory())
-    PublicatorRegistry.get('md').publish(md_file_path, base_name, versioned=versioned, cur_language=cur_language)
+    # nothing is written in the public path before the switch: it may be the version currently online
+    with record_stage('markdown flattening'):
+        PublicatorRegistry.get('md').publish(md_file_path, base_name, versioned=versioned, cur_language=cur_language)
     public_version.char_count = public_version.get_char_count(md_file_path)
     if is_major_update or not is_update:
         public_version.publication_date = datetime.now()
@@ -115,8 +174,8 @@ def publish_content(db_object, versioned, is_major_update=True):
         public_version.update_date = datetime.now()
     public_version.sha_public = versioned.current_version
     public_version.save()
-    with contextlib.suppress(OSError):
-        make_zip_file(public_version)
+    with contextlib.suppress(OSError), record_stage('zip'):
+        make_zip_file(public_version, build_extra_contents_path)
 
     public_version.save(
         update_fields=['char_count', 'publication_date', 'update_date', 'sha_public'])
@@ -125,26 +184,105 @@ def publish_content(db_object, versioned, is_major_update=True):
     for author in db_object.authors.all():
         public_version.authors.add(author)
 
-    # this puts the manifest.json and base json file on the prod path.
-    shutil.rmtree(public_version.get_prod_path(), ignore_errors=True)
-    shutil.copytree(tmp_path, public_version.get_prod_path())
+    with record_stage('copy to prod'):
+        # this puts the manifest.json and base json file on the prod path, without copying them.
+        version_path = switch_public_version(
+            tmp_path, public_version.get_prod_path(),
+            '{:%Y%m%d%H%M%S%f}-{}'.format(datetime.now(), versioned.current_version[:12]))
+        public_versions.invalidate(lambda key: key[0] == db_object.pk)
+        if previous_prod_path is not None and previous_prod_path != public_version.get_prod_path():
+            # the slug changed: the old files are only removed once the new ones are online
+            remove_public_version(previous_prod_path)
+        # the other formats are built from the markdown file, in the building directory
+        makedirs(path.join(build_extra_contents_path, 'images'))
+        shutil.copy2(path.join(str(version_path), settings.ZDS_APP['content']['extra_contents_dirname'],
+                               path.basename(md_file_path)), md_file_path)
     if settings.ZDS_APP['content']['extra_content_generation_policy'] == 'SYNC':
         # ok, now we can really publish the thing!
-        generate_external_content(base_name, build_extra_contents_path, md_file_path)
+        reports = generate_external_content(base_name, build_extra_contents_path, md_file_path)
+        metrics = get_current_metrics()
+        for report in reports:
+            if metrics is not None:
+                metrics.stages[report.format] = metrics.stages.get(report.format, 0) + report.duration
+            PublicationEvent.objects.create(state_of_processing='SUCCESS' if report.success else 'FAILURE',
+                                            published_object=public_version, format_requested=report.format,
+                                            error=report.error, metrics=report.metrics)
     elif settings.ZDS_APP['content']['extra_content_generation_policy'] == 'WATCHDOG':
         PublicatorRegistry.get('watchdog').publish(md_file_path, base_name, silently_pass=False)
     db_object.sha_public = versioned.current_version
     return public_version
 
 
+def load_rendered_fragments(public_version, markdown_options, file_name=RENDERED_FRAGMENTS_FILE):
+    """
+    :param public_version: the published version, if any
+    :type public_version: zds.tutorialv2.models.database.PublishedContent
+    :param markdown_options: options of the renderings to reuse
+    :type markdown_options: dict
+    :param file_name: the file of the version containing the renderings
+    :return: the HTML of the texts of the published version, by git blob SHA, if they were rendered with the \
+    same options
+    :rtype: dict
+    """
+    if public_version is None:
+        return {}
+    try:
+        with open(path.join(public_version.get_prod_path(), file_name), encoding='utf-8') as f:
+            stored = json_handler.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    if stored.get('markdown_options') != markdown_options:
+        return {}
+    return stored.get('fragments', {})
+
+
+def dump_rendered_fragments(directory, markdown_options, blob_shas, rendered_fragments,
+                            file_name=RENDERED_FRAGMENTS_FILE):
+    """
+    Store the HTML of the texts of a version, by git blob SHA, so that the next publication can reuse it.
+    The file is replaced atomically, since it may be a hard link to the one of the previous version.
+
+    :param directory: the directory of the version
+    :param markdown_options: options used to render the texts
+    :type markdown_options: dict
+    :param blob_shas: SHA of the git blob of each file of the version
+    :type blob_shas: dict
+    :param rendered_fragments: texts of the version, as returned by ``render_container_fragments``
+    :type rendered_fragments: dict
+    :param file_name: the file of the version containing the renderings
+    """
+    fragments = {}
+    for text_path, (text, html) in rendered_fragments.items():
+        blob_sha = blob_shas.get(normalize_blob_path(text_path))
+        if blob_sha is not None:
+            fragments[blob_sha] = str(html)
+    file_path = path.join(directory, file_name)
+    with open(file_path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(json_handler.dumps({'markdown_options': markdown_options, 'fragments': fragments}))
+    os.replace(file_path + '.tmp', file_path)
+
+
+def keep_rendered_fragments(public_version, directory, file_name):
+    """
+    Hard link the renderings stored by the published version in the directory of the new one, if they are made
+    after the publication (like the ones of the EPUB, see ``build_ebook``).
+
+    :param public_version: the published version, if any
+    :type public_version: zds.tutorialv2.models.database.PublishedContent
+    :param directory: the directory of the new version
+    :param file_name: the file of the version containing the renderings
+    """
+    if public_version is None:
+        return
+    with contextlib.suppress(OSError):
+        os.link(path.join(public_version.get_prod_path(), file_name), path.join(directory, file_name))
+
+
 def update_existing_publication(db_object, versioned):
     public_version = db_object.public_version
-    # the content has been published in the past, so clean up old files!
-    old_path = public_version.get_prod_path()
-    logging.getLogger(__name__).debug('erase ' + old_path)
-    shutil.rmtree(old_path)
     # if the slug has changed, create a new object instead of reusing the old one
     # this allows us to handle permanent redirection so that SEO is not impacted.
+    # In both cases, the old files stay public until the new version is online (see ``switch_public_version``).
     if versioned.slug != public_version.content_public_slug:
         public_version.must_redirect = True  # set redirection
         public_version.save(update_fields=['must_redirect'])
@@ -167,27 +305,128 @@ def write_md_file(md_file_path, parsed_with_local_images, versioned):
                                              'à télécharger, vérifiez le code markdown'))
 
 
-def generate_external_content(base_name, extra_contents_path, md_file_path, overload_settings=False, excluded=None):
+ExtraContentReport = namedtuple('ExtraContentReport', ['format', 'success', 'duration', 'error', 'metrics'],
+                                defaults=(None,))
+"""
+Result of the generation of one format by ``generate_external_content``, ``duration`` is in seconds and
+``metrics`` are the ones of ``PublicationMetrics.dumps`` (if the generation did not time out).
+"""
+
+
+def generate_external_content(base_name, extra_contents_path, md_file_path, overload_settings=False, excluded=None,
+                              parallel=None):
     """
     generate all static file that allow offline access to content
 
+    The formats only share the (read-only) flat markdown file, so they can be generated at the same time, each
+    in its own process which is stopped after ``ZDS_APP['content']['extra_content_generation_timeouts']``.
+
     :param base_name: base nae of file (without extension)
     :param extra_contents_path: internal directory where all files will be pushed
     :param md_file_path: bundled markdown file path
     :param overload_settings: this option force the function to generate all registered formats even when settings \
     ask for PDF not to be published
     :param excluded: list of excluded format, None if no exclusion
+    :param parallel: generate the formats in parallel, defaults to \
+    ``ZDS_APP['content']['extra_content_generation_parallel']``. They are generated one after the other inside a \
+    transaction, since the database connection is closed before the processes are started.
+    :return: the report of the generation of each format
+    :rtype: list[ExtraContentReport]
     """
     excluded = excluded or ['watchdog']
     excluded.append('md')
     if not settings.ZDS_APP['content']['build_pdf_when_published'] and not overload_settings:
         excluded.append('pdf')
-    for publicator_name, publicator in PublicatorRegistry.get_all_registered(excluded):
-        try:
-            publicator.publish(md_file_path, base_name, change_dir=extra_contents_path)
-        except (FailureDuringPublication, OSError):
-            logging.getLogger(__name__).exception('Could not publish %s format from %s base.',
-                                                  publicator_name, md_file_path)
+    if parallel is None:
+        parallel = settings.ZDS_APP['content']['extra_content_generation_parallel']
+    publicator_names = [name for name, _ in PublicatorRegistry.get_all_registered(excluded)]
+
+    # closing the connection would silently drop the transaction of the caller
+    in_transaction = any(connection.in_atomic_block for connection in connections.all())
+    if parallel and len(publicator_names) > 1 and not in_transaction:
+        reports = _generate_in_processes(publicator_names, md_file_path, base_name, extra_contents_path)
+    else:
+        reports = []
+        for publicator_name in publicator_names:
+            start = time.monotonic()
+            metrics = PublicationMetrics()
+            try:
+                with metrics.activate():
+                    PublicatorRegistry.get(publicator_name).publish(md_file_path, base_name,
+                                                                    change_dir=extra_contents_path)
+                reports.append(ExtraContentReport(publicator_name, True, time.monotonic() - start, None,
+                                                  metrics.dumps()))
+            except (FailureDuringPublication, OSError) as e:
+                logger.exception('Could not publish %s format from %s base.', publicator_name, md_file_path)
+                reports.append(ExtraContentReport(publicator_name, False, time.monotonic() - start, str(e),
+                                                  metrics.dumps()))
+
+    for report in reports:
+        if report.success:
+            logger.info('%s format of %s generated in %.1fs', report.format, md_file_path, report.duration)
+        else:
+            logger.warning('%s format of %s failed after %.1fs: %s', report.format, md_file_path, report.duration,
+                           report.error)
+    return reports
+
+
+def _publish_in_process(publicator_name, md_file_path, base_name, extra_contents_path, result_pipe):
+    # the commands started by the publicator (``lualatex``...) are in the process group, which is killed on timeout
+    os.setpgrp()
+    start = time.monotonic()
+    metrics = PublicationMetrics()
+    try:
+        with metrics.activate():
+            PublicatorRegistry.get(publicator_name).publish(md_file_path, base_name, change_dir=extra_contents_path)
+        result_pipe.send((True, time.monotonic() - start, None, metrics.dumps()))
+    except Exception as e:
+        logger.exception('Could not publish %s format from %s base.', publicator_name, md_file_path)
+        result_pipe.send((False, time.monotonic() - start, str(e) or e.__class__.__name__, metrics.dumps()))
+    finally:
+        result_pipe.close()
+
+
+def _generate_in_processes(publicator_names, md_file_path, base_name, extra_contents_path):
+    """
+    Run each publicator in its own process, and stop those which are still running after their timeout.
+
+    :return: the report of each format, in the order of ``publicator_names``
+    :rtype: list[ExtraContentReport]
+    """
+    timeouts = settings.ZDS_APP['content']['extra_content_generation_timeouts']
+    # publicators are found in the registry of the forked process, and they must not share the database connection.
+    # The locks and executors of the markdown rendering are replaced in the child, see their ``register_at_fork``
+    context = multiprocessing.get_context('fork')
+    connections.close_all()
+
+    running = []
+    for publicator_name in publicator_names:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_publish_in_process, name='publicator-{}'.format(publicator_name),
+                                  args=(publicator_name, md_file_path, base_name, extra_contents_path, sender))
+        process.start()
+        sender.close()
+        running.append((publicator_name, process, receiver, time.monotonic()))
+
+    reports = []
+    for publicator_name, process, receiver, start in running:
+        timeout = timeouts.get(publicator_name, timeouts['default'])
+        process.join(max(0, start + timeout - time.monotonic()))
+        if process.is_alive():
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(process.pid, signal.SIGKILL)
+            process.kill()
+            process.join()
+            reports.append(ExtraContentReport(publicator_name, False, time.monotonic() - start,
+                                              'timeout after {}s'.format(timeout)))
+        elif receiver.poll():
+            success, duration, error, metrics = receiver.recv()
+            reports.append(ExtraContentReport(publicator_name, success, duration, error, metrics))
+        else:
+            reports.append(ExtraContentReport(publicator_name, False, time.monotonic() - start,
+                                              'exit code {}'.format(process.exitcode)))
+        receiver.close()
+    return reports
 
 
 class PublicatorRegistry:
@@ -288,8 +527,6 @@ class MarkdownPublicator(Publicator):
         finally:
             translation.activate(cur_language)
         write_md_file(md_file_path, parsed, versioned)
-        if '__building' in md_file_path:
-            shutil.copy2(md_file_path, md_file_path.replace('__building', ''))
 
 
 def _read_flat_markdown(md_file_path):
@@ -355,12 +592,9 @@ class ZMarkdownRebberLatexPublicator(Publicator):
             .load_version(sha=published_content_entity.sha_public)
         base_directory = Path(base_name).parent
         image_dir = base_directory / 'images'
-        with contextlib.suppress(FileExistsError):
-            image_dir.mkdir(parents=True)
-        if (settings.MEDIA_ROOT / 'galleries' / str(gallery_pk)).exists():
-            for image in (settings.MEDIA_ROOT / 'galleries' / str(gallery_pk)).iterdir():
-                with contextlib.suppress(OSError):
-                    shutil.copy2(str(image.absolute()), str(image_dir))
+        # the images of the previous build must not end up in this one
+        shutil.rmtree(str(image_dir), ignore_errors=True)
+        image_dir.mkdir(parents=True)
         content_type = depth_to_size_map[public_versionned_source.get_tree_level()]
         if self.latex_classes:
             content_type += ', ' + self.latex_classes
@@ -385,23 +619,28 @@ class ZMarkdownRebberLatexPublicator(Publicator):
             replacement_image_url += '/'
         elif replacement_image_url.endswith('/') and not settings.MEDIA_URL.endswith('/'):
             replacement_image_url = replacement_image_url[:-1]
-        content, __, messages = render_markdown(
-            md_flat_content,
-            output_format='texfile',
-            # latex template arguments
-            content_type=content_type,
-            title=title,
-            authors=authors,
-            license=licence,
-            license_directory=str(LICENSES_BASE_PATH),
-            license_logo=licence_logo,
-            license_url=licence_url,
-            smileys_directory=str(SMILEYS_BASE_PATH / 'svg'),
-            images_download_dir=str(base_directory / 'images'),
-            local_url_to_local_path=[settings.MEDIA_URL, replacement_image_url]
-        )
+        with record_stage('latex render'):
+            content, __, messages = render_markdown(
+                md_flat_content,
+                output_format='texfile',
+                # latex template arguments
+                content_type=content_type,
+                title=title,
+                authors=authors,
+                license=licence,
+                license_directory=str(LICENSES_BASE_PATH),
+                license_logo=licence_logo,
+                license_url=licence_url,
+                smileys_directory=str(SMILEYS_BASE_PATH / 'svg'),
+                images_download_dir=str(base_directory / 'images'),
+                local_url_to_local_path=[settings.MEDIA_URL, replacement_image_url]
+            )
         if content == '' and messages:
             raise FailureDuringPublication('Markdown was not parsed due to {}'.format(messages))
+        # staged after the rendering, so that the images downloaded by zmarkdown cannot overwrite (through the
+        # links) the ones of the gallery
+        AssetStager().stage_directory(settings.MEDIA_ROOT / 'galleries' / str(gallery_pk), image_dir,
+                                      keep=referenced_in(md_flat_content), overwrite=False)
         zmd_class_dir_path = Path(settings.ZDS_APP['content']['latex_template_repo'])
         if zmd_class_dir_path.exists() and zmd_class_dir_path.is_dir():
             with contextlib.suppress(FileExistsError):
@@ -418,11 +657,22 @@ class ZMarkdownRebberLatexPublicator(Publicator):
         with open(latex_file_path, mode='w', encoding='utf-8') as latex_file:
             latex_file.write(content)
 
+        build_cache = LatexBuildCache.from_settings()
+        build_key = None
+        if build_cache.enabled:
+            build_key = build_cache.get_key(latex_file_path, self.extension, [
+                image_dir,
+                base_directory / 'default_logo.png',
+                zmd_class_dir_path / 'zmdocument.cls',
+                zmd_class_dir_path / 'utf8.lua',
+            ])
         try:
-            self.full_tex_compiler_call(latex_file_path, draftmode='-draftmode')
-            self.full_tex_compiler_call(latex_file_path, draftmode='-draftmode')
-            self.make_glossary(base_name.split('/')[-1], latex_file_path)
-            self.full_tex_compiler_call(latex_file_path)
+            if build_cache.get(build_key, self.extension, pdf_file_path):
+                logger.info('%s did not change, reusing the previous build', latex_file_path)
+            else:
+                with record_stage('lualatex'):
+                    self.compile(latex_file_path, pdf_file_path)
+                build_cache.put(build_key, self.extension, pdf_file_path)
         except FailureDuringPublication:
             logging.getLogger(self.__class__.__name__).exception('could not publish %s', base_name + self.extension)
         else:
@@ -431,6 +681,41 @@ class ZMarkdownRebberLatexPublicator(Publicator):
             logging.info('published latex=%s, pdf=%s', published_content_entity.has_type('tex'),
                          published_content_entity.has_type(self.doc_type))
 
+    def compile(self, latex_file_path, pdf_file_path):
+        """
+        Run lualatex until the auxiliary files (table of contents, references, glossary...) do not change
+        anymore, so that the references of the document are right, and at most
+        ``ZDS_APP['content']['latex_max_passes']`` times. Glossaries are made after the first pass.
+
+        :return: the number of passes
+        :rtype: int
+        :raise FailureDuringPublication: if a pass failed
+        """
+        # a failed build must not be hidden by the previous PDF
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(pdf_file_path)
+        max_passes = max(1, settings.ZDS_APP['content'].get('latex_max_passes', 4))
+        previous_hashes = get_auxiliary_hashes(latex_file_path)
+        latex_pass = 0
+        draftmode = ''
+        while latex_pass < max_passes:
+            latex_pass += 1
+            # without the auxiliary files of a previous build, the first pass cannot produce the final document
+            draftmode = '-draftmode' if not previous_hashes else ''
+            self.full_tex_compiler_call(latex_file_path, draftmode=draftmode)
+            if latex_pass == 1:
+                self.make_glossary(path.splitext(path.basename(latex_file_path))[0], latex_file_path)
+            hashes = get_auxiliary_hashes(latex_file_path)
+            if hashes == previous_hashes and not draftmode:
+                logger.debug('%s converged after %d passes', latex_file_path, latex_pass)
+                return latex_pass
+            previous_hashes = hashes
+        if draftmode:
+            latex_pass += 1
+            self.full_tex_compiler_call(latex_file_path)
+        logger.warning('%s did not converge after %d passes', latex_file_path, latex_pass)
+        return latex_pass
+
     def full_tex_compiler_call(self, latex_file, draftmode: str = ''):
         success_flag = self.tex_compiler(latex_file, draftmode)
         if not success_flag:
@@ -443,11 +728,9 @@ class ZMarkdownRebberLatexPublicator(Publicator):
 
     def tex_compiler(self, texfile, draftmode: str = ''):
         command = 'lualatex -shell-escape -interaction=nonstopmode {} {}'.format(draftmode, texfile)
-        command_process = subprocess.Popen(command,
-                                           shell=True, cwd=path.dirname(texfile),
-                                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         # let's put 10 min of timeout because we do not generate latex everyday
-        command_process.communicate(timeout=600)
+        # (the output is not needed, the errors are read in the log file)
+        run_command(command, cwd=path.dirname(texfile), timeout=600)
 
         with contextlib.suppress(ImportError):
             from raven import breadcrumbs
@@ -455,6 +738,9 @@ class ZMarkdownRebberLatexPublicator(Publicator):
                                data=command,
                                type='cmd')
 
+        if draftmode:
+            # no PDF is written in draft mode
+            return path.exists(path.splitext(texfile)[0] + '.aux')
         pdf_file_path = path.splitext(texfile)[0] + self.extension
         return path.exists(pdf_file_path)
 
@@ -509,23 +795,17 @@ class ZMarkdownEpubPublicator(Publicator):
     def publish(self, md_file_path, base_name, **kwargs):
         try:
             published_content_entity = self.get_published_content_entity(md_file_path)
-            epub_file_path = Path(base_name + '.epub')
+            # the archive is written directly in the public directory
+            epub_path = Path(published_content_entity.get_extra_contents_directory(), Path(base_name).name + '.epub')
+            epub_path.parent.mkdir(parents=True, exist_ok=True)
             logger.info('Start generating epub')
             build_ebook(published_content_entity,
                         path.dirname(md_file_path),
-                        epub_file_path)
+                        epub_path)
         except (IOError, OSError, requests.exceptions.HTTPError):
             raise FailureDuringPublication('Error while generating epub file.')
         else:
-            logger.info(epub_file_path)
-            epub_path = Path(published_content_entity.get_extra_contents_directory(), Path(epub_file_path.name))
-            if epub_path.exists():
-                os.remove(str(epub_path))
-            if not epub_path.parent.exists():
-                epub_path.parent.mkdir(parents=True)
-            logger.info('created %s. moving it to %s', epub_file_path,
-                        published_content_entity.get_extra_contents_directory())
-            shutil.move(str(epub_file_path), published_content_entity.get_extra_contents_directory())
+            logger.info('created %s', epub_path)
 
 
 @PublicatorRegistry.register('watchdog')
@@ -540,6 +820,8 @@ class WatchdogFilePublicator(Publicator):
         for requested_format in PublicatorRegistry.get_all_registered(['md', 'watchdog']):
             PublicationEvent.objects.create(state_of_processing='REQUESTED', published_object=published_content,
                                             format_requested=requested_format[0])
+        # the watchdogs must see the new jobs when they wake up
+        transaction.on_commit(notify_watchdogs)
 
 
 class FailureDuringPublication(Exception):
@@ -549,23 +831,23 @@ class FailureDuringPublication(Exception):
         super(FailureDuringPublication, self).__init__(*args, **kwargs)
 
 
-def make_zip_file(published_content):
+def make_zip_file(published_content, directory=None):
     """Create the zip archive extra content from the published content
 
     :param published_content: a PublishedContent object
-    :return:
+    :param directory: where to write the archive, the extra contents directory of the public version by default
+    :return: the path of the archive
     """
 
     publishable = published_content.content
     # update SHA so that archive gets updated too
     publishable.sha_public = publishable.sha_draft
-    file_path = path.join(published_content.get_extra_contents_directory(),
+    file_path = path.join(directory or published_content.get_extra_contents_directory(),
                           published_content.content_public_slug + '.zip')
-    zip_file = zipfile.ZipFile(file_path, 'w')
     versioned = publishable.load_version(None, True)
-    from zds.tutorialv2.views.contents import DownloadContent
-    DownloadContent.insert_into_zip(zip_file, versioned.repository.commit(versioned.current_version).tree)
-    zip_file.close()
+    with open(file_path, 'wb') as zip_file:
+        for chunk in iter_version_zip(versioned.repository, versioned.current_version):
+            zip_file.write(chunk)
     return file_path
 
 
@@ -610,8 +892,8 @@ def unpublish_content(db_object, moderator=None):
         # clean files
         old_path = public_version.get_prod_path()
         public_version.content.update(public_version=None, sha_public=None)
-        if path.exists(old_path):
-            shutil.rmtree(old_path)
+        remove_public_version(old_path)
+        public_versions.invalidate(lambda key: key[0] == db_object.pk)
         return True
 
     return False
@@ -0,0 +1,110 @@
+import logging
+import re
+import select
+import socket
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SOCKET_SUFFIX = '.sock'
+
+
+def get_wakeup_dir():
+    """
+    :return: the directory containing the wake-up sockets of the watchdogs of this host, or ``None`` if Unix
+        sockets are not available (the watchdogs then only poll the queue)
+    :rtype: pathlib.Path
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    return Path(settings.ZDS_APP['content']['extra_content_watchdog_dir'])
+
+
+class WakeUpChannel:
+    """
+    Unix datagram socket a watchdog blocks on between two scans of the export queue. Each watchdog of the host
+    binds its own socket in the wake-up directory, and ``notify_watchdogs`` sends a datagram to each of them.
+    """
+
+    def __init__(self, directory, name):
+        self.path = Path(directory, re.sub(r'[^\w.-]', '_', name) + SOCKET_SUFFIX)
+        self.socket = None
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.path.unlink()
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(str(self.path))
+        return self
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+            if self.path.exists():
+                self.path.unlink()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def wake_up(self):
+        """
+        Wake up the watchdog of this channel (from another thread of the same process).
+        """
+        _send_wakeup(self.path)
+
+    def wait(self, timeout):
+        """
+        Block until a notification is received, or for ``timeout`` seconds.
+
+        :return: whether a notification was received
+        :rtype: bool
+        """
+        readable, _, _ = select.select([self.socket], [], [], timeout)
+        if not readable:
+            return False
+        # several notifications are handled by a single scan of the queue
+        try:
+            while True:
+                self.socket.recv(16)
+        except BlockingIOError:
+            pass
+        return True
+
+
+def _send_wakeup(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as client:
+        client.setblocking(False)
+        try:
+            client.sendto(b'1', str(path))
+        except BlockingIOError:
+            # the queue of the socket is full: the watchdog already has notifications to handle
+            pass
+        except (ConnectionRefusedError, FileNotFoundError):
+            # nobody listens anymore, the watchdog died without removing its socket
+            logger.debug('removing the dead wake-up socket %s', path)
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        except OSError as e:
+            logger.warning('could not wake up the watchdog listening on %s: %s', path, e)
+
+
+def notify_watchdogs():
+    """
+    Wake up the watchdogs of this host so that they scan the export queue. The watchdogs of other hosts get the
+    new jobs at their next scan.
+    """
+    directory = get_wakeup_dir()
+    if directory is None or not directory.is_dir():
+        return
+    for path in directory.glob('*' + SOCKET_SUFFIX):
+        _send_wakeup(path)
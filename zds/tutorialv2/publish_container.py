@@ -3,17 +3,85 @@ from __future__ import unicode_literals
 
 import collections
 import contextlib
+import logging
 from os import path, makedirs
 from pathlib import Path
 import copy
+
 from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 
-from zds.utils.templatetags.emarkdown import emarkdown
+from zds.tutorialv2.publication_metrics import record_stage
+from zds.utils.templatetags.emarkdown import render_markdown_batch
+
+logger = logging.getLogger(__name__)
+
+
+def render_container_fragments(container, markdown_options, blob_shas=None, html_by_blob_sha=None):
+    """Render the introductions, conclusions and extracts of a container tree in one batch.
+
+    The texts whose git blob is found in ``html_by_blob_sha`` did not change since they were rendered (with
+    the same options): their HTML is reused instead of being rendered again.
+
+    :param container: the top container to render
+    :type container: Container
+    :param markdown_options: options passed to ``render_markdown`` for each fragment
+    :type markdown_options: dict
+    :param blob_shas: SHA of the git blob of each text file, as returned by ``get_blob_shas``
+    :type blob_shas: dict
+    :param html_by_blob_sha: HTML of texts previously rendered with ``markdown_options``, by git blob SHA
+    :type html_by_blob_sha: dict
+    :raise FailureDuringPublication: if a fragment could not be rendered
+    :return: a dictionary associating the relative path of each text file to its markdown and its rendering
+    :rtype: dict
+    """
+    from zds.tutorialv2.models.versioned import Container
+    from zds.tutorialv2.publication_utils import FailureDuringPublication
+    from zds.tutorialv2.utils import normalize_blob_path
+    blob_shas = blob_shas or {}
+    html_by_blob_sha = html_by_blob_sha or {}
+    rendered_fragments = {}
+    paths = []
+    texts = []
+
+    def collect(text_path, text):
+        if text:
+            blob_sha = blob_shas.get(normalize_blob_path(text_path))
+            if blob_sha in html_by_blob_sha:
+                rendered_fragments[text_path] = (text, mark_safe(html_by_blob_sha[blob_sha]))
+            else:
+                paths.append(text_path)
+                texts.append(text)
+
+    def traverse(current):
+        if current.introduction:
+            collect(current.introduction, current.get_introduction())
+        for child in current.children:
+            if not isinstance(child, Container):
+                if child.text:
+                    collect(child.text, child.get_text())
+            elif child.ready_to_publish:
+                traverse(child)
+        if current.conclusion:
+            collect(current.conclusion, current.get_conclusion())
+
+    with record_stage('git load'):
+        traverse(container)
+    if rendered_fragments:
+        logger.debug('%d texts of « %s » reused, %d to render', len(rendered_fragments), container.title, len(texts))
+    with record_stage('html render'):
+        for text_path, text, rendered in zip(paths, texts, render_markdown_batch(texts, **markdown_options)):
+            if rendered.error is not None:
+                raise FailureDuringPublication(
+                    _('Une erreur est survenue durant la publication de « {} », vérifiez le code markdown')
+                    .format(container.title))
+            rendered_fragments[text_path] = (text, rendered.content)
+    return rendered_fragments
 
 
 def publish_container(db_object, base_dir, container, template='tutorialv2/export/chapter.html',
-                      file_ext='html', image_callback=None, **ctx):
+                      file_ext='html', image_callback=None, markdown_options=None, rendered_fragments=None, **ctx):
     """ 'Publish' a given container, in a recursive way
 
     :param image_callback: callback used to change images tags on the created html
@@ -26,6 +94,11 @@ def publish_container(db_object, base_dir, container, template='tutorialv2/expor
     :param container: a given container
     :type container: Container
     :param file_ext: output file extension
+    :param markdown_options: options used to render the markdown texts, defaults to the HTML options
+    :type markdown_options: dict
+    :param rendered_fragments: texts of the whole tree, as returned by ``render_container_fragments``. \
+    They are rendered when publishing the top container.
+    :type rendered_fragments: dict
     :raise FailureDuringPublication: if anything goes wrong
     """
 
@@ -41,6 +114,14 @@ def publish_container(db_object, base_dir, container, template='tutorialv2/expor
     if db_object.js_support:
         is_js = 'js'
 
+    if markdown_options is None:
+        markdown_options = {'disable_jsfiddle': not db_object.js_support}
+    if rendered_fragments is None:
+        rendered_fragments = render_container_fragments(container, markdown_options)
+
+    def get_fragment(text_path):
+        return rendered_fragments.get(text_path, ('', ''))
+
     current_dir = path.dirname(path.join(base_dir, container.get_prod_path(relative=True)))
 
     if not path.isdir(current_dir):
@@ -49,7 +130,13 @@ def publish_container(db_object, base_dir, container, template='tutorialv2/expor
     img_relative_path = '..' if ctx['relative'] == '.' else '../' + ctx['relative']
     if container.has_extracts():  # the container can be rendered in one template
         wrapped_image_callback = image_callback(img_relative_path) if image_callback else image_callback
-        args = {'container': container, 'is_js': is_js}
+        args = {
+            'container': container,
+            'is_js': is_js,
+            'introduction_html': get_fragment(container.introduction)[1],
+            'conclusion_html': get_fragment(container.conclusion)[1],
+            'extracts': [(extract, get_fragment(extract.text)[1]) for extract in container.children],
+        }
         args.update(ctx)
         args['relative'] = img_relative_path
         parsed = render_to_string(template, args)
@@ -67,15 +154,16 @@ def publish_container(db_object, base_dir, container, template='tutorialv2/expor
         if not path.isdir(current_dir):
             makedirs(current_dir)
         relative_ccl_path = '../' + ctx.get('relative', '.')
-        if container.introduction and container.get_introduction():
+        introduction, introduction_html = get_fragment(container.introduction)
+        if container.introduction and introduction:
             part_path = Path(container.get_prod_path(relative=True), 'introduction.' + file_ext)
-            args = {'text': container.get_introduction()}
+            args = {'text': introduction, 'html': introduction_html}
             args.update(ctx)
             args['relative'] = relative_ccl_path
             if ctx.get('intro_ccl_template', None):
                 parsed = render_to_string(ctx.get('intro_ccl_template'), args)
             else:
-                parsed = emarkdown(container.get_introduction(), db_object.js_support)
+                parsed = introduction_html
             container.introduction = str(part_path)
             write_chapter_file(base_dir, container, part_path, parsed, path_to_title_dict,
                                wrapped_image_callback_intro_ccl)
@@ -90,17 +178,20 @@ def publish_container(db_object, base_dir, container, template='tutorialv2/expor
             if not child.has_extracts():
                 ctx['relative'] = '../' + ctx['relative']
             result = publish_container(db_object, base_dir, altered_version, file_ext=file_ext,
-                                       image_callback=image_callback, template=template, **ctx)
+                                       image_callback=image_callback, template=template,
+                                       markdown_options=markdown_options, rendered_fragments=rendered_fragments,
+                                       **ctx)
             path_to_title_dict.update(result)
-        if container.conclusion and container.get_conclusion():
+        conclusion, conclusion_html = get_fragment(container.conclusion)
+        if container.conclusion and conclusion:
             part_path = Path(container.get_prod_path(relative=True), 'conclusion.' + file_ext)
-            args = {'text': container.get_conclusion()}
+            args = {'text': conclusion, 'html': conclusion_html}
             args.update(ctx)
             args['relative'] = relative_ccl_path
             if ctx.get('intro_ccl_template', None):
                 parsed = render_to_string(ctx.get('intro_ccl_template'), args)
             else:
-                parsed = emarkdown(container.get_conclusion(), db_object.js_support)
+                parsed = conclusion_html
             container.conclusion = str(part_path)
             write_chapter_file(base_dir, container, part_path, parsed,
                                path_to_title_dict, wrapped_image_callback_intro_ccl)
@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+from git import Repo
+
+logger = logging.getLogger(__name__)
+
+_pools = weakref.WeakSet()
+# repositories inherited by forked processes, which must not be closed (nor garbage collected) there, since it would
+# kill the ``git cat-file`` processes of the parent
+_inherited_repositories = []
+
+
+class RepositoryPool:
+    """
+    Pool of GitPython ``Repo`` objects, so that the ``git cat-file`` processes they spawn to read the objects are
+    reused by the next requests instead of being started each time.
+
+    A ``Repo`` is not thread-safe, so each thread has its own pool, in which the least recently used repositories are
+    closed (which stops their processes) when there are more than ``max_size`` of them. A repository removed (or
+    replaced) since it was opened is opened again.
+    """
+
+    def __init__(self, max_size=None):
+        """
+        :param max_size: maximum number of repositories by thread, 0 to disable the pool (defaults to
+            ``ZDS_APP['content']['repository_pool_size']``)
+        """
+        self._max_size = max_size
+        self._local = threading.local()
+        _pools.add(self)
+
+    @property
+    def max_size(self):
+        if self._max_size is not None:
+            return self._max_size
+        return settings.ZDS_APP['content'].get('repository_pool_size', 0)
+
+    def get(self, path):
+        """
+        :param path: path of the repository
+        :return: the repository
+        :rtype: git.Repo
+        :raise git.exc.NoSuchPathError: if there is no such path
+        :raise git.exc.InvalidGitRepositoryError: if it is not a repository
+        """
+        max_size = self.max_size
+        path = os.path.abspath(str(path))
+        identity = self._get_identity(path)
+        if max_size <= 0 or identity is None:
+            return Repo(path)
+
+        repositories = self._get_repositories()
+        entry = repositories.pop(path, None)
+        if entry is not None:
+            if entry[1] == identity:
+                repositories[path] = entry
+                return entry[0]
+            entry[0].close()
+        repository = Repo(path)
+        repositories[path] = (repository, identity)
+        while len(repositories) > max_size:
+            evicted_path, (evicted, _) = repositories.popitem(last=False)
+            evicted.close()
+            logger.debug('repository %s closed', evicted_path)
+        return repository
+
+    def clear(self):
+        """
+        Close the repositories of the current thread.
+        """
+        repositories = self._get_repositories()
+        while repositories:
+            repositories.popitem()[1][0].close()
+
+    def _get_repositories(self):
+        try:
+            return self._local.repositories
+        except AttributeError:
+            self._local.repositories = OrderedDict()
+            return self._local.repositories
+
+    def _forget(self):
+        _inherited_repositories.append(self._local)
+        self._local = threading.local()
+
+    @staticmethod
+    def _get_identity(path):
+        """
+        :return: what identifies the git directory of the repository, which changes if it is created again (and,
+            through its change time, after each commit), or ``None`` if it does not exist
+        """
+        git_dir = os.path.join(path, '.git')
+        try:
+            stat = os.stat(git_dir if os.path.isdir(git_dir) else path)
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino, stat.st_ctime_ns
+
+
+def _forget_inherited_repositories():
+    for pool in _pools:
+        pool._forget()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_inherited_repositories)
+
+repositories = RepositoryPool()
+
+
+def get_repository(path):
+    """
+    :param path: path of a repository
+    :return: the repository, from the pool of the current thread
+    :rtype: git.Repo
+    """
+    return repositories.get(path)
@@ -0,0 +1,56 @@
+import os
+import tempfile
+from pathlib import Path
+
+import mock
+from django.test import TestCase
+
+from zds.tutorialv2.asset_staging import AssetStager, referenced_in
+
+
+class AssetStagerTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.gallery = Path(self.directory.name, 'gallery')
+        (self.gallery / 'thumbnails').mkdir(parents=True)
+        (self.gallery / 'used.png').write_bytes(b'used')
+        (self.gallery / 'same content.png').write_bytes(b'used')
+        (self.gallery / 'unused.png').write_bytes(b'unused')
+        (self.gallery / 'thumbnails' / 'used.jpg').write_bytes(b'thumbnail')
+        self.build = Path(self.directory.name, 'build')
+        self.build.mkdir()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_only_referenced_images_are_linked(self):
+        stager = AssetStager()
+        markdown = '![](/media/galleries/1/used.png) ![](/media/galleries/1/used.jpg) ![](same%20content.png)'
+        self.assertEqual(stager.stage_directory(self.gallery, self.build, keep=referenced_in(markdown)), 3)
+        self.assertEqual(sorted(path.name for path in self.build.iterdir()),
+                         ['same content.png', 'used.jpg', 'used.png'])
+        self.assertTrue(os.path.samefile(str(self.build / 'used.png'), str(self.gallery / 'used.png')))
+        self.assertEqual((stager.linked, stager.copied), (3, 0))
+
+    def test_copies_are_deduplicated(self):
+        stager = AssetStager()
+        real_link = os.link
+
+        def link(source, destination):
+            # the gallery is on another filesystem
+            if source.startswith(str(self.gallery)):
+                raise OSError(18, 'Invalid cross-device link')
+            return real_link(source, destination)
+
+        with mock.patch('zds.tutorialv2.asset_staging.os.link', side_effect=link):
+            stager.stage_directory(self.gallery, self.build)
+        self.assertEqual((stager.linked, stager.copied), (1, 3))
+        self.assertFalse(os.path.samefile(str(self.build / 'used.png'), str(self.gallery / 'used.png')))
+        self.assertTrue(os.path.samefile(str(self.build / 'used.png'), str(self.build / 'same content.png')))
+
+    def test_overwrite(self):
+        (self.build / 'used.png').write_bytes(b'downloaded')
+        AssetStager().stage(self.gallery / 'used.png', self.build / 'used.png', overwrite=False)
+        self.assertEqual((self.build / 'used.png').read_bytes(), b'downloaded')
+        AssetStager().stage(self.gallery / 'used.png', self.build / 'used.png')
+        self.assertEqual((self.build / 'used.png').read_bytes(), b'used')
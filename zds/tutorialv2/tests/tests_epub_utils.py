@@ -0,0 +1,75 @@
+import tempfile
+import zipfile
+from pathlib import Path
+
+import mock
+from django.test import TestCase
+
+from zds.tutorialv2.epub_utils import ImageHandling, write_epub_archive, dump_ebook_fragments, DirTuple
+from zds.tutorialv2.publication_utils import load_rendered_fragments, EPUB_RENDERED_FRAGMENTS_FILE
+from zds.utils.templatetags.emarkdown import epub_markdown_options
+
+
+class EpubUtilsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_handle_images(self):
+        image_handler = ImageHandling()
+        chapter = ('<h2 id="title">Title</h2><p id="title">&lt;img src="text.png"&gt;</p>'
+                   '<img alt="src=alt.png" src="/media/galleries/1/an%20image.png"/>'
+                   "<img src='https://example.com/images/remote.png?a=1&amp;b=2'>")
+        self.assertEqual(
+            image_handler.handle_images('..')(chapter),
+            '<h2 id="title">Title</h2><p id="title-1">&lt;img src="text.png"&gt;</p>'
+            '<img alt="src=alt.png" src="../images/an_image.png"/>'
+            '<img src="../images//images/remote.png">')
+        self.assertEqual(image_handler.names, {'an_image.png', 'remote.png'})
+
+    def test_handle_images_only_deduplicates_ids(self):
+        chapter = ('<p class="a" id="s"><a href="#s">a</a><img alt="same" src="a.png"/></p>'
+                   '<p class="a" id="s"><a href="#s">b</a><img alt="same" src="a.png"/></p>')
+        self.assertEqual(
+            ImageHandling().handle_images('..')(chapter),
+            '<p class="a" id="s"><a href="#s">a</a><img alt="same" src="../images/a.png"/></p>'
+            '<p class="a" id="s-1"><a href="#s">b</a><img alt="same" src="../images/a.png"/></p>')
+
+    def test_epub_markdown_options(self):
+        options = epub_markdown_options(DirTuple(absolute='/tmp/ebook/images', relative='../images'))
+        self.assertTrue(options['disable_jsfiddle'])
+        self.assertEqual(options['images_download_dir'], '/tmp/ebook/images')
+
+    def test_write_epub_archive(self):
+        ebook = self.path / 'ebook'
+        (ebook / 'OPS' / 'images').mkdir(parents=True)
+        (ebook / 'OPS' / 'Text.xhtml').write_text('<html/>')
+        (ebook / 'OPS' / 'images' / 'image.png').write_bytes(b'image')
+        (ebook / 'mimetype').write_text('application/epub+zip')
+        epub_path = self.path / 'content.epub'
+        epub_path.write_bytes(b'previous')
+
+        write_epub_archive(ebook, epub_path)
+        with zipfile.ZipFile(str(epub_path)) as archive:
+            first = archive.infolist()[0]
+            self.assertEqual((first.filename, first.compress_type), ('mimetype', zipfile.ZIP_STORED))
+            self.assertEqual(archive.read('OPS/Text.xhtml'), b'<html/>')
+            self.assertEqual(archive.getinfo('OPS/images/image.png').compress_type, zipfile.ZIP_STORED)
+        self.assertEqual([path.name for path in self.path.iterdir() if path.is_file()], ['content.epub'])
+
+    def test_fragments_with_downloaded_images_are_not_kept(self):
+        published = mock.Mock(get_prod_path=mock.Mock(return_value=str(self.path)))
+        options = {'output_format': 'epub'}
+        rendered_fragments = {
+            'introduction.md': ('text', '<p>text</p>'),
+            'conclusion.md': ('![](http://example.com/a.png)', '<img src="images/a.png"/>'),
+        }
+        blob_shas = {'introduction.md': 'sha-1', 'conclusion.md': 'sha-2'}
+        dump_ebook_fragments(published, options, blob_shas, rendered_fragments, {'a.png'})
+        self.assertTrue((self.path / EPUB_RENDERED_FRAGMENTS_FILE).exists())
+        self.assertEqual(load_rendered_fragments(published, options, EPUB_RENDERED_FRAGMENTS_FILE),
+                         {'sha-1': '<p>text</p>'})
+        self.assertEqual(load_rendered_fragments(published, {}, EPUB_RENDERED_FRAGMENTS_FILE), {})
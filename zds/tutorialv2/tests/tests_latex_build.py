@@ -0,0 +1,97 @@
+import tempfile
+from pathlib import Path
+
+import mock
+from django.test import TestCase
+
+from zds.tutorialv2.latex_build import LatexBuildCache
+from zds.tutorialv2.publication_utils import ZMarkdownRebberLatexPublicator
+
+
+class LatexBuildCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        self.latex_file = self.path / 'content.tex'
+        self.latex_file.write_text('\\documentclass{zmdocument}')
+        (self.path / 'images').mkdir()
+        (self.path / 'images' / 'image.png').write_bytes(b'png')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_key(self):
+        return LatexBuildCache.get_key(self.latex_file, '.pdf', [self.path / 'images', self.path / 'missing.cls'])
+
+    def test_key(self):
+        key = self.get_key()
+        self.assertEqual(key, self.get_key())
+        (self.path / 'images' / 'image.png').write_bytes(b'other png')
+        self.assertNotEqual(key, self.get_key())
+        self.assertNotEqual(LatexBuildCache.get_key(self.latex_file, '.printable.pdf', []),
+                            LatexBuildCache.get_key(self.latex_file, '.pdf', []))
+
+    def test_get_and_put(self):
+        cache = LatexBuildCache(self.path / 'cache', max_entries=1)
+        built = self.path / 'built.pdf'
+        built.write_bytes(b'pdf')
+        destination = self.path / 'destination.pdf'
+
+        self.assertFalse(cache.get('key', '.pdf', destination))
+        cache.put('key', '.pdf', built)
+        self.assertTrue(cache.get('key', '.pdf', destination))
+        self.assertEqual(destination.read_bytes(), b'pdf')
+
+        cache.put('other', '.pdf', built)
+        self.assertEqual([entry.name for entry in (self.path / 'cache').iterdir()], ['other.pdf'])
+
+    def test_disabled(self):
+        cache = LatexBuildCache(None)
+        cache.put('key', '.pdf', self.latex_file)
+        self.assertFalse(cache.get('key', '.pdf', self.path / 'destination.pdf'))
+
+
+class LatexCompilationTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.base_name = str(Path(self.directory.name, 'content'))
+        self.publicator = ZMarkdownRebberLatexPublicator('.pdf')
+        self.passes = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def fake_compiler(self, toc_contents):
+        def tex_compiler(texfile, draftmode=''):
+            self.passes.append(draftmode)
+            toc = toc_contents[min(len(self.passes), len(toc_contents)) - 1]
+            Path(self.base_name + '.aux').write_text('aux')
+            Path(self.base_name + '.toc').write_text(toc)
+            if not draftmode:
+                Path(self.base_name + '.pdf').write_text(toc)
+            return True
+        return tex_compiler
+
+    def compile(self, toc_contents):
+        with mock.patch.object(self.publicator, 'tex_compiler', side_effect=self.fake_compiler(toc_contents)), \
+                mock.patch.object(self.publicator, 'make_glossary') as make_glossary:
+            passes = self.publicator.compile(self.base_name + '.tex', self.base_name + '.pdf')
+        make_glossary.assert_called_once_with('content', self.base_name + '.tex')
+        return passes
+
+    def test_stops_when_converged(self):
+        self.assertEqual(self.compile(['toc']), 2)
+        self.assertEqual(self.passes, ['-draftmode', ''])
+
+    def test_page_numbers_changed(self):
+        self.assertEqual(self.compile(['toc', 'toc with page numbers']), 3)
+        self.assertEqual(self.passes, ['-draftmode', '', ''])
+
+    def test_auxiliary_files_of_the_previous_build(self):
+        self.compile(['toc'])
+        self.passes = []
+        self.assertEqual(self.compile(['toc']), 1)
+        self.assertEqual(self.passes, [''])
+
+    def test_maximum_passes(self):
+        self.assertEqual(self.compile([str(number) for number in range(10)]), 4)
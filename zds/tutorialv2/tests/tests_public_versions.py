@@ -0,0 +1,91 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import mock
+from django.test import TestCase
+
+from zds.tutorialv2.public_versions import switch_public_version, clean_versions, get_versions_directory, \
+    remove_public_version, schedule_versions_cleaning
+
+
+def build(directory, text):
+    directory.mkdir()
+    (directory / 'manifest.json').write_text(text)
+    return directory
+
+
+@mock.patch('zds.tutorialv2.public_versions.schedule_versions_cleaning')
+class PublicVersionsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.public = Path(self.directory.name)
+        self.prod_path = self.public / 'content'
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_switch(self, schedule_versions_cleaning):
+        first = switch_public_version(build(self.public / 'content__building', 'v1'), self.prod_path, 'v1')
+        self.assertTrue(self.prod_path.is_symlink())
+        self.assertEqual((self.prod_path / 'manifest.json').read_text(), 'v1')
+        self.assertFalse((self.public / 'content__building').exists())
+
+        second = switch_public_version(build(self.public / 'content__building', 'v2'), self.prod_path, 'v2')
+        self.assertEqual((self.prod_path / 'manifest.json').read_text(), 'v2')
+        self.assertEqual(self.prod_path.resolve(), second.resolve())
+        # the previous version is removed later
+        self.assertTrue(first.exists())
+        schedule_versions_cleaning.assert_called_with(get_versions_directory(self.prod_path), 2)
+        self.assertEqual(sorted(path.name for path in self.public.iterdir()), ['.versions', 'content'])
+
+    def test_switch_from_a_directory(self, schedule_versions_cleaning):
+        build(self.prod_path, 'v1')
+        switch_public_version(build(self.public / 'content__building', 'v2'), self.prod_path, 'v2')
+        self.assertEqual((self.prod_path / 'manifest.json').read_text(), 'v2')
+        self.assertEqual(sorted(path.name for path in get_versions_directory(self.prod_path).iterdir()),
+                         ['v2', 'v2-previous'])
+
+    def test_clean_versions(self, schedule_versions_cleaning):
+        for number in range(4):
+            version = switch_public_version(build(self.public / 'content__building', str(number)), self.prod_path,
+                                            'v{}'.format(number))
+            # the modification date does not matter, the versions are ordered by name
+            os.utime(str(version), (time.time() - number, time.time() - number))
+        removed = clean_versions(get_versions_directory(self.prod_path), 2)
+        self.assertEqual(sorted(path.name for path in removed), ['v0', 'v1'])
+        self.assertEqual(sorted(path.name for path in get_versions_directory(self.prod_path).iterdir()),
+                         ['v2', 'v3'])
+
+        remove_public_version(self.prod_path)
+        self.assertFalse(os.path.lexists(str(self.prod_path)))
+        clean_versions(get_versions_directory(self.prod_path), 0)
+        self.assertFalse(get_versions_directory(self.prod_path).exists())
+
+
+class VersionsCleaningTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.versions_directory = get_versions_directory(Path(self.directory.name, 'content'))
+        for name in ('v1', 'v2'):
+            (self.versions_directory / name).mkdir(parents=True)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cleaning_outside_of_a_request(self):
+        # a management command could exit during the removal: it is done before returning
+        with mock.patch('zds.tutorialv2.public_versions.get_current_request', return_value=None):
+            schedule_versions_cleaning(self.versions_directory, 0)
+        self.assertFalse(self.versions_directory.exists())
+
+    def test_cleaning_during_a_request(self):
+        with mock.patch('zds.tutorialv2.public_versions.get_current_request', return_value=mock.Mock()), \
+                mock.patch('threading.Thread') as thread:
+            schedule_versions_cleaning(self.versions_directory, 1)
+        self.assertFalse(thread.call_args[1].get('daemon', False))
+        thread.return_value.start.assert_called_once_with()
+        self.assertTrue(self.versions_directory.exists())
+        thread.call_args[1]['target'](*thread.call_args[1]['args'])
+        self.assertEqual([path.name for path in self.versions_directory.iterdir()], ['v2'])
@@ -0,0 +1,159 @@
+import tempfile
+import time
+from concurrent.futures import Executor, Future
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import mock
+from django.test import TestCase
+
+from zds.member.factories import ProfileFactory
+from zds.tutorialv2.factories import PublishedContentFactory
+from zds.tutorialv2.models.database import PublicationEvent
+from zds.tutorialv2.publication_jobs import PublicationJobRunner
+from zds.tutorialv2.publication_utils import Publicator, PublicatorRegistry, WatchdogFilePublicator
+from zds.tutorialv2.publication_wakeup import WakeUpChannel, notify_watchdogs
+from zds.tutorialv2.tests import TutorialTestMixin, override_for_contents
+
+
+class InlineExecutor(Executor):
+    """Run the jobs when they are submitted, so that they see the data of the test transaction"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@override_for_contents()
+class PublicationJobRunnerTests(TutorialTestMixin, TestCase):
+    def setUp(self):
+        self.published = PublishedContentFactory(type='ARTICLE', author_list=[ProfileFactory().user]).public_version
+        self.published_formats = []
+
+        class SucceedingPublicator(Publicator):
+            def publish(publicator, md_file_path, base_name, **kwargs):
+                self.published_formats.append('succeeding')
+
+        class FailingPublicator(Publicator):
+            def publish(publicator, md_file_path, base_name, **kwargs):
+                raise OSError('no space left on device')
+
+        PublicatorRegistry.registry['succeeding'] = SucceedingPublicator()
+        PublicatorRegistry.registry['failing'] = FailingPublicator()
+
+    def tearDown(self):
+        PublicatorRegistry.unregister('succeeding')
+        PublicatorRegistry.unregister('failing')
+        super().tearDown()
+
+    def request(self, format_requested):
+        return PublicationEvent.objects.create(state_of_processing='REQUESTED', published_object=self.published,
+                                               format_requested=format_requested)
+
+    def run_runner(self, runner):
+        runner.run_once(InlineExecutor())
+        runner.collect()
+
+    def test_jobs_are_claimed_once(self):
+        event = self.request('succeeding')
+        first = PublicationJobRunner(worker_id='first')
+        second = PublicationJobRunner(worker_id='second')
+        self.assertEqual([claimed.pk for claimed in first.claim(5)], [event.pk])
+        self.assertEqual(second.claim(5), [])
+        event.refresh_from_db()
+        self.assertEqual(event.state_of_processing, 'RUNNING')
+        self.assertEqual(event.worker, 'first')
+        self.assertEqual(event.attempts, 1)
+
+    def test_format_concurrency(self):
+        for _ in range(3):
+            self.request('pdf')
+        self.request('succeeding')
+        runner = PublicationJobRunner(workers=4, format_concurrency={'pdf': 1}, worker_id='runner')
+        claimed = runner.claim(4)
+        self.assertEqual(sorted(event.format_requested for event in claimed), ['pdf', 'succeeding'])
+
+    def test_success(self):
+        event = self.request('succeeding')
+        self.run_runner(PublicationJobRunner(worker_id='runner'))
+        event.refresh_from_db()
+        self.assertEqual(event.state_of_processing, 'SUCCESS')
+        self.assertEqual(self.published_formats, ['succeeding'])
+
+    def test_failures_are_retried_with_backoff(self):
+        event = self.request('failing')
+        runner = PublicationJobRunner(max_attempts=2, retry_backoff=30, worker_id='runner')
+        self.run_runner(runner)
+        event.refresh_from_db()
+        self.assertEqual(event.state_of_processing, 'REQUESTED')
+        self.assertIn('no space left on device', event.error)
+        self.assertGreater(event.retry_after, datetime.now() + timedelta(seconds=20))
+        self.assertIsNone(event.worker)
+
+        # not retried before the end of the backoff
+        self.run_runner(runner)
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 1)
+
+        PublicationEvent.objects.filter(pk=event.pk).update(retry_after=datetime.now())
+        self.run_runner(runner)
+        event.refresh_from_db()
+        self.assertEqual(event.state_of_processing, 'FAILURE')
+        self.assertEqual(event.attempts, 2)
+
+    def test_jobs_of_dead_workers_are_reclaimed(self):
+        event = self.request('succeeding')
+        PublicationJobRunner(worker_id='dead').claim(1)
+        PublicationEvent.objects.filter(pk=event.pk).update(heartbeat=datetime.now() - timedelta(minutes=10))
+
+        # requested again, and immediately claimed since there is no backoff
+        self.run_runner(PublicationJobRunner(stale_after=60, retry_backoff=0, worker_id='alive'))
+        event.refresh_from_db()
+        self.assertEqual(event.state_of_processing, 'SUCCESS')
+        self.assertEqual(event.worker, 'alive')
+        self.assertEqual(event.attempts, 2)
+
+
+@override_for_contents()
+class WakeUpChannelTests(TutorialTestMixin, TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.watchdog_dir = self.overridden_zds_app['content']['extra_content_watchdog_dir']
+        self.overridden_zds_app['content']['extra_content_watchdog_dir'] = Path(self.directory.name)
+
+    def tearDown(self):
+        super().tearDown()
+        self.overridden_zds_app['content']['extra_content_watchdog_dir'] = self.watchdog_dir
+        self.directory.cleanup()
+
+    def test_watchdogs_are_woken_up(self):
+        with WakeUpChannel(self.directory.name, 'host:1') as first, \
+                WakeUpChannel(self.directory.name, 'host:2') as second:
+            self.assertFalse(first.wait(0))
+            notify_watchdogs()
+            notify_watchdogs()
+            start = time.monotonic()
+            self.assertTrue(first.wait(5))
+            self.assertTrue(second.wait(5))
+            self.assertLess(time.monotonic() - start, 1)
+            # both notifications were handled at once
+            self.assertFalse(first.wait(0))
+        self.assertEqual(list(Path(self.directory.name).iterdir()), [])
+
+    def test_dead_sockets_are_removed(self):
+        channel = WakeUpChannel(self.directory.name, 'dead').open()
+        channel.socket.close()  # the socket file stays, as when a watchdog is killed
+        self.assertTrue(channel.path.exists())
+        notify_watchdogs()
+        self.assertFalse(channel.path.exists())
+
+    def test_requested_exports_notify_after_commit(self):
+        published = PublishedContentFactory(type='ARTICLE', author_list=[ProfileFactory().user]).public_version
+        with mock.patch('zds.tutorialv2.publication_utils.transaction.on_commit') as on_commit:
+            WatchdogFilePublicator().publish_from_published_content(published)
+        on_commit.assert_called_once_with(notify_watchdogs)
+        self.assertTrue(PublicationEvent.objects.filter(published_object=published).exists())
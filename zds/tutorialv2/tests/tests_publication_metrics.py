@@ -0,0 +1,83 @@
+import sys
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from zds.member.factories import ProfileFactory
+from zds.tutorialv2.factories import PublishedContentFactory
+from zds.tutorialv2.models.database import PublicationEvent
+from zds.tutorialv2.publication_jobs import run_publicator
+from zds.tutorialv2.publication_metrics import PublicationMetrics, record_stage, run_command, get_current_metrics
+from zds.tutorialv2.publication_utils import Publicator, PublicatorRegistry, PUBLICATION_EVENT_FORMAT
+from zds.tutorialv2.tests import TutorialTestMixin, override_for_contents
+
+
+class PublicationMetricsTests(TestCase):
+    def test_stages(self):
+        with record_stage('ignored'):  # no active metrics
+            pass
+        metrics = PublicationMetrics()
+        with metrics.activate():
+            with record_stage('render'):
+                time.sleep(0.01)
+            other = PublicationMetrics()
+            with other.activate():
+                with record_stage('export'):
+                    pass
+            self.assertIs(get_current_metrics(), metrics)
+            with record_stage('render'):
+                time.sleep(0.01)
+        self.assertIsNone(get_current_metrics())
+        self.assertEqual(list(metrics.stages), ['render'])
+        self.assertGreaterEqual(metrics.stages['render'], 0.02)
+        self.assertEqual(list(other.stages), ['export'])
+        self.assertGreaterEqual(metrics.as_dict()['duration'], metrics.as_dict()['stages']['render'])
+
+    def test_run_command(self):
+        metrics = PublicationMetrics()
+        with metrics.activate():
+            command = '{} -c "data = bytearray(64 * 1024 * 1024); data[::4096] = b\'1\' * len(data[::4096])"'
+            self.assertEqual(run_command(command.format(sys.executable), cwd='.'), 0)
+            self.assertEqual(run_command('exit 3', cwd='.'), 3)
+        self.assertGreater(metrics.children_peak_memory, 64 * 1024)
+
+
+@override_for_contents()
+class PublicationEventMetricsTests(TutorialTestMixin, TestCase):
+    def setUp(self):
+        self.published = PublishedContentFactory(type='ARTICLE', author_list=[ProfileFactory().user]).public_version
+
+        class SlowPublicator(Publicator):
+            def publish(self, md_file_path, base_name, **kwargs):
+                with record_stage('render'):
+                    time.sleep(0.01)
+
+        PublicatorRegistry.registry['slow'] = SlowPublicator()
+
+    def tearDown(self):
+        PublicatorRegistry.unregister('slow')
+        super().tearDown()
+
+    def test_metrics_are_recorded(self):
+        publication = PublicationEvent.objects.get(published_object=self.published,
+                                                   format_requested=PUBLICATION_EVENT_FORMAT)
+        self.assertEqual(publication.state_of_processing, 'SUCCESS')
+        stages = publication.get_metrics()['stages']
+        for stage in ['git load', 'deepcopy', 'html render', 'manifest dump', 'markdown flattening', 'zip',
+                      'copy to prod']:
+            self.assertIn(stage, stages)
+
+        event = PublicationEvent.objects.create(state_of_processing='RUNNING', published_object=self.published,
+                                                format_requested='slow')
+        run_publicator(event)
+        event.save()
+        self.assertGreaterEqual(event.get_metrics()['stages']['render'], 0.01)
+
+        out = StringIO()
+        call_command('publication_metrics', '--format', 'slow', stdout=out)
+        self.assertIn('[slow] RUNNING', out.getvalue())
+        out = StringIO()
+        call_command('publication_metrics', '--summary', stdout=out)
+        self.assertIn('copy to prod', out.getvalue())
@@ -0,0 +1,50 @@
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import mock
+from django.test import TestCase
+from git import Repo, NoSuchPathError
+
+from zds.tutorialv2.repositories import RepositoryPool
+
+
+class RepositoryPoolTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = [Path(self.directory.name, name) for name in ('a', 'b', 'c')]
+        for path in self.paths:
+            Repo.init(str(path))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get(self):
+        pool = RepositoryPool(max_size=2)
+        repository = pool.get(self.paths[0])
+        self.assertIs(pool.get(str(self.paths[0])), repository)
+
+        other_threads = []
+        thread = threading.Thread(target=lambda: other_threads.append(pool.get(self.paths[0])))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other_threads[0], repository)
+
+        with mock.patch.object(repository, 'close') as close:
+            pool.get(self.paths[1])
+            pool.get(self.paths[2])  # the least recently used one is closed
+            close.assert_called_once_with()
+        self.assertIsNot(pool.get(self.paths[0]), repository)
+
+        pool.clear()
+        with self.assertRaises(NoSuchPathError):
+            pool.get(Path(self.directory.name, 'nothing'))
+        self.assertIsNot(RepositoryPool(max_size=0).get(self.paths[0]), pool.get(self.paths[0]))
+
+    def test_repository_created_again(self):
+        pool = RepositoryPool(max_size=2)
+        repository = pool.get(self.paths[0])
+        shutil.rmtree(str(self.paths[0]))
+        Repo.init(str(self.paths[0]))
+        self.assertIsNot(pool.get(self.paths[0]), repository)
@@ -1,10 +1,17 @@
+import copy
+from io import StringIO
 import os
 import shutil
+import subprocess
+import time
 from pathlib import Path
 import datetime
 
+import mock
+
 from django.conf import settings
-from django.test import TestCase
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
 
 from zds.member.factories import ProfileFactory, StaffProfileFactory
@@ -14,8 +21,11 @@ from zds.gallery.factories import UserGalleryFactory
 from zds.tutorialv2.models.versioned import Container
 from zds.tutorialv2.utils import get_target_tagged_tree_for_container, \
     get_target_tagged_tree_for_extract, last_participation_is_old, \
-    InvalidSlugError, BadManifestError, get_content_from_json, get_commit_author, slugify_raise_on_invalid, check_slug
-from zds.tutorialv2.publication_utils import publish_content, unpublish_content
+    InvalidSlugError, BadManifestError, get_content_from_json, get_commit_author, slugify_raise_on_invalid, \
+    check_slug, get_blob, get_blob_shas, read_blobs
+from zds.tutorialv2.publication_utils import publish_content, unpublish_content, FailureDuringPublication, \
+    generate_external_content
+from zds.tutorialv2.public_versions import get_versions_directory
 from zds.tutorialv2.models.database import PublishableContent, PublishedContent, ContentReaction, ContentRead
 from django.core.management import call_command
 from zds.tutorialv2.publication_utils import Publicator, PublicatorRegistry
@@ -23,6 +33,7 @@ from zds.tutorialv2.tests import TutorialTestMixin, override_for_contents
 from zds import json_handler
 from zds.utils.models import Alert
 from zds.utils.header_notifications import get_header_notifications
+from zds.utils.templatetags.emarkdown import render_markdown_batch
 
 
 @override_for_contents()
@@ -246,6 +257,42 @@ class UtilsTests(TutorialTestMixin, TestCase):
                 self.assertIsNone(chapter.introduction)
                 self.assertIsNone(chapter.conclusion)
 
+    def test_incremental_publication(self):
+        tuto = PublishableContentFactory(type='TUTORIAL', author_list=[self.user_author])
+        tuto_draft = tuto.load_version()
+        chapter = ContainerFactory(parent=tuto_draft, db_object=tuto)
+        first_extract = ExtractFactory(container=chapter, db_object=tuto)
+        ExtractFactory(container=chapter, db_object=tuto)
+        tuto.public_version = publish_content(tuto, tuto.load_version(), is_major_update=True)
+        tuto.save()
+
+        tuto_draft = tuto.load_version()
+        first_extract = tuto_draft.children[0].children[0]
+        tuto.sha_draft = first_extract.repo_update(first_extract.title, 'A **new** text')
+        tuto.save()
+
+        rendered = []
+
+        def render_batch(fragments, **kwargs):
+            rendered.append(list(fragments))
+            return render_markdown_batch(fragments, **kwargs)
+
+        with mock.patch('zds.tutorialv2.publish_container.render_markdown_batch', side_effect=render_batch):
+            published = publish_content(tuto, tuto.load_version(), is_major_update=False)
+            # the first batch is the HTML version, the next ones are the extra contents
+            self.assertEqual(rendered[0], ['A **new** text'])
+            chapter_path = Path(published.get_prod_path(), tuto.load_version().children[0].get_prod_path(True))
+            with chapter_path.open(encoding='utf-8') as chapter_file:
+                html = chapter_file.read()
+            self.assertIn('A **new** text', html)
+            self.assertNotIn('&lt;p&gt;', html)
+
+            tuto.public_version = published
+            rendered.clear()
+            publish_content(tuto, tuto.load_version(), full_rebuild=True)
+            # introduction, conclusion (of the content and the chapter) and the two extracts
+            self.assertEqual(len(rendered[0]), 6)
+
     def test_tagged_tree_extract(self):
         midsize = PublishableContentFactory(author_list=[self.user_author])
         midsize_draft = midsize.load_version()
@@ -505,6 +552,17 @@ class UtilsTests(TutorialTestMixin, TestCase):
         published = PublishedContent.objects.get(pk=published.pk)
         self.assertEqual(published.char_count, published.get_char_count())
 
+    def test_adjust_char_count_in_parallel(self):
+        for _ in range(3):
+            PublishedContentFactory(type='ARTICLE', author_list=[self.user_author])
+        PublishedContent.objects.update(char_count=None)
+
+        call_command('adjust_char_count', workers=2, batch_size=2, stdout=StringIO())
+
+        for published in PublishedContent.objects.all():
+            self.assertIsNotNone(published.char_count)
+            self.assertEqual(published.char_count, published.get_char_count())
+
     def test_image_with_non_ascii_chars(self):
         """seen on #4144"""
         article = PublishableContentFactory(type='article', author_list=[self.user_author])
@@ -528,6 +586,159 @@ class UtilsTests(TutorialTestMixin, TestCase):
         unpublish_content(published, staff)
         self.assertEqual(0, get_header_notifications(staff)['alerts']['total'])
 
+    def test_generate_external_content_in_a_transaction(self):
+        class WritingPublicator(Publicator):
+            def publish(self, md_file_path, base_name, **kwargs):
+                Path(base_name + '.' + self.extension).write_text(self.extension)
+
+        PublicatorRegistry.registry = {'html': WritingPublicator(), 'epub': WritingPublicator()}
+        PublicatorRegistry.registry['html'].extension, PublicatorRegistry.registry['epub'].extension = 'html', 'epub'
+        build_dir = Path(self.overridden_zds_app['content']['repo_public_path'], 'transaction')
+        build_dir.mkdir(parents=True)
+        base_name = str(build_dir / 'content')
+        # the formats are generated in this process, the transaction (of the test case too) is kept
+        with mock.patch('zds.tutorialv2.publication_utils._generate_in_processes') as generate_in_processes:
+            with transaction.atomic():
+                reports = generate_external_content(base_name, str(build_dir), base_name + '.md', parallel=True)
+                self.assertTrue(PublishableContent.objects.filter(pk=self.tuto.pk).exists())
+        self.assertFalse(generate_in_processes.called)
+        self.assertEqual([(r.format, r.success) for r in reports], [('html', True), ('epub', True)])
+        self.assertEqual(Path(base_name + '.epub').read_text(), 'epub')
+
+    def test_get_blob(self):
+        extract = ExtractFactory(container=self.chapter1, db_object=self.tuto)
+        versioned = self.tuto.load_version()
+        tree = versioned.repository.commit(versioned.current_version).tree
+        self.assertEqual(get_blob(tree, extract.text), extract.get_text())
+        self.assertEqual(get_blob(tree, './' + extract.text.replace('/', '//')), extract.get_text())
+        self.assertIsNotNone(get_blob(tree, 'manifest.json'))
+        self.assertIsNone(get_blob(tree, 'missing.md'))
+        self.assertIsNone(get_blob(tree, extract.text + '/missing.md'))
+        self.assertIsNone(get_blob(tree, self.part1.get_path(relative=True)))  # a directory
+        self.assertIsNone(get_blob(tree, '../manifest.json'))
+        self.assertIsNone(get_blob(tree, ''))
+
+    def test_publication_only_writes_in_the_new_version(self):
+        article = PublishedContentFactory(type='ARTICLE', author_list=[self.user_author])
+        public_version = article.public_version
+        versions_directory = get_versions_directory(public_version.get_prod_path())
+        first = Path(public_version.get_prod_path()).resolve()
+        self.assertEqual(list(versions_directory.iterdir()), [first])  # no previous version moved aside
+        zip_name = public_version.content_public_slug + '.zip'
+        zip_path = Path(public_version.get_extra_contents_directory(), zip_name)
+        self.assertTrue(zip_path.is_file())
+        first_zip = zip_path.read_bytes()
+
+        article = PublishableContent.objects.get(pk=article.pk)
+        ExtractFactory(container=article.load_version(), db_object=article)
+        article = PublishableContent.objects.get(pk=article.pk)
+        public_version = publish_content(article, article.load_version(), False)
+        second = Path(public_version.get_prod_path()).resolve()
+        self.assertNotEqual(first, second)
+        self.assertTrue(Path(public_version.get_extra_contents_directory(), zip_name).is_file())
+        if first.exists():  # not removed yet
+            self.assertEqual(Path(first, settings.ZDS_APP['content']['extra_contents_dirname'], zip_name).read_bytes(),
+                             first_zip)
+
+    def test_slug_change_removes_the_old_files_once_the_new_ones_are_online(self):
+        article = PublishedContentFactory(type='ARTICLE', author_list=[self.user_author])
+        old_prod_path = Path(article.public_version.get_prod_path())
+        versioned = article.load_version()
+        new_slug = versioned.get_unique_slug('Un nouveau titre')
+        article.sha_draft = versioned.repo_update_top_container('Un nouveau titre', new_slug, 'intro', 'ccl')
+        article.title, article.slug = 'Un nouveau titre', new_slug
+        article.save()
+
+        with mock.patch.object(PublicatorRegistry.get('md'), 'publish', side_effect=FailureDuringPublication('md')):
+            with self.assertRaises(FailureDuringPublication), transaction.atomic():
+                publish_content(article, article.load_version())
+        # the publication failed: the old version is still online
+        self.assertTrue((old_prod_path / 'manifest.json').is_file())
+
+        article = PublishableContent.objects.get(pk=article.pk)
+        public_version = publish_content(article, article.load_version())
+        self.assertTrue(Path(public_version.get_prod_path(), 'manifest.json').is_file())
+        self.assertFalse(os.path.lexists(str(old_prod_path)))
+        self.assertFalse(get_versions_directory(old_prod_path).exists())
+
+    def test_load_texts(self):
+        ExtractFactory(container=self.chapter1, db_object=self.tuto)
+        ExtractFactory(container=self.chapter1, db_object=self.tuto)
+        versioned = self.tuto.load_version()
+        extract = versioned.children[0].children[0].children[0]
+        texts = [extract.get_text(), extract.container.get_introduction(), versioned.get_conclusion()]
+
+        blob_shas = get_blob_shas(versioned.repository, versioned.current_version)
+        self.assertEqual(read_blobs(versioned.repository, ['0' * 40]), {})
+        self.assertEqual(read_blobs(versioned.repository, blob_shas.values()).keys(), set(blob_shas.values()))
+        # the blobs are read by the git process of the repository, which is kept for the next reads
+        cat_file_process = versioned.repository.git.cat_file_all
+        self.assertIsNotNone(cat_file_process)
+        read_blobs(versioned.repository, blob_shas.values())
+        self.assertIs(versioned.repository.git.cat_file_all, cat_file_process)
+        versioned.load_texts()
+        with mock.patch('zds.tutorialv2.models.versioned.get_blob') as get_blob_mock:
+            self.assertEqual([extract.get_text(), extract.container.get_introduction(), versioned.get_conclusion()],
+                             texts)
+            self.assertFalse(get_blob_mock.called)
+        self.assertIsNone(versioned.get_version_text('missing.md'))
+
+        # the texts of the previous version are not used
+        extract.repo_update(extract.title, 'new text')
+        self.assertEqual(extract.get_text(), 'new text')
+
     def tearDown(self):
         super().tearDown()
         PublicatorRegistry.registry = self.old_registry
+
+
+@override_for_contents()
+class ExtraContentGenerationTests(TutorialTestMixin, TransactionTestCase):
+    def setUp(self):
+        self.old_registry = PublicatorRegistry.registry
+        self.build_dir = Path(self.overridden_zds_app['content']['repo_public_path'], 'parallel')
+        self.build_dir.mkdir(parents=True)
+
+    def tearDown(self):
+        super().tearDown()
+        PublicatorRegistry.registry = self.old_registry
+
+    def test_generate_external_content_in_parallel(self):
+        pid_path = self.build_dir / 'command.pid'
+
+        class WritingPublicator(Publicator):
+            def publish(self, md_file_path, base_name, **kwargs):
+                Path(base_name + '.html').write_text('html')
+
+        class FailingPublicator(Publicator):
+            def publish(self, md_file_path, base_name, **kwargs):
+                raise FailureDuringPublication('no epub')
+
+        class SlowPublicator(Publicator):
+            def publish(self, md_file_path, base_name, **kwargs):
+                command = subprocess.Popen('sleep 30', shell=True)
+                pid_path.write_text(str(command.pid))
+                command.wait()
+
+        PublicatorRegistry.registry = {'html': WritingPublicator(), 'epub': FailingPublicator(),
+                                       'pdf': SlowPublicator()}
+        base_name = str(self.build_dir / 'content')
+        zds_app = copy.deepcopy(self.overridden_zds_app)
+        zds_app['content']['extra_content_generation_timeouts'] = {'default': 1}
+
+        with self.settings(ZDS_APP=zds_app):
+            start = time.monotonic()
+            reports = generate_external_content(base_name, str(self.build_dir), base_name + '.md',
+                                                overload_settings=True, parallel=True)
+            self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual([(r.format, r.success) for r in reports], [('html', True), ('epub', False), ('pdf', False)])
+        self.assertEqual(reports[1].error, 'no epub')
+        self.assertEqual(reports[2].error, 'timeout after 1s')
+        self.assertEqual(Path(base_name + '.html').read_text(), 'html')
+
+        # the command started by the stopped publicator is killed too
+        stat_path = Path('/proc', pid_path.read_text(), 'stat')
+        deadline = time.monotonic() + 5
+        while stat_path.exists() and stat_path.read_text().split()[2] != 'Z' and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(stat_path.exists() and stat_path.read_text().split()[2] != 'Z')
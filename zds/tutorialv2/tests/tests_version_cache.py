@@ -0,0 +1,107 @@
+import os
+
+from django.test import TestCase
+
+from zds.member.factories import ProfileFactory
+from zds.tutorialv2.factories import PublishableContentFactory, ContainerFactory, ExtractFactory, \
+    PublishedContentFactory
+from zds.tutorialv2.models.database import PublishableContent
+from zds.tutorialv2.models.versioned import PublicContent
+from zds.tutorialv2.publication_utils import publish_content, unpublish_content
+from zds.tutorialv2.tests import TutorialTestMixin, override_for_contents
+from zds.tutorialv2.version_cache import VersionCache, draft_versions, is_commit_sha, public_versions, \
+    load_public_tree, PUBLIC_TREE_FILE
+
+
+@override_for_contents()
+class VersionCacheTests(TutorialTestMixin, TestCase):
+    def setUp(self):
+        self.tuto = PublishableContentFactory(type='TUTORIAL', author_list=[ProfileFactory().user])
+        versioned = self.tuto.load_version()
+        self.chapter = ContainerFactory(parent=versioned, db_object=self.tuto)
+        ExtractFactory(container=self.chapter, db_object=self.tuto)
+        self.tuto = PublishableContent.objects.get(pk=self.tuto.pk)
+        draft_versions.clear()
+        public_versions.clear()
+
+    def tearDown(self):
+        draft_versions.clear()
+        public_versions.clear()
+        super().tearDown()
+
+    def test_load_version(self):
+        versioned = self.tuto.load_version()
+        self.assertEqual(draft_versions.get_stats()['misses'], 1)
+
+        # the copies can be modified without altering the cached version
+        chapter = versioned.children[0]
+        chapter.title = 'Changed'
+        chapter.children[0].container = None
+        chapter.children.pop()
+        versioned.children_dict.clear()
+        self.assertEqual(versioned.pk, self.tuto.pk)
+
+        cached = self.tuto.load_version()
+        stats = draft_versions.get_stats()
+        self.assertEqual((stats['hits'], stats['entries'], stats['nodes']), (1, 1, 3))
+        chapter = cached.children_dict[self.chapter.slug]
+        self.assertIs(chapter, cached.children[0])
+        self.assertEqual(chapter.title, self.chapter.title)
+        self.assertIs(chapter.parent, cached)
+        self.assertIs(chapter.children[0].container, chapter)
+        self.assertEqual(chapter.children[0].get_text(), self.chapter.children[0].get_text())
+        self.assertEqual(cached.licence, self.tuto.licence)
+        self.assertEqual(cached.pk, self.tuto.pk)
+
+        # a branch may change
+        self.tuto.load_version('HEAD')
+        self.assertEqual(draft_versions.get_stats()['entries'], 1)
+
+    def test_limits(self):
+        cache = VersionCache(max_entries=2, max_nodes=5)
+        versioned = self.tuto.load_version()
+        cache.set('a', versioned)
+        cache.set('b', versioned.children[0])
+        self.assertIsNotNone(cache.get('a'))
+        cache.set('c', versioned.children[0])  # too many nodes: 'b' is the least recently used
+        self.assertIsNone(cache.get('b'))
+        cache.set('d', versioned.children[0])  # too many entries
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get_stats(), {'entries': 2, 'nodes': 4, 'hits': 1, 'misses': 2, 'evictions': 2})
+
+        VersionCache(max_entries=1, max_nodes=2).set('a', versioned)  # larger than the cache
+        disabled = VersionCache(max_entries=0, max_nodes=10)
+        self.assertIs(disabled.get_or_build('a', lambda: versioned), versioned)
+        self.assertEqual(disabled.get_stats()['entries'], 0)
+
+    def test_is_commit_sha(self):
+        self.assertTrue(is_commit_sha(self.tuto.sha_draft))
+        self.assertFalse(is_commit_sha('HEAD'))
+        self.assertFalse(is_commit_sha(self.tuto.sha_draft[:7]))
+        self.assertFalse(is_commit_sha(None))
+
+    def test_load_public_version(self):
+        published = PublishedContentFactory(author_list=[ProfileFactory().user])
+        public_version = published.public_version
+        tree = load_public_tree(public_version.get_prod_path())
+        self.assertIsInstance(tree, PublicContent)
+        self.assertEqual(tree.title, published.title)
+
+        os.remove(os.path.join(public_version.get_prod_path(), PUBLIC_TREE_FILE))  # the manifest is used instead
+        public_versions.clear()
+        public_version.load_public_version()
+        versioned = public_version.load_public_version()
+        self.assertEqual((public_versions.get_stats()['misses'], public_versions.get_stats()['hits']), (1, 1))
+        self.assertIsInstance(versioned, PublicContent)
+        self.assertEqual(versioned.licence, published.licence)
+        self.assertEqual((versioned.slug, versioned.introduction, versioned.type),
+                         (tree.slug, tree.introduction, tree.type))
+
+        # a new publication is in a new directory
+        published = PublishableContent.objects.get(pk=published.pk)
+        public_version = publish_content(published, published.load_version(), False)
+        public_version.load_public_version()
+        self.assertEqual(public_versions.get_stats()['entries'], 1)  # the previous version was removed
+
+        unpublish_content(published)
+        self.assertEqual(public_versions.get_stats()['entries'], 0)
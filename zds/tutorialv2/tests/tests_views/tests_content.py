@@ -1385,7 +1385,7 @@ class ContentTests(TutorialTestMixin, TestCase):
         self.assertEqual(result.status_code, 200)
         draft_zip_path = os.path.join(tempfile.gettempdir(), '__draft1.zip')
         f = open(draft_zip_path, 'wb')
-        f.write(result.content)
+        f.write(b''.join(result.streaming_content))
         f.close()
 
         versioned = PublishableContent.objects.get(pk=tuto_pk).load_version()
@@ -1439,7 +1439,7 @@ class ContentTests(TutorialTestMixin, TestCase):
         self.assertEqual(result.status_code, 200)
         draft_zip_path_2 = os.path.join(tempfile.gettempdir(), '__draft2.zip')
         f = open(draft_zip_path_2, 'wb')
-        f.write(result.content)
+        f.write(b''.join(result.streaming_content))
         f.close()
 
         versioned = PublishableContent.objects.get(pk=tuto_pk).load_version()
@@ -1467,7 +1467,7 @@ class ContentTests(TutorialTestMixin, TestCase):
         self.assertEqual(result.status_code, 200)
         draft_zip_path_3 = os.path.join(tempfile.gettempdir(), '__draft3.zip')
         f = open(draft_zip_path_3, 'wb')
-        f.write(result.content)
+        f.write(b''.join(result.streaming_content))
         f.close()
 
         archive = zipfile.ZipFile(draft_zip_path_3, 'r')
@@ -1559,7 +1559,7 @@ class ContentTests(TutorialTestMixin, TestCase):
         self.assertEqual(result.status_code, 200)
         draft_zip_path = os.path.join(tempfile.gettempdir(), '__draft1.zip')
         f = open(draft_zip_path, 'wb')
-        f.write(result.content)
+        f.write(b''.join(result.streaming_content))
         f.close()
 
         first_version = PublishableContent.objects.get(pk=tuto_pk).load_version()
@@ -1695,7 +1695,7 @@ class ContentTests(TutorialTestMixin, TestCase):
         self.assertEqual(result.status_code, 200)
         draft_zip_path = os.path.join(tempfile.gettempdir(), '__draft1.zip')
         f = open(draft_zip_path, 'wb')
-        f.write(result.content)
+        f.write(b''.join(result.streaming_content))
         f.close()
 
         first_version = PublishableContent.objects.get(pk=tuto_pk).load_version()
@@ -1809,7 +1809,7 @@ class ContentTests(TutorialTestMixin, TestCase):
         self.assertEqual(result.status_code, 200)
         draft_zip_path = os.path.join(tempfile.gettempdir(), '__draft1.zip')
         f = open(draft_zip_path, 'wb')
-        f.write(result.content)
+        f.write(b''.join(result.streaming_content))
         f.close()
 
         # create the archive with images:
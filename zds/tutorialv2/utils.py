@@ -1,6 +1,7 @@
 from collections import OrderedDict, namedtuple
 import os
 import logging
+import contextlib
 from urllib.parse import urlsplit, urlunsplit, quote
 from django.contrib.auth.models import User
 from django.http import Http404
@@ -12,9 +13,11 @@ from django.conf import settings
 from zds.notification import signals
 from zds.tutorialv2 import VALID_SLUG
 from zds.tutorialv2.models import CONTENT_TYPE_LIST
+from zds.tutorialv2.repositories import get_repository
 from zds.utils import get_current_user
 from zds.utils import slugify as old_slugify
 from zds.utils.models import Licence
+from zds.utils.zip_stream import iter_zip
 logger = logging.getLogger(__name__)
 
 
@@ -633,7 +636,7 @@ def clone_repo(old_path, new_path):
     """
     if not os.path.isdir(new_path):
         os.makedirs(new_path, mode=0o777)
-    old_repo = Repo(old_path)
+    old_repo = get_repository(old_path)
     new_repo = old_repo.clone(new_path)
     return new_repo
 
@@ -750,33 +753,99 @@ class InvalidOperationError(RuntimeError):
     pass
 
 
+def find_blob(tree, path):
+    """Find the blob of a file by following its path through the git trees, without walking the other ones.
+
+    :param tree: the root tree of a commit
+    :type tree: git.objects.tree.Tree
+    :param path: path of the file, relative to the root of the repository
+    :type path: str
+    :return: the blob, or ``None`` if there is no such file (or if ``path`` is a directory)
+    :rtype: git.objects.blob.Blob
+    """
+    # same paths as the ones which ``os.path.abspath`` would make equal
+    path = os.path.normpath(path)
+    if os.path.isabs(path) or path == '.' or path.startswith('..'):
+        return None
+    try:
+        item = tree / path
+    except KeyError:
+        return None
+    return item if item.type == 'blob' else None
+
+
 def get_blob(tree, path):
     """Return the data contained into a given file
 
-    :param tree: Git Tree object
+    :param tree: the root tree of a commit
     :type tree: git.objects.tree.Tree
     :param path: Path to file
     :type path: str
-    :return: contains
-    :rtype: bytearray
+    :return: the content of the file, ``None`` if there is no such file, or ``''`` if it cannot be read
+    :rtype: str
     """
-    # get all extracts
-    for blob in tree.blobs:
-        try:
-            if os.path.abspath(blob.path) == os.path.abspath(path):
-                data = blob.data_stream.read().decode()
-                return data
-        except OSError:  # in case of deleted files, or the system cannot get the lock, juste return ""
-            return ''
-    # traverse directories when we are at root or in a part or chapter
-    if len(tree.trees) > 0:
-        for subtree in tree.trees:
-            result = get_blob(subtree, path)
-            if result is not None:
-                return result
-        return None
-    else:
+    blob = find_blob(tree, path)
+    if blob is None:
         return None
+    try:
+        return blob.data_stream.read().decode()
+    except OSError:  # in case of deleted files, or the system cannot get the lock, juste return ""
+        return ''
+
+
+def normalize_blob_path(path):
+    """
+    :param path: path of a file of a content, as found in its manifest
+    :return: the path of the corresponding git blob
+    :rtype: str
+    """
+    return os.path.normpath(path.replace('\\', '/')).replace('\\', '/')
+
+
+def get_blob_shas(repository, sha):
+    """Get the SHA of all the files of a version, without reading them.
+
+    :param repository: repository of the content
+    :type repository: git.Repo
+    :param sha: the commit
+    :type sha: str
+    :return: the SHA of the git blob of each file, by path (see ``normalize_blob_path``)
+    :rtype: dict
+    """
+    return {item.path: item.hexsha for item in repository.commit(sha).tree.traverse() if item.type == 'blob'}
+
+
+def read_blobs(repository, blob_shas):
+    """Read several git blobs by their SHA, through the ``git cat-file --batch`` process of the repository (kept
+    by the repository pool), instead of looking up the path of each file through the trees.
+
+    :param repository: repository of the content
+    :type repository: git.Repo
+    :param blob_shas: the SHA of the blobs, see ``get_blob_shas``
+    :type blob_shas: collections.abc.Iterable[str]
+    :return: the content of each blob found, by SHA
+    :rtype: dict
+    """
+    contents = {}
+    for blob_sha in blob_shas:
+        # raises ValueError if the object is missing
+        with contextlib.suppress(ValueError):
+            contents[blob_sha] = repository.git.get_object_data(blob_sha)[3]
+    return contents
+
+
+def iter_version_zip(repository, sha):
+    """Build a zip archive of all the files of a version, read from their git blobs as the archive is written.
+
+    :param repository: repository of the content
+    :type repository: git.Repo
+    :param sha: the commit
+    :type sha: str
+    :return: the bytes of the archive, see ``zds.utils.zip_stream.iter_zip``
+    :rtype: collections.abc.Iterator[bytes]
+    """
+    blobs = (item for item in repository.commit(sha).tree.traverse() if item.type == 'blob')
+    return iter_zip((blob.path, blob.size, blob.data_stream) for blob in blobs)
 
 
 class BadArchiveError(Exception):
@@ -0,0 +1,250 @@
+import logging
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from zds.tutorialv2.models.versioned import Extract
+from zds.tutorialv2.repositories import get_repository
+
+logger = logging.getLogger(__name__)
+
+COMMIT_SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+
+# file of a published version containing its pickled tree, see ``dump_public_tree``
+PUBLIC_TREE_FILE = 'manifest.pickle'
+# to increase when the attributes of the containers and extracts change, so that the old files are ignored
+PUBLIC_TREE_FORMAT = 1
+
+
+def is_commit_sha(sha):
+    """
+    :param sha: a git revision
+    :return: ``True`` if it is the (full) sha of a commit, so that it always designates the same version
+    :rtype: bool
+    """
+    return isinstance(sha, str) and COMMIT_SHA_RE.match(sha) is not None
+
+
+def count_nodes(container):
+    """
+    :param container: a container
+    :return: the number of containers and extracts of the tree, including ``container``
+    :rtype: int
+    """
+    return 1 + sum(count_nodes(child) if not isinstance(child, Extract) else 1 for child in container.children)
+
+
+def copy_tree(node, parent=None):
+    """
+    Copy the containers and extracts of a tree, so that the copy can be modified without altering the original.
+    This is much cheaper than ``copy.deepcopy`` (or than parsing the manifest again), since the attributes of the
+    nodes (titles, slugs, paths...) are immutable and are shared.
+
+    :param node: a container (or an extract)
+    :param parent: the (copied) parent of the copy
+    :return: the copy
+    """
+    cpy = object.__new__(node.__class__)
+    cpy.__dict__.update(node.__dict__)
+    if isinstance(node, Extract):
+        cpy.container = parent
+        return cpy
+    if parent is not None:
+        cpy.parent = parent
+    cpy.slug_pool = dict(node.slug_pool)
+    copies = {}
+    cpy.children = []
+    for child in node.children:
+        copies[id(child)] = copy_tree(child, cpy)
+        cpy.children.append(copies[id(child)])
+    cpy.children_dict = {slug: copies.get(id(child), child) for slug, child in node.children_dict.items()}
+    return cpy
+
+
+class VersionCache:
+    """
+    Bounded LRU cache of the versions of contents (``VersionedContent`` trees built from a manifest), to avoid
+    reading and parsing the manifest, and building the tree, each time the same version is displayed.
+
+    The cached trees are never given away: ``get`` and ``set`` make a copy (see ``copy_tree``), so that the callers
+    can still modify the versions they got. The git repository of a version is not kept in the cache, but opened
+    again for each copy.
+
+    The cache is bounded both by its number of versions and by their total number of containers and extracts, so
+    that a few huge tutorials do not use as much memory as hundreds of articles.
+    """
+
+    def __init__(self, max_entries=None, max_nodes=None):
+        """
+        :param max_entries: maximum number of versions, 0 to disable the cache (defaults to the
+            ``ZDS_APP['content']['version_cache']`` settings)
+        :param max_nodes: maximum number of containers and extracts of all the versions (defaults to the settings)
+        """
+        self._max_entries = max_entries
+        self._max_nodes = max_nodes
+        self._entries = OrderedDict()
+        self._nodes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return settings.ZDS_APP['content'].get('version_cache', {}).get('max_entries', 0)
+
+    @property
+    def max_nodes(self):
+        if self._max_nodes is not None:
+            return self._max_nodes
+        return settings.ZDS_APP['content'].get('version_cache', {}).get('max_nodes', 0)
+
+    def get(self, key):
+        """
+        :param key: the key of the version, for instance the path of its repository and its sha
+        :return: a copy of the cached version, or ``None`` if it is not in the cache
+        :rtype: zds.tutorialv2.models.versioned.VersionedContent
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self._copy(entry[0])
+
+    def set(self, key, versioned):
+        """
+        Put a copy of ``versioned`` in the cache (unless it is larger than the cache), evicting the least recently
+        used versions if needed.
+
+        :param key: the key of the version
+        :param versioned: the version
+        """
+        max_entries, max_nodes = self.max_entries, self.max_nodes
+        nodes = count_nodes(versioned)
+        if max_entries <= 0 or nodes > max_nodes:
+            return
+        template = copy_tree(versioned)
+        template.__dict__.pop('repository', None)
+        with self._lock:
+            if key in self._entries:
+                self._nodes -= self._entries.pop(key)[1]
+            self._entries[key] = (template, nodes)
+            self._nodes += nodes
+            while len(self._entries) > max_entries or self._nodes > max_nodes:
+                evicted_key, (_, evicted_nodes) = self._entries.popitem(last=False)
+                self._nodes -= evicted_nodes
+                self.evictions += 1
+                logger.debug('version %s evicted from the cache', evicted_key)
+
+    def get_or_build(self, key, build):
+        """
+        :param key: the key of the version
+        :param build: a function without arguments, building the version if it is not in the cache
+        :return: the version, from the cache or newly built (and then cached)
+        :rtype: zds.tutorialv2.models.versioned.VersionedContent
+        """
+        versioned = self.get(key)
+        if versioned is None:
+            versioned = build()
+            self.set(key, versioned)
+        return versioned
+
+    def invalidate(self, predicate):
+        """
+        Remove the versions whose key matches.
+
+        :param predicate: a function of the key, returning ``True`` for the versions to remove
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._nodes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nodes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def get_stats(self):
+        """
+        :return: the number of versions and nodes in the cache, and the hits, misses and evictions so far
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'nodes': self._nodes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    @staticmethod
+    def _copy(template):
+        return open_repository(copy_tree(template))
+
+
+def open_repository(versioned):
+    """
+    Open the repository of a version which was kept without it, as in ``VersionedContent.__init__``.
+
+    :param versioned: the version
+    :return: the version
+    """
+    if versioned.slug != '' and os.path.exists(versioned.get_path()):
+        versioned.repository = get_repository(versioned.get_path())
+    return versioned
+
+
+def pickle_public_versions():
+    return settings.ZDS_APP['content'].get('version_cache', {}).get('pickle_public_versions', False)
+
+
+def dump_public_tree(versioned, directory):
+    """
+    Write the tree of a public version in the directory of the version, in a form faster to load than its manifest
+    (no JSON to parse, no slugs to check).
+
+    :param versioned: the public version, as built from its manifest
+    :type versioned: zds.tutorialv2.models.versioned.PublicContent
+    :param directory: the directory of the version
+    """
+    template = copy_tree(versioned)
+    template.__dict__.pop('repository', None)
+    with open(os.path.join(directory, PUBLIC_TREE_FILE), 'wb') as f:
+        pickle.dump((PUBLIC_TREE_FORMAT, template), f, pickle.HIGHEST_PROTOCOL)
+
+
+def load_public_tree(directory):
+    """
+    :param directory: the directory of a public version
+    :return: the tree written by ``dump_public_tree``, or ``None`` if there is none (or if it cannot be read). Its
+        licence is the one at the time of the publication.
+    :rtype: zds.tutorialv2.models.versioned.PublicContent
+    """
+    try:
+        with open(os.path.join(directory, PUBLIC_TREE_FILE), 'rb') as f:
+            tree_format, versioned = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError, ValueError):
+        logger.warning('could not load %s from %s', PUBLIC_TREE_FILE, directory, exc_info=True)
+        return None
+    if tree_format != PUBLIC_TREE_FORMAT:
+        return None
+    return open_repository(versioned)
+
+
+# versions of the drafts (and of the beta and validation versions), keyed by path of the repository and sha
+draft_versions = VersionCache()
+# public versions, keyed by pk of the content, sha and real path of the version (which changes at each publication)
+public_versions = VersionCache()
@@ -266,14 +266,8 @@ class DownloadOnlineContent(SingleOnlineContentViewMixin, DownloadViewMixin):
     def get_filename(self):
         return self.public_content_object.content_public_slug + '.' + self.requested_file
 
-    def get_contents(self):
-        path = os.path.join(self.public_content_object.get_extra_contents_directory(), self.get_filename())
-        try:
-            response = open(path, 'rb').read()
-        except OSError:
-            raise Http404("Le fichier n'existe pas.")
-
-        return response
+    def get_file_path(self):
+        return os.path.join(self.public_content_object.get_extra_contents_directory(), self.get_filename())
 
 
 class DownloadOnlineArticle(DownloadOnlineContent):
@@ -0,0 +1,175 @@
+import abc
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def get_etag(stat):
+    """
+    :param stat: result of ``os.stat`` on the file
+    :return: a strong ETag, computed (like nginx) from the modification date and the size of the file
+    :rtype: str
+    """
+    return '"{:x}-{:x}"'.format(int(stat.st_mtime), stat.st_size)
+
+
+def parse_range(header, size):
+    """
+    :param header: value of the ``Range`` header, only a single range of bytes is supported
+    :param size: size of the file
+    :return: ``(start, end)`` (``end`` included), or ``None`` if the header is not supported (the whole file is
+        then sent)
+    :rtype: tuple
+    :raise ValueError: if the range cannot be satisfied
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':  # the last bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def _iter_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class FileServingBackend(abc.ABC):
+    """
+    Send a file of the disk in a response. The backend is set by ``ZDS_APP['site']['file_serving']``.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    @abc.abstractmethod
+    def serve(self, request, file_path, content_type, headers=None):
+        """
+        :param request: the request
+        :param file_path: the absolute path of the file
+        :param content_type: the ``Content-Type`` of the response
+        :param headers: other headers of the response (``Content-Disposition``...)
+        :type headers: dict
+        :rtype: django.http.HttpResponse
+        :raise Http404: if the file does not exist
+        """
+
+    @staticmethod
+    def _stat(file_path):
+        try:
+            return os.stat(str(file_path))
+        except OSError:
+            raise Http404("Le fichier n'existe pas.")
+
+    @staticmethod
+    def _add_headers(response, headers):
+        for name, value in (headers or {}).items():
+            response[name] = value
+        return response
+
+
+class FileResponseBackend(FileServingBackend):
+    """
+    Send the file from Django with a ``FileResponse`` (which the WSGI server may send with ``sendfile``), with
+    ``ETag``, ``Last-Modified`` and ``Range`` support.
+    """
+
+    def serve(self, request, file_path, content_type, headers=None):
+        stat = self._stat(file_path)
+        etag = get_etag(stat)
+        conditional_response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if conditional_response is not None:
+            return self._add_headers(conditional_response, {'ETag': etag})
+
+        try:
+            file = open(str(file_path), 'rb')
+        except OSError:
+            raise Http404("Le fichier n'existe pas.")
+
+        byte_range = None
+        # a range of an outdated version of the file is not wanted
+        if 'HTTP_IF_RANGE' not in request.META or request.META['HTTP_IF_RANGE'] == etag:
+            try:
+                byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+            except ValueError:
+                file.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{}'.format(stat.st_size)
+                return response
+
+        if byte_range is None:
+            response = FileResponse(file, content_type=content_type)
+            response['Content-Length'] = stat.st_size
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(_iter_range(file, start, end - start + 1), status=206,
+                                             content_type=content_type)
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, stat.st_size)
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        return self._add_headers(response, headers)
+
+
+class XSendfileBackend(FileServingBackend):
+    """
+    Let the front server (Apache ``mod_xsendfile``, lighttpd...) send the file, with the ``X-Sendfile`` header.
+    """
+
+    header = 'X-Sendfile'
+
+    def get_header_value(self, file_path):
+        return str(file_path)
+
+    def serve(self, request, file_path, content_type, headers=None):
+        self._stat(file_path)
+        response = HttpResponse(content_type=content_type)
+        response[self.header] = self.get_header_value(file_path)
+        return self._add_headers(response, headers)
+
+
+class XAccelRedirectBackend(XSendfileBackend):
+    """
+    Let nginx send the file, with the ``X-Accel-Redirect`` header. The files under the ``root`` option are
+    expected to be served by nginx in the internal ``location`` option.
+    """
+
+    header = 'X-Accel-Redirect'
+
+    def get_header_value(self, file_path):
+        relative_path = os.path.relpath(str(file_path), str(self.options['root']))
+        if relative_path.startswith('..'):
+            raise ValueError('{} is not in {}'.format(file_path, self.options['root']))
+        return self.options['location'].rstrip('/') + '/' + Path(relative_path).as_posix()
+
+
+def get_file_serving_backend():
+    """
+    :return: the backend set by ``ZDS_APP['site']['file_serving']``
+    :rtype: FileServingBackend
+    """
+    config = settings.ZDS_APP['site'].get('file_serving', {})
+    backend_class = import_string(config.get('backend', 'zds.utils.file_serving.FileResponseBackend'))
+    return backend_class(**config.get('options', {}))
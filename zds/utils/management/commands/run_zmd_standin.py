@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+
+from zds.utils.zmd.standin import StandinZmdServer
+
+
+class Command(BaseCommand):
+    help = 'Run a lightweight stand-in for the zmarkdown server (it does not really render markdown)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=27272)
+        parser.add_argument('--latency', type=float, default=0, help='seconds waited before each answer')
+        parser.add_argument('--latency-jitter', type=float, default=0,
+                            help='maximum number of seconds randomly added to the latency')
+        parser.add_argument('--failure-rate', type=float, default=0,
+                            help='proportion of the requests answered with a 500 error, between 0 and 1')
+
+    def handle(self, *args, **options):
+        server = StandinZmdServer(options['host'], options['port'],
+                                  latency=options['latency'],
+                                  latency_jitter=options['latency_jitter'],
+                                  failure_rate=options['failure_rate'])
+        self.stdout.write('zmarkdown stand-in listening on {}'.format(server.url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,51 @@
+from django.core.management import BaseCommand
+
+from zds import json_handler
+from zds.utils.models import Comment
+from zds.utils.templatetags.emarkdown import render_markdown_batch, MD_PARSING_ERROR
+from zds.utils.zmd.breaker import zmd_breaker
+
+
+class Command(BaseCommand):
+    help = 'Store the pinged usernames of the comments saved before they were stored, so that editing them ' \
+           'only needs one rendering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='number of comments rendered and saved together')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        failed = 0
+        last_pk = 0
+
+        while True:
+            # the comments whose rendering failed keep no pings: they are skipped (by pk) and tried again next time
+            comments = list(Comment.objects.filter(pings__isnull=True, pk__gt=last_pk)
+                            .order_by('pk').only('pk', 'text')[:batch_size])
+            if not comments:
+                break
+            last_pk = comments[-1].pk
+
+            rendered = render_markdown_batch([comment.text for comment in comments])
+            if zmd_breaker.is_open():
+                # the fallbacks do not contain any ping, do not store them
+                self.stderr.write('The markdown server is down, stopping')
+                break
+
+            rendered_comments = []
+            for comment, fragment in zip(comments, rendered):
+                if fragment.error is not None or str(MD_PARSING_ERROR) in fragment.content:
+                    failed += 1
+                    continue
+                comment.pings = json_handler.dumps(fragment.metadata.get('ping', []))
+                rendered_comments.append(comment)
+            Comment.objects.bulk_update(rendered_comments, ['pings'])
+
+            total += len(rendered_comments)
+            self.stdout.write('{} comments processed'.format(total))
+
+        self.stdout.write('Done, pings of {} comments stored'.format(total))
+        if failed:
+            self.stderr.write('The rendering of {} comments failed, their pings were not stored'.format(failed))
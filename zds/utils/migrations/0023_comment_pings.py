@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utils', '0021_auto_20180826_1616'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='pings',
+            field=models.TextField(blank=True, null=True, verbose_name='Membres mentionnés'),
+        ),
+    ]
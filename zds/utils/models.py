@@ -18,13 +18,14 @@ from django.template.loader import render_to_string
 
 from easy_thumbnails.fields import ThumbnailerImageField
 
+from zds import json_handler
 from zds.notification import signals
 from zds.mp.models import PrivateTopic
 from zds.tutorialv2.models import TYPE_CHOICES, TYPE_CHOICES_DICT
 from zds.utils.mps import send_mp
 from zds.utils import slugify
 from zds.utils.misc import contains_utf8mb4
-from zds.utils.templatetags.emarkdown import render_markdown
+from zds.utils.templatetags.emarkdown import render_markdown, MD_PARSING_ERROR
 
 from model_utils.managers import InheritanceManager
 
@@ -368,6 +369,8 @@ class Comment(models.Model):
 
     text = models.TextField('Texte')
     text_html = models.TextField('Texte en Html')
+    # JSON list of the usernames pinged in ``text``, ``None`` if not stored yet (see ``store_comment_pings``)
+    pings = models.TextField('Membres mentionnés', null=True, blank=True)
 
     like = models.IntegerField('Likes', default=0)
     dislike = models.IntegerField('Dislikes', default=0)
@@ -388,11 +391,31 @@ class Comment(models.Model):
     hat = models.ForeignKey(Hat, verbose_name='Casquette', on_delete=models.SET_NULL,
                             related_name='comments', blank=True, null=True)
 
+    def get_pinged_usernames(self):
+        """Get the usernames pinged in the current text, rendering it only if they were not stored.
+
+        :return: the list of usernames, as returned by zmarkdown
+        :rtype: list
+        """
+        if self.pings is not None:
+            return json_handler.loads(self.pings)
+        if not self.text:
+            return []
+        _, metadata, _ = render_markdown(self.text)
+        return metadata.get('ping', [])
+
     def update_content(self, text, on_error=None):
-        _, old_metadata, _ = render_markdown(self.text)
+        old_pings = self.get_pinged_usernames()
         html, metadata, messages = render_markdown(text, on_error=on_error)
         self.text = text
         self.text_html = html
+        if str(MD_PARSING_ERROR) in html or (messages and not html):
+            # the rendering failed, so the pings are unknown: they are found again by the next edition, and nobody is
+            # pinged (or unpinged) meanwhile
+            self.pings = None
+            self.save()
+            return
+        self.pings = json_handler.dumps(metadata.get('ping', []))
         self.save()
 
         def filter_usernames(original_list):
@@ -405,7 +428,7 @@ class Comment(models.Model):
 
         max_pings_allowed = settings.ZDS_APP['comment']['max_pings']
         pinged_usernames_from_new_text = filter_usernames(metadata.get('ping', []))[:max_pings_allowed]
-        pinged_usernames_from_old_text = filter_usernames(old_metadata.get('ping', []))[:max_pings_allowed]
+        pinged_usernames_from_old_text = filter_usernames(old_pings)[:max_pings_allowed]
 
         pinged_usernames = set(pinged_usernames_from_new_text) - set(pinged_usernames_from_old_text)
         pinged_users = User.objects.filter(username__in=pinged_usernames)
@@ -1,7 +1,13 @@
 import re
 import json
 import logging
-from requests import post, HTTPError
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from requests import RequestException
 
 from django import template
 from django.conf import settings
@@ -9,6 +15,11 @@ from django.template.defaultfilters import stringfilter
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 
+from zds.utils.zmd.breaker import zmd_breaker
+from zds.utils.zmd.cache import render_cache
+from zds.utils.zmd.metrics import zmd_metrics
+from zds.utils.zmd.session import zmd_sessions
+
 logger = logging.getLogger(__name__)
 register = template.Library()
 """
@@ -27,9 +38,12 @@ FORMAT_ENDPOINTS = {
 }
 
 
-def _render_markdown_once(md_input, *, output_format='html', **kwargs):
+def _render_markdown_once(md_input, *, output_format='html', use_cache=True, **kwargs):
     """
-    Returns None on error (error details are logged). No retry mechanism.
+    Returns None as content on error, when it is worth retrying (error details are logged). No retry mechanism.
+
+    Successful renderings are stored in the render cache, unless ``use_cache`` is ``False``.
+    Requests are not sent while the circuit breaker is open. Those sent are measured, see ``zmd_metrics``.
     """
     def log_args():
         logger.error('md_input: {!r}'.format(md_input))
@@ -42,41 +56,70 @@ def _render_markdown_once(md_input, *, output_format='html', **kwargs):
 
     endpoint = FORMAT_ENDPOINTS[output_format]
 
-    try:
-        timeout = 10
-        if output_format.startswith('tex'):
-            # latex may be really long to generate but it is also restrained by server configuration
-            timeout = 120
-        response = post('{}{}'.format(settings.ZDS_APP['zmd']['server'], endpoint), json={
-            'opts': kwargs,
-            'md': str(md_input),
-        }, timeout=timeout)
-    except HTTPError:
-        logger.exception('An HTTP error happened, markdown rendering failed')
-        log_args()
-        return '', {}, []
-
-    if response.status_code == 413:
-        return '', {}, [{'message': str(_('Texte trop volumineux.'))}]
-
-    if response.status_code != 200:
-        logger.error('The markdown server replied with status {} (expected 200)'.format(response.status_code))
-        log_args()
-        return '', {}, []
+    if use_cache:
+        cached = render_cache.get(md_input, output_format, kwargs)
+        if cached is not None:
+            content, metadata, messages = cached
+            return mark_safe(content), metadata, messages
+
+    if not zmd_breaker.allow_request():
+        logger.warning('The markdown server is considered down, markdown rendering skipped')
+        return None, {}, []
 
     try:
-        content, metadata, messages = response.json()
-        logger.debug('Result %s, %s, %s', content, metadata, messages)
-        if messages:
-            logger.error('Markdown errors %s', json.dumps(messages))
-        content = content.strip()
-        if inline:
-            content = content.replace('</p>\n', '\n\n').replace('\n<p>', '\n')
-        return mark_safe(content), metadata, messages
-    except:  # noqa
-        logger.exception('Unexpected exception raised')
-        log_args()
-        return '', {}, []
+        md_input = str(md_input)
+        attempt = kwargs.get('attempts', 0)
+        start = time.perf_counter()
+        try:
+            # timeouts are configured per endpoint, see ``ZDS_APP['zmd']['session_pool']``
+            response = zmd_sessions.post(endpoint, json={
+                'opts': kwargs,
+                'md': md_input,
+            })
+        except RequestException:
+            zmd_metrics.record(output_format, time.perf_counter() - start, len(md_input), attempt=attempt)
+            zmd_breaker.record_failure()
+            logger.exception('An HTTP error happened, markdown rendering failed')
+            log_args()
+            return None, {}, []
+
+        zmd_metrics.record(output_format, time.perf_counter() - start, len(md_input), response.status_code, attempt)
+
+        if response.status_code >= 500:
+            zmd_breaker.record_failure()
+            logger.error('The markdown server replied with status {} (expected 200)'.format(response.status_code))
+            log_args()
+            return None, {}, []
+
+        zmd_breaker.record_success()
+
+        if response.status_code == 413:
+            return '', {}, [{'message': str(_('Texte trop volumineux.'))}]
+
+        if response.status_code != 200:
+            logger.error('The markdown server replied with status {} (expected 200)'.format(response.status_code))
+            log_args()
+            return '', {}, []
+
+        try:
+            content, metadata, messages = response.json()
+            logger.debug('Result %s, %s, %s', content, metadata, messages)
+            if messages:
+                logger.error('Markdown errors %s', json.dumps(messages))
+            content = content.strip()
+            if inline:
+                content = content.replace('</p>\n', '\n\n').replace('\n<p>', '\n')
+            if use_cache:
+                render_cache.set(md_input, output_format, kwargs, (content, metadata, messages))
+            return mark_safe(content), metadata, messages
+        except:  # noqa
+            logger.exception('Unexpected exception raised')
+            log_args()
+            return '', {}, []
+    finally:
+        # the probe of the half-open circuit must be released even if an unexpected exception was raised, otherwise
+        # no other request would ever be sent
+        zmd_breaker.release_probe()
 
 
 def render_markdown(md_input, *, on_error=None, **kwargs):
@@ -89,6 +132,10 @@ def render_markdown(md_input, *, on_error=None, **kwargs):
     string which explains that the Markdown rendering has failed
     (without any technical details).
 
+    Failed attempts are retried after a randomized, exponentially growing
+    delay, unless the circuit breaker is open: the fallback is then
+    returned immediately.
+
     """
     content, metadata, messages = _render_markdown_once(md_input, **kwargs)
     if messages and on_error:
@@ -102,20 +149,24 @@ def render_markdown(md_input, *, on_error=None, **kwargs):
     attempts = kwargs.get('attempts', 0)
     inline = kwargs.get('inline', False) is True
 
-    if attempts < MAX_ATTEMPTS:
+    if attempts < MAX_ATTEMPTS and not zmd_breaker.is_open():
         if not kwargs:
             kwargs = dict()
+        time.sleep(zmd_breaker.backoff(attempts))
         return render_markdown(md_input, **dict(kwargs, attempts=attempts + 1))
 
-    logger.error('Max attempt count reached, giving up')
+    if zmd_breaker.is_open():
+        logger.error('The markdown server is considered down, giving up')
+    else:
+        logger.error('Max attempt count reached, giving up')
     logger.error('md_input: {!r}'.format(md_input))
     logger.error('kwargs: {!r}'.format(kwargs))
 
     # FIXME: This cannot work with LaTeX.
     if inline:
-        return mark_safe('<p>{}</p>'.format(json.dumps(messages))), metadata, []
+        return mark_safe('<p>{}</p>'.format(MD_PARSING_ERROR)), metadata, []
     else:
-        return mark_safe('<div class="error ico-after"><p>{}</p></div>'.format(json.dumps(messages))), metadata, []
+        return mark_safe('<div class="error ico-after"><p>{}</p></div>'.format(MD_PARSING_ERROR)), metadata, []
 
 
 def render_markdown_stats(md_input, **kwargs):
@@ -131,10 +182,90 @@ def render_markdown_stats(md_input, **kwargs):
     return None
 
 
+RenderedFragment = namedtuple('RenderedFragment', ['content', 'metadata', 'messages', 'error'])
+
+_batch_executor = None
+_batch_executor_pid = None
+_batch_executor_lock = threading.Lock()
+
+
+def _get_batch_executor():
+    """
+    The executor is shared by all batches of the process, so that the number of concurrent requests sent to
+    zmarkdown stays bounded (and so does the number of keep-alive sessions, which are bound to threads).
+    """
+    global _batch_executor, _batch_executor_pid
+    with _batch_executor_lock:
+        if _batch_executor is None or _batch_executor_pid != os.getpid():
+            _batch_executor = ThreadPoolExecutor(max_workers=settings.ZDS_APP['zmd']['batch_workers'],
+                                                 thread_name_prefix='zmd-batch')
+            _batch_executor_pid = os.getpid()
+        return _batch_executor
+
+
+def _reset_batch_executor_after_fork():
+    # the threads of the executor are not forked, and its lock may have been held by another thread of the parent
+    global _batch_executor, _batch_executor_lock
+    _batch_executor = None
+    _batch_executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_batch_executor_after_fork)
+
+
+def _render_fragment(md_input, kwargs):
+    try:
+        return RenderedFragment(*render_markdown(md_input, **kwargs), None)
+    except Exception as e:
+        logger.exception('Markdown rendering of a fragment failed')
+        return RenderedFragment('', {}, [{'message': str(MD_PARSING_ERROR)}], e)
+
+
+def render_markdown_batch(fragments, **kwargs):
+    """Render several markdown strings with the same options.
+
+    Identical fragments are only rendered once, and distinct ones are sent concurrently to the zmarkdown
+    server, with at most ``ZDS_APP['zmd']['batch_workers']`` requests in flight for the whole process.
+
+    Returns a list of ``RenderedFragment(content, metadata, messages, error)``, in the order of
+    ``fragments``. ``error`` is the exception raised while rendering the fragment, if any: a failing
+    fragment does not prevent the other ones from being rendered.
+
+    :param fragments: markdown strings
+    :type fragments: list[str]
+    :param kwargs: options passed to ``render_markdown`` for each fragment
+    :rtype: list[RenderedFragment]
+    """
+    fragments = [str(fragment) for fragment in fragments]
+    unique_fragments = list(dict.fromkeys(fragments))
+    if len(unique_fragments) <= 1 or settings.ZDS_APP['zmd']['batch_workers'] <= 1:
+        results = [_render_fragment(fragment, kwargs) for fragment in unique_fragments]
+    else:
+        executor = _get_batch_executor()
+        results = list(executor.map(lambda fragment: _render_fragment(fragment, kwargs), unique_fragments))
+    rendered = dict(zip(unique_fragments, results))
+    return [rendered[fragment] for fragment in fragments]
+
+
+def epub_markdown_options(image_directory):
+    """
+    :param image_directory: a named tuple with the ``absolute`` and ``relative`` paths of the ebook image directory
+    :return: the options used to render markdown into an ebook
+    :rtype: dict
+    """
+    return {
+        'output_format': 'epub',
+        # no JSFiddle in the ebooks, as with the ``emarkdown`` filter formerly used by their templates
+        'disable_jsfiddle': True,
+        'images_download_dir': image_directory.absolute,
+        'local_url_to_local_path': [settings.MEDIA_URL + 'galleries/[0-9]+', image_directory.relative],
+    }
+
+
 @register.filter(name='epub_markdown', needs_autoescape=False)
 def epub_markdown(md_input, image_directory):
-    return emarkdown(md_input, output_format='epub', images_download_dir=image_directory.absolute,
-                     local_url_to_local_path=[settings.MEDIA_URL + 'galleries/[0-9]+', image_directory.relative])
+    return emarkdown(md_input, **epub_markdown_options(image_directory))
 
 
 @register.filter(needs_autoescape=False)
@@ -0,0 +1,10 @@
+class FakeResponse:
+    """A successful response of the zmarkdown server, to mock ``zmd_sessions.post``"""
+    status_code = 200
+
+    def __init__(self, content='<p>text</p>', metadata=None):
+        self.content = content
+        self.metadata = metadata or {}
+
+    def json(self):
+        return [self.content, self.metadata, []]
@@ -1,9 +1,10 @@
 from textwrap import dedent
 
+import mock
 from django.test import TestCase
 from django.template import Context, Template
 
-from zds.utils.templatetags.emarkdown import shift_heading
+from zds.utils.templatetags.emarkdown import shift_heading, render_markdown_batch
 
 
 class EMarkdownTest(TestCase):
@@ -48,6 +49,24 @@ class EMarkdownTest(TestCase):
         expected = '<p><a rel="nofollow" href="zestedesavoir.com">zds</a></p>'
         self.assertEqual(tr, expected)
 
+    def test_render_markdown_batch(self):
+        def fake_render(md_input, **kwargs):
+            if md_input == 'broken':
+                raise ValueError('zmarkdown is down')
+            return '<p>{}</p>'.format(md_input), {}, []
+
+        fragments = ['a', 'b', 'broken', 'a', 'c']
+        with mock.patch('zds.utils.templatetags.emarkdown.render_markdown', side_effect=fake_render) as render:
+            results = render_markdown_batch(fragments, inline=True)
+            # identical fragments are rendered once
+            self.assertEqual(render.call_count, 4)
+            self.assertEqual(render.call_args[1], {'inline': True})
+
+        self.assertEqual([result.content for result in results], ['<p>a</p>', '<p>b</p>', '', '<p>a</p>', '<p>c</p>'])
+        self.assertIsInstance(results[2].error, ValueError)
+        self.assertTrue(results[2].messages)
+        self.assertIsNone(results[0].error)
+
     def test_shift_heading(self):
         tr = Template('{% load emarkdown %}{{ content | shift_heading_1}}').render(self.context)
         self.assertEqual('## Titre 1\n\n'
@@ -0,0 +1,90 @@
+import os
+import tempfile
+from pathlib import Path
+
+from django.http import Http404
+from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
+from django.conf import settings
+
+from zds.utils.file_serving import FileServingBackend, FileResponseBackend, XAccelRedirectBackend, \
+    get_file_serving_backend, parse_range
+
+overridden_zds_app = dict(settings.ZDS_APP)
+overridden_zds_app['site'] = dict(settings.ZDS_APP['site'])
+overridden_zds_app['site']['file_serving'] = {
+    'backend': 'zds.utils.file_serving.XAccelRedirectBackend',
+    'options': {'root': '/opt/zds/data/contents-public', 'location': '/protected-contents/'},
+}
+
+
+class FileServingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / 'content.pdf'
+        self.data = os.urandom(100 * 1024)
+        self.path.write_bytes(self.data)
+        self.factory = RequestFactory()
+        self.backend = FileResponseBackend()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def serve(self, **headers):
+        return self.backend.serve(self.factory.get('/', **headers), self.path, 'application/pdf',
+                                  {'Content-Disposition': 'filename=content.pdf'})
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=900-2000', 1000), (900, 999))
+        self.assertIsNone(parse_range(None, 1000))
+        self.assertIsNone(parse_range('bytes=0-1,5-10', 1000))  # several ranges are not supported
+        with self.assertRaises(ValueError):
+            parse_range('bytes=1000-', 1000)
+
+    def test_backends_must_serve(self):
+        class IncompleteBackend(FileServingBackend):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+
+    def test_serve(self):
+        response = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Content-Disposition'], 'filename=content.pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        # not modified
+        self.assertEqual(self.serve(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.serve(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        with self.assertRaises(Http404):
+            self.backend.serve(self.factory.get('/'), self.path.with_name('missing.pdf'), 'application/pdf')
+
+    def test_serve_range(self):
+        response = self.serve(HTTP_RANGE='bytes=1000-1999')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.data[1000:2000])
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1999/{}'.format(len(self.data)))
+        self.assertEqual(response['Content-Length'], '1000')
+
+        # the file changed since the first part was downloaded: it is sent again
+        response = self.serve(HTTP_RANGE='bytes=1000-1999', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        self.assertEqual(self.serve(HTTP_RANGE='bytes={}-'.format(len(self.data))).status_code, 416)
+
+    @override_settings(ZDS_APP=overridden_zds_app)
+    def test_x_accel_redirect(self):
+        backend = get_file_serving_backend()
+        self.assertIsInstance(backend, XAccelRedirectBackend)
+        backend.options['root'] = self.directory.name
+        response = backend.serve(self.factory.get('/'), self.path, 'application/pdf')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-contents/content.pdf')
+        self.assertEqual(response.content, b'')
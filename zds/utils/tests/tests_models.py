@@ -1,11 +1,24 @@
+from io import StringIO
+
+import mock
+from requests import ConnectionError
+from django.core.management import call_command
 from django.test import TestCase
 from django.db import IntegrityError, transaction
 from django.contrib.auth.models import Group
 
+from zds import json_handler
+from zds.forum.factories import create_category_and_forum, create_topic_in_forum
 from zds.member.models import Profile
 from zds.member.factories import ProfileFactory
+from zds.notification import signals
 from zds.utils.forms import TagValidator
-from zds.utils.models import Tag, Hat
+from zds.utils.models import Tag, Hat, Comment
+from zds.utils.templatetags.emarkdown import RenderedFragment, MD_PARSING_ERROR
+from zds.utils.tests import FakeResponse
+from zds.utils.zmd.cache import render_cache
+from zds.utils.zmd.breaker import zmd_breaker
+from zds.utils.zmd.session import zmd_sessions
 
 
 class TagsTests(TestCase):
@@ -97,3 +110,73 @@ class TagsTests(TestCase):
         # The user shoudn't have the hat through their profile anymore
         profile = Profile.objects.get(pk=profile.pk)  # reload
         self.assertNotIn(hat, profile.hats.all())
+
+
+class CommentPingsTests(TestCase):
+    def setUp(self):
+        render_cache.clear(shared=True)
+        self.profile = ProfileFactory()
+        _, forum = create_category_and_forum()
+        topic = create_topic_in_forum(forum, self.profile)
+        self.post = topic.last_message
+
+    def test_edition_renders_only_the_new_text(self):
+        response = FakeResponse(metadata={'ping': ['someone']})
+        with mock.patch.object(zmd_sessions, 'post', return_value=response) as zmd_post:
+            # the pings of the old text were never stored: it is rendered again
+            self.post.update_content('@someone')
+            self.assertEqual(zmd_post.call_count, 2)
+            self.assertEqual(json_handler.loads(Comment.objects.get(pk=self.post.pk).pings), ['someone'])
+
+            self.post.update_content('@someone again')
+            self.assertEqual(zmd_post.call_count, 3)
+
+    def test_edition_while_the_rendering_fails(self):
+        pinged = ProfileFactory()
+        zmd_breaker.backoff_base, previous_backoff_base = 0, zmd_breaker.backoff_base
+        self.addCleanup(setattr, zmd_breaker, 'backoff_base', previous_backoff_base)
+        self.addCleanup(zmd_breaker.reset)
+        self.post.pings = json_handler.dumps([])
+        with mock.patch.object(signals.new_content, 'send') as ping:
+            response = FakeResponse(metadata={'ping': [pinged.user.username]})
+            with mock.patch.object(zmd_sessions, 'post', return_value=response):
+                self.post.update_content('@{}'.format(pinged.user.username))
+            self.assertEqual(ping.call_count, 1)
+
+            with mock.patch.object(zmd_sessions, 'post', side_effect=ConnectionError):
+                self.post.update_content('@{} and a failure'.format(pinged.user.username))
+            self.assertIsNone(Comment.objects.get(pk=self.post.pk).pings)
+
+            with mock.patch.object(zmd_sessions, 'post', return_value=response):
+                self.post.update_content('@{} again'.format(pinged.user.username))
+            # the user was pinged by the first edition only
+            self.assertEqual(ping.call_count, 1)
+            self.assertEqual(json_handler.loads(Comment.objects.get(pk=self.post.pk).pings),
+                             [pinged.user.username])
+
+    def test_store_comment_pings_command(self):
+        response = FakeResponse(metadata={'ping': ['someone']})
+        with mock.patch.object(zmd_sessions, 'post', return_value=response):
+            call_command('store_comment_pings', stdout=StringIO())
+        self.assertFalse(Comment.objects.filter(pings__isnull=True).exists())
+        self.assertEqual(json_handler.loads(Comment.objects.get(pk=self.post.pk).pings), ['someone'])
+
+    def test_store_comment_pings_command_skips_failed_renderings(self):
+        other_post = create_topic_in_forum(self.post.topic.forum, self.profile).last_message
+
+        def render(texts):
+            fragments = [RenderedFragment('<p>text</p>', {'ping': ['someone']}, [], None) for _ in texts]
+            fragments[0] = RenderedFragment('', {}, [{'message': str(MD_PARSING_ERROR)}], ValueError())
+            return fragments
+
+        stderr = StringIO()
+        with mock.patch('zds.utils.management.commands.store_comment_pings.render_markdown_batch', side_effect=render):
+            call_command('store_comment_pings', batch_size=1, stdout=StringIO(), stderr=stderr)
+        # each comment is in its own batch, so all of them failed and none is tried again in the same run
+        self.assertEqual(Comment.objects.filter(pings__isnull=True).count(), Comment.objects.count())
+        self.assertIn('The rendering of {} comments failed'.format(Comment.objects.count()), stderr.getvalue())
+
+        with mock.patch('zds.utils.management.commands.store_comment_pings.render_markdown_batch', side_effect=render):
+            call_command('store_comment_pings', stdout=StringIO(), stderr=StringIO())
+        self.assertIsNone(Comment.objects.get(pk=self.post.pk).pings)
+        self.assertEqual(json_handler.loads(Comment.objects.get(pk=other_post.pk).pings), ['someone'])
@@ -0,0 +1,82 @@
+import mock
+
+from django.test import TestCase, override_settings
+
+from zds.utils.templatetags.emarkdown import render_markdown
+from zds.utils.zmd.cache import RenderCache, LocalRenderCache, render_cache, render_cache_key
+from zds.utils.zmd.session import zmd_sessions
+from zds.utils.tests import FakeResponse
+
+
+class RenderCacheTests(TestCase):
+    def setUp(self):
+        self.previous_shared_cache = render_cache.shared_cache_name
+        render_cache.shared_cache_name = None
+        render_cache.clear()
+        render_cache.reset_stats()
+
+    def tearDown(self):
+        render_cache.shared_cache_name = self.previous_shared_cache
+        render_cache.clear()
+
+    def test_key_ignores_options_order(self):
+        self.assertEqual(render_cache_key('a', 'html', {'inline': True, 'disable_ping': True}),
+                         render_cache_key('a', 'html', {'disable_ping': True, 'inline': True}))
+        self.assertNotEqual(render_cache_key('a', 'html', {}), render_cache_key('a', 'tex', {}))
+        self.assertNotEqual(render_cache_key('a', 'html', {}), render_cache_key('b', 'html', {}))
+        self.assertEqual(render_cache_key('a', 'html', {}), render_cache_key('a', 'html', {'attempts': 2}))
+
+    def test_local_lru_eviction_and_ttl(self):
+        local = LocalRenderCache(max_size=2, ttl=60)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+        self.assertEqual(local.get('a'), 1)
+        self.assertIsNone(local.get('b'))
+        self.assertEqual(len(local), 2)
+
+        expired = LocalRenderCache(max_size=2, ttl=-1)
+        expired.set('a', 1)
+        self.assertIsNone(expired.get('a'))
+
+    def test_second_rendering_hits_the_cache(self):
+        with mock.patch.object(zmd_sessions, 'post', return_value=FakeResponse()) as post:
+            first = render_markdown('some **text**')
+            second = render_markdown('some **text**')
+            self.assertEqual(post.call_count, 1)
+            self.assertEqual(first[0], second[0])
+            render_markdown('some **text**', use_cache=False)
+            self.assertEqual(post.call_count, 2)
+        self.assertEqual(render_cache.stats['misses'], 1)
+        self.assertEqual(render_cache.stats['local_hits'], 1)
+
+    def test_cached_metadata_cannot_be_altered(self):
+        response = FakeResponse(metadata={'ping': ['admin']})
+        with mock.patch.object(zmd_sessions, 'post', return_value=response):
+            _, metadata, _ = render_markdown('@admin')
+            metadata['ping'].append('other')
+            _, metadata, _ = render_markdown('@admin')
+        self.assertEqual(metadata['ping'], ['admin'])
+
+    def test_renderings_with_side_effects_are_not_cached(self):
+        with mock.patch.object(zmd_sessions, 'post', return_value=FakeResponse()) as post:
+            render_markdown('text', output_format='epub', images_download_dir='/tmp/images')
+            render_markdown('text', output_format='epub', images_download_dir='/tmp/images')
+            self.assertEqual(post.call_count, 2)
+        self.assertEqual(render_cache.stats['bypassed'], 2)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_shared_tier(self):
+        cache = RenderCache(local_size=0, shared_cache='default', key_prefix='zmd-render-test')
+        cache.set('text', 'html', {}, ('<p>text</p>', {}, []))
+        self.assertEqual(cache.get('text', 'html', {}), ('<p>text</p>', {}, []))
+        self.assertEqual(cache.stats['shared_hits'], 1)
+        cache.clear()
+        self.assertIsNotNone(cache.get('text', 'html', {}))
+        cache.clear(shared=True)
+        self.assertIsNone(cache.get('text', 'html', {}))
+
+    def test_renderings_with_errors_are_not_cached(self):
+        render_cache.set('text', 'html', {}, ('<p>text</p>', {}, [{'message': 'error'}]))
+        self.assertIsNone(render_cache.get('text', 'html', {}))
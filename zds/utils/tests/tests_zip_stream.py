@@ -0,0 +1,28 @@
+import io
+import os
+import zipfile
+
+from django.test import TestCase
+
+from zds.utils.zip_stream import iter_zip
+
+
+class ZipStreamTests(TestCase):
+    def test_iter_zip(self):
+        image = os.urandom(200 * 1024)
+        files = [
+            ('manifest.json', 2, io.BytesIO(b'{}')),
+            ('images/image.png', len(image), io.BytesIO(image)),
+            ('chapter/text.md', None, io.BytesIO(b'text ' * 50000)),
+        ]
+        chunks = list(iter_zip(files, chunk_size=16 * 1024))
+        self.assertGreater(len(chunks), 10)
+        # bounded by the chunk size and the size of a compressed chunk
+        self.assertLess(max(len(chunk) for chunk in chunks), 3 * 16 * 1024)
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read('manifest.json'), b'{}')
+        self.assertEqual(archive.read('images/image.png'), image)
+        self.assertEqual(archive.getinfo('images/image.png').compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(archive.getinfo('chapter/text.md').compress_type, zipfile.ZIP_DEFLATED)
@@ -0,0 +1,148 @@
+import copy
+import logging
+import os
+
+from django.conf import settings
+from django.test import TestCase, tag
+from django.test.utils import override_settings
+
+from zds.member.factories import ProfileFactory
+from zds.tutorialv2.factories import PublishableContentFactory, ContainerFactory, ExtractFactory, LicenceFactory
+from zds.tutorialv2.publication_utils import publish_content
+from zds.tutorialv2.tests import TutorialTestMixin, override_for_contents
+from zds.utils.templatetags.emarkdown import emarkdown, render_markdown, render_markdown_stats, MD_PARSING_ERROR
+from zds.utils.zmd.benchmark import Benchmark, percentile
+from zds.utils.zmd.breaker import zmd_breaker
+from zds.utils.zmd.cache import render_cache
+from zds.utils.zmd.standin import StandinZmdServer
+
+logger = logging.getLogger(__name__)
+
+# p95 budgets (in seconds) of the stages, against the stand-in server without latency: several times the usual
+# measures, so that only real regressions make the benchmark fail
+BUDGETS = {
+    'emarkdown': 0.05,
+    'emarkdown (cached)': 0.005,
+    'render_markdown_stats': 0.05,
+    'publish_content': 2,
+}
+
+
+def zds_app_with_server(zds_app, server_url):
+    overridden = copy.deepcopy(zds_app)
+    overridden['zmd']['server'] = server_url
+    return overridden
+
+
+class StandinZmdServerTests(TestCase):
+    def setUp(self):
+        self.server = StandinZmdServer()
+        self.server.start()
+        render_cache.clear()
+        zmd_breaker.reset()
+        self.previous_backoff_base = zmd_breaker.backoff_base
+        zmd_breaker.backoff_base = 0
+
+    def tearDown(self):
+        self.server.stop()
+        zmd_breaker.backoff_base = self.previous_backoff_base
+        zmd_breaker.reset()
+
+    def test_render_with_standin(self):
+        with override_settings(ZDS_APP=zds_app_with_server(settings.ZDS_APP, self.server.url)):
+            content, metadata, _ = render_markdown('Hello @admin\n\nand **bye**')
+            self.assertEqual(content, '<p>Hello @admin</p>\n<p>and **bye**</p>')
+            self.assertEqual(metadata['ping'], ['admin'])
+            self.assertEqual(render_markdown_stats('12345'), 5)
+        self.assertEqual(self.server.requests, {'/html': 1, '/latex': 1})
+
+    def test_failure_injection(self):
+        self.server.failure_rate = 1
+        with override_settings(ZDS_APP=zds_app_with_server(settings.ZDS_APP, self.server.url)):
+            content, _, _ = render_markdown('will fail')
+        self.assertIn(str(MD_PARSING_ERROR), content)
+        self.assertEqual(self.server.requests['/html'], 4)
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+
+    def test_over_budget(self):
+        benchmark = Benchmark()
+        benchmark.timings['fast'] = [0.01] * 20
+        benchmark.timings['slow'] = [0.01] * 18 + [1, 1]
+        self.assertEqual(benchmark.over_budget({'fast': 0.1, 'slow': 0.1, 'other': 0}), [('slow', 1, 0.1)])
+
+
+@tag('benchmark')
+@override_for_contents()
+class MarkdownBenchmark(TutorialTestMixin, TestCase):
+    """
+    Measure the rendering pipeline, with ``make benchmark-back``.
+
+    A stand-in zmarkdown server is used, so that the overhead of the client is measured, and the p95 of each stage
+    is checked against ``BUDGETS``. Set ``ZDS_BENCHMARK_ZMD_SERVER`` to the URL of a real server to measure it
+    instead, and ``ZDS_BENCHMARK_LATENCY`` (in seconds) to simulate a slow server: the budgets are then not checked.
+    The render cache is bypassed, except by the stage measuring it.
+    """
+
+    iterations = int(os.environ.get('ZDS_BENCHMARK_ITERATIONS', 50))
+    publications = 5
+
+    def setUp(self):
+        self.server = None
+        server_url = os.environ.get('ZDS_BENCHMARK_ZMD_SERVER')
+        latency = float(os.environ.get('ZDS_BENCHMARK_LATENCY', 0))
+        if not server_url:
+            self.server = StandinZmdServer(latency=latency)
+            server_url = self.server.start()
+        self.check_budgets = self.server is not None and latency == 0
+        self.zds_app = zds_app_with_server(self.overridden_zds_app, server_url)
+        # only the rendering is measured, not the generation of the PDF or EPUB
+        self.zds_app['content']['extra_content_generation_policy'] = 'NOTHING'
+        render_cache.clear(shared=True)
+        zmd_breaker.reset()
+
+        self.author = ProfileFactory().user
+        self.content = PublishableContentFactory(type='TUTORIAL', author_list=[self.author])
+        self.content.licence = LicenceFactory()
+        self.content.save()
+        versioned = self.content.load_version()
+        for _ in range(2):
+            part = ContainerFactory(parent=versioned, db_object=self.content)
+            for _ in range(4):
+                chapter = ContainerFactory(parent=part, db_object=self.content)
+                for _ in range(3):
+                    ExtractFactory(container=chapter, db_object=self.content)
+        self.benchmark = Benchmark()
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.stop()
+        super().tearDown()
+        render_cache.clear(shared=True)
+
+    def test_markdown_pipeline(self):
+        text = 'Un paragraphe avec du **gras** et un lien vers [zds](https://zestedesavoir.com).\n\n' * 20
+        with override_settings(ZDS_APP=self.zds_app):
+            for i in range(self.iterations):
+                text_i = '{}\n\n{}'.format(text, i)
+                with self.benchmark.measure('emarkdown'):
+                    emarkdown(text_i, use_jsfiddle='', use_cache=False)
+                emarkdown(text_i, use_jsfiddle='')
+                with self.benchmark.measure('emarkdown (cached)'):
+                    emarkdown(text_i, use_jsfiddle='')
+                with self.benchmark.measure('render_markdown_stats'):
+                    render_markdown_stats(text_i, use_cache=False)
+
+            for _ in range(self.publications):
+                render_cache.clear(shared=True)
+                versioned = self.content.load_version()
+                with self.benchmark.measure('publish_content'):
+                    publish_content(self.content, versioned)
+
+        logger.info('markdown benchmark:\n%s', self.benchmark.format_report())
+        self.assertFalse(zmd_breaker.is_open(), 'some renderings failed')
+        if self.check_budgets:
+            self.assertEqual(self.benchmark.over_budget(BUDGETS), [], self.benchmark.format_report())
@@ -0,0 +1,136 @@
+import multiprocessing
+import threading
+
+import mock
+from django.test import TestCase
+from requests import ConnectionError
+
+from zds.utils.templatetags.emarkdown import render_markdown, render_markdown_batch, MD_PARSING_ERROR, MAX_ATTEMPTS
+from zds.utils.tests import FakeResponse
+from zds.utils.zmd.breaker import CircuitBreaker, zmd_breaker, CLOSED, OPEN, HALF_OPEN
+from zds.utils.zmd.cache import render_cache
+from zds.utils.zmd.session import zmd_sessions
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(TestCase):
+    def test_state_transitions(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        # a single probe is allowed once the reset timeout is elapsed
+        clock.now = 10
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+        clock.now = 20
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.stats(), {'state': CLOSED, 'failures': 0, 'opened': 2, 'rejected': 2})
+
+    def test_release_probe(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        breaker.release_probe()  # not probing: nothing to release
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+
+        # only the thread sending the probe releases it
+        thread = threading.Thread(target=breaker.release_probe)
+        thread.start()
+        thread.join()
+        self.assertFalse(breaker.allow_request())
+        breaker.release_probe()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+
+    def test_backoff_is_bounded(self):
+        breaker = CircuitBreaker(backoff_base=1, backoff_max=3)
+        for attempt in range(10):
+            self.assertTrue(0 <= breaker.backoff(attempt) <= min(3, 2 ** attempt))
+
+
+class RenderMarkdownWithBreakerTests(TestCase):
+    def setUp(self):
+        zmd_breaker.reset()
+        self.previous_config = (zmd_breaker.failure_threshold, zmd_breaker.backoff_base)
+        zmd_breaker.failure_threshold = MAX_ATTEMPTS + 1
+        zmd_breaker.backoff_base = 0
+
+    def tearDown(self):
+        zmd_breaker.failure_threshold, zmd_breaker.backoff_base = self.previous_config
+        zmd_breaker.reset()
+
+    def test_fast_fail_when_server_is_down(self):
+        with mock.patch.object(zmd_sessions, 'post', side_effect=ConnectionError) as post:
+            content, _, _ = render_markdown('server is down', use_cache=False)
+            self.assertIn(str(MD_PARSING_ERROR), content)
+            self.assertEqual(post.call_count, MAX_ATTEMPTS + 1)
+            self.assertEqual(zmd_breaker.state, OPEN)
+
+            # the circuit is open: nothing is sent anymore
+            content, _, _ = render_markdown('server is still down', use_cache=False)
+            self.assertIn(str(MD_PARSING_ERROR), content)
+            self.assertEqual(post.call_count, MAX_ATTEMPTS + 1)
+
+    def test_probe_released_after_unexpected_exception(self):
+        zmd_breaker.record_failure()
+        zmd_breaker._state, zmd_breaker._opened_at = OPEN, zmd_breaker.clock() - zmd_breaker.reset_timeout
+        self.assertEqual(zmd_breaker.state, HALF_OPEN)
+        with mock.patch.object(zmd_sessions, 'post', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                render_markdown('unexpected', use_cache=False)
+        with mock.patch.object(zmd_sessions, 'post', return_value=FakeResponse()) as post:
+            content, _, _ = render_markdown('probe', use_cache=False)
+            self.assertEqual(post.call_count, 1)
+        self.assertEqual(content, '<p>text</p>')
+        self.assertEqual(zmd_breaker.state, CLOSED)
+
+
+def _render_in_child(sender):
+    rendered = render_markdown_batch(['**text**'], use_cache=False)
+    sender.send((rendered[0].content, zmd_breaker.allow_request(), zmd_sessions.stats()['sessions']))
+    sender.close()
+
+
+class ForkTests(TestCase):
+    def test_locks_are_replaced_after_fork(self):
+        """A process forked while other threads hold the locks of the rendering must not wait for them forever"""
+        context = multiprocessing.get_context('fork')
+        receiver, sender = context.Pipe(duplex=False)
+        locks = [zmd_breaker._lock, zmd_sessions._lock, render_cache._lock, render_cache.local._lock]
+        with mock.patch.object(zmd_sessions, 'post', return_value=FakeResponse()):
+            render_markdown_batch(['started'], use_cache=False)  # the batch executor of the parent is running
+            for lock in locks:
+                lock.acquire()
+            try:
+                process = context.Process(target=_render_in_child, args=(sender,))
+                process.start()
+                sender.close()
+                process.join(10)
+            finally:
+                for lock in locks:
+                    lock.release()
+        if process.is_alive():
+            process.terminate()
+            self.fail('the forked process is blocked')
+        self.assertEqual(receiver.recv(), ('<p>text</p>', True, 0))
@@ -0,0 +1,67 @@
+import mock
+from django.test import TestCase
+from requests import ConnectionError
+
+from zds.utils.templatetags.emarkdown import render_markdown
+from zds.utils.tests import FakeResponse
+from zds.utils.zmd.breaker import zmd_breaker
+from zds.utils.zmd.metrics import RenderMetrics, MetricsSink, MemorySink, LoggingSink, RenderMeasure, zmd_metrics, \
+    DURATION_BUCKETS
+from zds.utils.zmd.session import zmd_sessions
+
+
+class RenderMetricsTests(TestCase):
+    def setUp(self):
+        zmd_metrics.reset()
+        zmd_breaker.reset()
+        self.previous_backoff_base = zmd_breaker.backoff_base
+        zmd_breaker.backoff_base = 0
+
+    def tearDown(self):
+        zmd_breaker.backoff_base = self.previous_backoff_base
+        zmd_breaker.reset()
+
+    def test_memory_sink_histogram(self):
+        sink = MemorySink()
+        sink.record(RenderMeasure('html', 0.001, 10, 200, 0, None))
+        sink.record(RenderMeasure('html', 60, 10, None, 1, None))
+        sink.record(RenderMeasure('tex', 0.3, 20, 200, 0, None))
+        stats = sink.stats('html')
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['buckets'][0], 1)
+        self.assertEqual(stats['buckets'][len(DURATION_BUCKETS)], 1)
+        self.assertEqual(sink.stats()['requests'], 3)
+        self.assertEqual(sink.stats()['input_size'], 40)
+
+    def test_each_request_is_measured(self):
+        sink = zmd_metrics.get_sink(MemorySink)
+        with mock.patch.object(zmd_sessions, 'post', return_value=FakeResponse()):
+            render_markdown('measured', use_cache=False)
+        with mock.patch.object(zmd_sessions, 'post', side_effect=ConnectionError):
+            render_markdown('not answered', use_cache=False)
+        stats = sink.stats('html')
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['errors'], 4)
+        self.assertEqual(stats['retries'], 3)
+
+    def test_slow_renderings_are_logged(self):
+        metrics = RenderMetrics(slow_threshold=1)
+        with self.assertLogs('zds.utils.zmd.metrics', level='WARNING') as logs:
+            metrics.record('html', 0.5, 10, 200)
+            metrics.record('tex', 1.5, 10, 200)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('(tex)', logs.output[0])
+
+    def test_sinks(self):
+        class IncompleteSink(MetricsSink):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteSink()
+        self.assertIsNone(zmd_metrics.get_sink(LoggingSink))
+        with self.assertLogs('zds.utils.zmd.metrics', level='DEBUG') as logs:
+            LoggingSink().record(RenderMeasure('html', 0.5, 10, 200, 0, None))
+        self.assertEqual(logs.records[0].levelname, 'DEBUG')
+        self.assertEqual(logs.records[0].zmd['input_size'], 10)
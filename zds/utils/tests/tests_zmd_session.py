@@ -0,0 +1,47 @@
+import threading
+import time
+
+import mock
+from django.test import TestCase
+
+from zds.utils.zmd.session import ZmdSessionPool, DEFAULT_TIMEOUT
+
+
+class ZmdSessionPoolTests(TestCase):
+    def test_one_session_per_thread(self):
+        pool = ZmdSessionPool(pool_size=2)
+        main_session = pool.get_session()
+        self.assertIs(main_session, pool.get_session())
+
+        other_sessions = []
+        ended = threading.Event()
+
+        def get_session():
+            other_sessions.append(pool.get_session())
+            ended.wait()
+
+        thread = threading.Thread(target=get_session)
+        thread.start()
+        while not other_sessions:
+            time.sleep(0.01)
+        self.assertIsNot(main_session, other_sessions[0])
+        self.assertEqual(pool.stats()['sessions'], 2)
+
+        # the session of a thread is closed once it ended
+        ended.set()
+        thread.join()
+        with mock.patch.object(other_sessions[0], 'close') as close:
+            self.assertEqual(pool.stats()['sessions'], 1)
+            close.assert_called_once_with()
+
+        pool.close()
+        self.assertEqual(pool.stats()['sessions'], 0)
+
+    def test_timeout_per_endpoint(self):
+        pool = ZmdSessionPool(timeouts={'/latex-document': 120})
+        with mock.patch('requests.Session.post') as post:
+            pool.post('/latex-document', json={})
+            self.assertEqual(post.call_args[1]['timeout'], 120)
+            pool.post('/html', json={})
+            self.assertEqual(post.call_args[1]['timeout'], DEFAULT_TIMEOUT)
+        self.assertEqual(pool.stats()['requests'], 2)
@@ -0,0 +1,35 @@
+import tempfile
+
+from django.test import TestCase
+
+from zds.utils.zmd.stats import markdown_stats, count_signs, count_file_signs
+
+# markdown, number of characters of its text according to zmarkdown
+PARITY_CORPUS = [
+    ('Hello @admin *x*\n\nsecond', 20),
+    ('# Titre\n\nUn **texte** avec un [lien](http://example.com) et `du code`.', 31),
+    ('Titre\n=====\n\nTexte ![image](a.png) et $x^2$ et \\*pas em\\*', 27),
+    ('```python\nprint(1)\n```\n\nFin', 3),
+    ('$$\nx^2\n$$\n\nFin', 3),
+    ('> citation\n> suite\n\n- un\n- deux\n\n1. trois', 25),
+    ('[[information]]\n| Ceci est une info\n| sur deux lignes', 33),
+    ('| a | b |\n|---|---|\n| cc | dd |', 6),
+    ('Note[^1]\n\n[^1]: La note.\n\n[ref]: http://example.com', 12),
+    ('Une ligne\net sa suite\n\n---\n\nH~2~O et x^2^', 30),
+    ('Appuyez sur ||Ctrl|| et <https://zestedesavoir.com>', 45),
+]
+
+
+class MarkdownStatsTests(TestCase):
+    def test_parity_corpus(self):
+        for md_input, signs in PARITY_CORPUS:
+            self.assertEqual(count_signs(md_input.splitlines(keepends=True)), signs, md_input)
+
+    def test_words(self):
+        self.assertEqual(markdown_stats(['Un **texte** `code` de cinq mots'])['words'], 5)
+
+    def test_count_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.md', encoding='utf-8') as md_file:
+            md_file.write('# Titre\n\nUn texte accentué.\n' * 100)
+            md_file.flush()
+            self.assertEqual(count_file_signs(md_file.name), 100 * (5 + 18))
@@ -0,0 +1,82 @@
+import os
+import time
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+# formats which are already compressed: deflating them again costs time and saves nothing
+STORED_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.svgz',
+    '.zip', '.gz', '.bz2', '.xz', '.7z', '.epub', '.pdf', '.mp3', '.mp4', '.ogg', '.webm',
+}
+
+
+class _ChunkBuffer:
+    """
+    Write-only, unseekable file the archive is written to, from which the written bytes are taken as they come.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        self.size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+def get_compress_type(name):
+    """
+    :param name: name of a file of the archive
+    :return: ``zipfile.ZIP_STORED`` for the formats which are already compressed (images...),
+        ``zipfile.ZIP_DEFLATED`` for the others
+    """
+    if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def iter_zip(files, chunk_size=CHUNK_SIZE):
+    """
+    Build a zip archive and yield it as it is written, without temporary file: only a few chunks are in memory.
+
+    :param files: the files to put in the archive, as ``(name, size, stream)`` tuples, where ``stream`` has a
+        ``read(size)`` method and ``size`` is its size (or ``None`` if unknown). The streams are read when the
+        archive gets there.
+    :type files: collections.abc.Iterable
+    :param chunk_size: the size of the chunks which are read, and (roughly) of the ones which are yielded
+    :return: the bytes of the archive
+    :rtype: collections.abc.Iterator[bytes]
+    """
+    buffer = _ChunkBuffer()
+    date_time = time.localtime(time.time())[:6]
+    with zipfile.ZipFile(buffer, 'w') as zip_file:
+        for name, size, stream in files:
+            zip_info = zipfile.ZipInfo(name, date_time=date_time)
+            zip_info.compress_type = get_compress_type(name)
+            zip_info.external_attr = 0o600 << 16  # as ``ZipFile.writestr``
+            if size is not None:
+                zip_info.file_size = size
+            with zip_file.open(zip_info, 'w', force_zip64=size is None) as entry:
+                for chunk in iter(lambda: stream.read(chunk_size), b''):
+                    entry.write(chunk)
+                    if buffer.size >= chunk_size:
+                        yield buffer.pop()
+            if buffer.size >= chunk_size:
+                yield buffer.pop()
+    yield buffer.pop()
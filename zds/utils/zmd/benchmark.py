@@ -0,0 +1,69 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, percent):
+    """
+    :param values: measures
+    :param percent: between 0 and 100
+    :return: the nearest-rank percentile of ``values``, ``None`` if there is none
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Benchmark:
+    """
+    Collect the duration of each run of some stages, and report their p50 and p95.
+
+    .. sourcecode:: python
+
+        benchmark = Benchmark()
+        for text in texts:
+            with benchmark.measure('html'):
+                render_markdown(text)
+        logger.info(benchmark.format_report())
+    """
+
+    def __init__(self):
+        self.timings = OrderedDict()
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.setdefault(stage, []).append(time.perf_counter() - start)
+
+    def report(self):
+        """
+        :return: for each stage, in order of first measure: ``(stage, runs, p50, p95, max)``, durations in seconds
+        :rtype: list[tuple]
+        """
+        return [(stage, len(values), percentile(values, 50), percentile(values, 95), max(values))
+                for stage, values in self.timings.items()]
+
+    def over_budget(self, budgets):
+        """
+        :param budgets: maximum p95 of some stages, in seconds
+        :return: the ``(stage, p95, budget)`` of the stages whose p95 is above their budget
+        :rtype: list[tuple]
+        """
+        return [(stage, p95, budgets[stage]) for stage, _, _, p95, _ in self.report()
+                if stage in budgets and p95 > budgets[stage]]
+
+    def format_report(self):
+        lines = ['{:<32} {:>6} {:>10} {:>10} {:>10}'.format('stage', 'runs', 'p50 (ms)', 'p95 (ms)', 'max (ms)')]
+        for stage, runs, p50, p95, maximum in self.report():
+            lines.append('{:<32} {:>6} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+                stage, runs, p50 * 1000, p95 * 1000, maximum * 1000))
+        return '\n'.join(lines)
@@ -0,0 +1,154 @@
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+_breakers = weakref.WeakSet()
+
+STATE_VALUES = {
+    CLOSED: 0,
+    HALF_OPEN: 1,
+    OPEN: 2,
+}
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker around the zmarkdown server.
+
+    After ``failure_threshold`` consecutive failures, the circuit opens: requests are rejected without
+    being sent, so that workers do not pile up waiting for a dead server. After ``reset_timeout`` seconds,
+    a single probe request is let through (half-open state): the circuit closes if it succeeds, and opens
+    again otherwise. The thread sending the probe must call ``release_probe`` once it is done.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, backoff_base=0.1, backoff_max=2, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = None
+        # thread sending the probe in the half-open state, if any
+        self._probing = None
+        self.failures = 0
+        self.opened_count = 0
+        self.rejected_count = 0
+        _breakers.add(self)
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.ZDS_APP['zmd'].get('circuit_breaker', {})
+        return cls(**config)
+
+    def _after_fork_in_child(self):
+        # the lock may have been held, and the probe sent, by another thread of the parent, which does not exist here
+        self._lock = threading.Lock()
+        self._probing = None
+
+    def _update_state(self):
+        if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = None
+
+    @property
+    def state(self):
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def is_open(self):
+        """
+        :return: ``True`` if requests are currently rejected without being sent
+        """
+        return self.state == OPEN
+
+    def allow_request(self):
+        """
+        Must be called before each request. In the half-open state, only one probe request is allowed.
+
+        :rtype: bool
+        """
+        with self._lock:
+            self._update_state()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probing is None:
+                self._probing = threading.get_ident()
+                return True
+            self.rejected_count += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info('zmarkdown answered again, closing the circuit')
+            self._state = CLOSED
+            self._probing = None
+            self.failures = 0
+
+    def release_probe(self):
+        """
+        Must be called once the request allowed by ``allow_request`` is done, whatever its result. If it was the
+        probe and neither ``record_success`` nor ``record_failure`` was called, another probe is allowed.
+        """
+        with self._lock:
+            if self._probing == threading.get_ident():
+                self._probing = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self.failures >= self.failure_threshold):
+                logger.error('zmarkdown failed %d times in a row, opening the circuit for %ss',
+                             self.failures, self.reset_timeout)
+                self._state = OPEN
+                self._opened_at = self.clock()
+                self._probing = None
+                self.opened_count += 1
+
+    def backoff(self, attempt):
+        """
+        :param attempt: number of attempts already made
+        :return: a randomized delay (in seconds) to wait before the next attempt, growing exponentially
+        :rtype: float
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'opened': self.opened_count,
+            'rejected': self.rejected_count,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._opened_at = None
+            self._probing = None
+            self.failures = 0
+
+
+def _reset_breakers_after_fork():
+    for breaker in _breakers:
+        breaker._after_fork_in_child()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_breakers_after_fork)
+
+zmd_breaker = CircuitBreaker.from_settings()
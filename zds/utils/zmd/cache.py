@@ -0,0 +1,196 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches, InvalidCacheBackendError
+
+logger = logging.getLogger(__name__)
+
+# Options whose rendering has side effects on the filesystem (images are downloaded by the
+# zmarkdown server into the given directory): a cached result would skip those side effects.
+UNCACHEABLE_OPTIONS = ('images_download_dir',)
+
+# Options which are only used by the client and are not sent to (or are ignored by) zmarkdown.
+IGNORED_OPTIONS = ('attempts',)
+
+# caches whose lock is replaced in forked processes: it may have been held by another thread of the parent
+_caches = weakref.WeakSet()
+
+
+def render_cache_key(md_input, output_format, opts):
+    """
+    Compute the content-addressed key of a rendering.
+
+    :param md_input: markdown text
+    :param output_format: one of the keys of ``FORMAT_ENDPOINTS``
+    :param opts: options sent to the zmarkdown server
+    :type opts: dict
+    :return: a hexadecimal sha256 digest
+    :rtype: str
+    """
+    filtered_opts = {key: value for key, value in opts.items() if key not in IGNORED_OPTIONS}
+    digest = hashlib.sha256()
+    digest.update(output_format.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(filtered_opts, sort_keys=True, default=str).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(str(md_input).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class LocalRenderCache:
+    """
+    Thread-safe in-process LRU cache, with a time to live on each entry.
+    """
+
+    def __init__(self, max_size=512, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RenderCache:
+    """
+    Two-tier cache of zmarkdown renderings: an in-process LRU tier, backed by a shared Django cache tier.
+
+    Renderings are addressed by a hash of the markdown text, the output format and the options, so that
+    there is never anything to invalidate.
+    """
+
+    def __init__(self, enabled=True, local_size=512, local_ttl=300, shared_cache='default', shared_ttl=86400,
+                 max_input_size=500000, key_prefix='zmd-render'):
+        self.enabled = enabled
+        self.local = LocalRenderCache(local_size, local_ttl)
+        self.shared_cache_name = shared_cache
+        self.shared_ttl = shared_ttl
+        self.max_input_size = max_input_size
+        self.key_prefix = key_prefix
+        self._lock = threading.Lock()
+        _caches.add(self)
+        self.reset_stats()
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.ZDS_APP['zmd'].get('render_cache', {})
+        return cls(**config)
+
+    @property
+    def shared(self):
+        if not self.shared_cache_name:
+            return None
+        try:
+            return caches[self.shared_cache_name]
+        except InvalidCacheBackendError:
+            logger.warning('unknown cache %r, shared render cache disabled', self.shared_cache_name)
+            self.shared_cache_name = None
+            return None
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'bypassed': 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self.stats[counter] += 1
+
+    def is_cacheable(self, md_input, opts):
+        if not self.enabled:
+            return False
+        if len(str(md_input)) > self.max_input_size:
+            return False
+        return not any(opts.get(option) for option in UNCACHEABLE_OPTIONS)
+
+    def get(self, md_input, output_format, opts):
+        """
+        :return: the cached ``(content, metadata, messages)`` tuple, or ``None`` on a miss
+        """
+        if not self.is_cacheable(md_input, opts):
+            self._count('bypassed')
+            return None
+        key = render_cache_key(md_input, output_format, opts)
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return copy.deepcopy(value)
+        shared = self.shared
+        if shared is not None:
+            value = shared.get('{}:{}'.format(self.key_prefix, key))
+            if value is not None:
+                self._count('shared_hits')
+                self.local.set(key, value)
+                return copy.deepcopy(value)
+        self._count('misses')
+        return None
+
+    def set(self, md_input, output_format, opts, value):
+        """
+        Store a successful rendering. The value is copied so that callers can safely mutate what they got.
+        Renderings with errors are not stored, so that they are tried again.
+        """
+        content, metadata, messages = value
+        if not self.is_cacheable(md_input, opts) or messages:
+            return
+        key = render_cache_key(md_input, output_format, opts)
+        value = (str(content), copy.deepcopy(metadata), copy.deepcopy(messages))
+        self.local.set(key, value)
+        shared = self.shared
+        if shared is not None:
+            shared.set('{}:{}'.format(self.key_prefix, key), value, self.shared_ttl)
+
+    def clear(self, shared=False):
+        """
+        Clear the in-process tier. The shared tier is left untouched as keys are content-addressed, unless
+        ``shared`` is ``True`` (for the tests and benchmarks): the whole shared cache is then cleared, since a Django
+        cache cannot delete keys by prefix.
+        """
+        self.local.clear()
+        if shared and self.shared is not None:
+            self.shared.clear()
+
+
+def _reset_locks_after_fork():
+    for cache in _caches:
+        cache._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+render_cache = RenderCache.from_settings()
@@ -0,0 +1,174 @@
+import abc
+import copy
+import logging
+import os
+import threading
+import weakref
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from zds.utils import get_current_request
+
+logger = logging.getLogger(__name__)
+
+RenderMeasure = namedtuple('RenderMeasure', ['output_format', 'duration', 'input_size', 'status_code', 'attempt',
+                                             'view'])
+"""
+A request sent to zmarkdown. ``status_code`` is ``None`` if no answer was received, ``attempt`` is the number of
+previous attempts for the same rendering and ``view`` the view which requested it, if known.
+"""
+
+# upper bounds (in seconds) of the buckets of the duration histograms, the last bucket is unbounded
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# sinks whose lock is replaced in forked processes: it may have been held by another thread of the parent
+_memory_sinks = weakref.WeakSet()
+
+
+def get_current_view():
+    """
+    :return: the name of the view handling the current request, if any. Renderings done in worker threads
+        (batches, publications) are not attached to a request.
+    :rtype: str
+    """
+    request = get_current_request()
+    if request is None:
+        return None
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        return match.view_name or match._func_path
+    return request.path
+
+
+class MetricsSink(abc.ABC):
+    """
+    Receive a ``RenderMeasure`` for each request sent to zmarkdown. Sinks are listed in
+    ``ZDS_APP['zmd']['metrics']['sinks']``, and must be thread-safe.
+    """
+
+    @abc.abstractmethod
+    def record(self, measure):
+        pass
+
+    def reset(self):
+        pass
+
+
+class MemorySink(MetricsSink):
+    """
+    Keep, for each output format, the number of requests, errors and retries, and a histogram of the durations.
+    Read by the ``zmd_rendering`` munin view.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._formats = {}
+        _memory_sinks.add(self)
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'duration': 0.,
+            'input_size': 0,
+            'buckets': [0] * (len(DURATION_BUCKETS) + 1),
+        }
+
+    def record(self, measure):
+        bucket = next((i for i, bound in enumerate(DURATION_BUCKETS) if measure.duration <= bound),
+                      len(DURATION_BUCKETS))
+        with self._lock:
+            stats = self._formats.setdefault(measure.output_format, self._empty_stats())
+            stats['requests'] += 1
+            stats['duration'] += measure.duration
+            stats['input_size'] += measure.input_size
+            stats['buckets'][bucket] += 1
+            if measure.status_code is None or measure.status_code >= 500:
+                stats['errors'] += 1
+            if measure.attempt:
+                stats['retries'] += 1
+
+    def stats(self, output_format=None):
+        """
+        :param output_format: if given, only the stats of this format, otherwise the sum for all formats
+        :rtype: dict
+        """
+        with self._lock:
+            if output_format is not None:
+                return copy.deepcopy(self._formats.get(output_format, self._empty_stats()))
+            total = self._empty_stats()
+            for stats in self._formats.values():
+                for key, value in stats.items():
+                    if key == 'buckets':
+                        total[key] = [a + b for a, b in zip(total[key], value)]
+                    else:
+                        total[key] += value
+            return total
+
+    def reset(self):
+        with self._lock:
+            self._formats = {}
+
+
+class LoggingSink(MetricsSink):
+    """
+    Log each request, with its measures in the ``zmd`` attribute of the record (at the DEBUG level). Not enabled
+    by default.
+    """
+
+    def record(self, measure):
+        logger.debug('zmd_render format=%s duration=%.3f input_size=%d status=%s attempt=%d view=%s',
+                     *measure, extra={'zmd': measure._asdict()})
+
+
+class RenderMetrics:
+    """
+    Dispatch the measures of the requests sent to zmarkdown to the sinks, and log slow renderings along with the
+    view which requested them.
+    """
+
+    def __init__(self, sinks=(), slow_threshold=None):
+        self.sinks = list(sinks)
+        self.slow_threshold = slow_threshold
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.ZDS_APP['zmd'].get('metrics', {})
+        return cls(sinks=[import_string(path)() for path in config.get('sinks', [])],
+                   slow_threshold=config.get('slow_threshold'))
+
+    def get_sink(self, sink_class):
+        """
+        :return: the first sink which is an instance of ``sink_class``, if any
+        """
+        return next((sink for sink in self.sinks if isinstance(sink, sink_class)), None)
+
+    def record(self, output_format, duration, input_size, status_code=None, attempt=0):
+        measure = RenderMeasure(output_format, duration, input_size, status_code, attempt, get_current_view())
+        if self.slow_threshold is not None and duration >= self.slow_threshold:
+            logger.warning('Slow markdown rendering (%s): %.3fs for %d characters, requested by %s',
+                           output_format, duration, input_size, measure.view)
+        for sink in self.sinks:
+            try:
+                sink.record(measure)
+            except Exception:
+                logger.exception('Metrics sink %r failed', sink)
+
+    def reset(self):
+        for sink in self.sinks:
+            sink.reset()
+
+
+def _reset_locks_after_fork():
+    for sink in _memory_sinks:
+        sink._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+zmd_metrics = RenderMetrics.from_settings()
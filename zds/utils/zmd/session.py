@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import weakref
+
+from django.conf import settings
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10
+
+_pools = weakref.WeakSet()
+
+
+class ZmdSessionPool:
+    """
+    Keep-alive HTTP sessions to the zmarkdown server.
+
+    ``requests.Session`` is not guaranteed to be thread-safe, so each thread gets its own session. They all
+    mount an adapter with a bounded connection pool, so that TCP connections are reused from one rendering
+    to the next instead of being opened for each fragment. The sessions of the threads which ended are closed
+    when a new session is opened (and when the stats are read), so that short-lived threads do not leak them.
+    Sessions are dropped after a fork, so that pre-forking servers never share a socket between processes.
+    """
+
+    def __init__(self, pool_size=10, keep_alive=True, timeouts=None):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeouts = timeouts or {}
+        self._local = threading.local()
+        # sessions by thread, the threads being weakly referenced so that they can still be garbage collected
+        self._sessions = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.requests_count = 0
+        _pools.add(self)
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.ZDS_APP['zmd'].get('session_pool', {})
+        return cls(**config)
+
+    def _reset_after_fork(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._local = threading.local()
+            self._sessions = weakref.WeakKeyDictionary()
+            self.requests_count = 0
+
+    def _close_dead_sessions(self):
+        for thread, session in list(self._sessions.items()):
+            if not thread.is_alive():
+                del self._sessions[thread]
+                session.close()
+
+    def _after_fork_in_child(self):
+        # the lock may have been held by another thread of the parent, which does not exist here
+        self._lock = threading.Lock()
+        self._reset_after_fork()
+
+    def get_session(self):
+        """
+        :return: the session of the current thread
+        :rtype: requests.Session
+        """
+        with self._lock:
+            self._reset_after_fork()
+            session = getattr(self._local, 'session', None)
+            if session is None:
+                self._close_dead_sessions()
+                session = Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=False)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                if not self.keep_alive:
+                    session.headers['Connection'] = 'close'
+                self._local.session = session
+                self._sessions[threading.current_thread()] = session
+            return session
+
+    def get_timeout(self, endpoint):
+        return self.timeouts.get(endpoint, DEFAULT_TIMEOUT)
+
+    def post(self, endpoint, **kwargs):
+        """
+        Send a POST request to the given endpoint of the zmarkdown server, with its configured timeout.
+
+        :param endpoint: one of the values of ``FORMAT_ENDPOINTS``
+        :rtype: requests.Response
+        """
+        kwargs.setdefault('timeout', self.get_timeout(endpoint))
+        session = self.get_session()
+        with self._lock:
+            self.requests_count += 1
+        return session.post('{}{}'.format(settings.ZDS_APP['zmd']['server'], endpoint), **kwargs)
+
+    def stats(self):
+        """
+        :return: the number of requests sent, and of TCP connections opened to send them, by this process
+        :rtype: dict
+        """
+        with self._lock:
+            self._reset_after_fork()
+            self._close_dead_sessions()
+            connections = 0
+            for session in self._sessions.values():
+                for adapter in set(session.adapters.values()):
+                    for key in adapter.poolmanager.pools.keys():
+                        connections += adapter.poolmanager.pools[key].num_connections
+            return {
+                'sessions': len(self._sessions),
+                'requests': self.requests_count,
+                'connections': connections,
+                'reused_connections': max(self.requests_count - connections, 0),
+            }
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = weakref.WeakKeyDictionary()
+            self._local = threading.local()
+
+
+def _reset_pools_after_fork():
+    for pool in _pools:
+        pool._after_fork_in_child()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+zmd_sessions = ZmdSessionPool.from_settings()
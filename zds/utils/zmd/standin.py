@@ -0,0 +1,156 @@
+import html
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PING_RE = re.compile(r'(?<![\w@])@(\w[\w.-]*)')
+
+
+def render_html(md_input, opts):
+    """
+    A (very) naive markdown to HTML conversion: paragraphs are separated by blank lines, and the text is
+    escaped. It is only meant to produce outputs that look like those of zmarkdown.
+    """
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', md_input) if p.strip()]
+    content = '\n'.join('<p>{}</p>'.format(html.escape(p)) for p in paragraphs)
+    if opts.get('inline') is True:
+        content = content.replace('</p>\n<p>', '\n')
+    return content
+
+
+def render_latex(md_input, opts):
+    return '\n\n'.join(p.strip() for p in re.split(r'\n\s*\n', md_input) if p.strip())
+
+
+def render_latex_document(md_input, opts):
+    return '\\documentclass{{{}}}\n\\begin{{document}}\n{}\n\\end{{document}}'.format(
+        opts.get('content_type', 'tutorial'), render_latex(md_input, opts))
+
+
+RENDERERS = {
+    '/html': render_html,
+    '/epub': render_html,
+    '/latex': render_latex,
+    '/latex-document': render_latex_document,
+}
+
+
+class StandinZmdHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are sent separately: do not let them wait for the ACK of the client
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _reply(self, status, body, content_type='application/json'):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # used by ``make zmd-check``
+        self._reply(200, 'zmd is running', content_type='text/plain')
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        payload = self.rfile.read(length)
+        server.record_request(self.path)
+
+        renderer = RENDERERS.get(self.path)
+        if renderer is None:
+            self._reply(404, json.dumps({'error': 'unknown endpoint'}))
+            return
+
+        if server.latency:
+            time.sleep(server.latency + random.uniform(0, server.latency_jitter))
+        if server.failure_rate and random.random() < server.failure_rate:
+            self._reply(500, json.dumps({'error': 'injected failure'}))
+            return
+        if server.max_input_size and length > server.max_input_size:
+            self._reply(413, json.dumps({'error': 'payload too large'}))
+            return
+
+        try:
+            data = json.loads(payload.decode('utf-8'))
+            md_input, opts = data['md'], data.get('opts') or {}
+        except (ValueError, KeyError):
+            self._reply(400, json.dumps({'error': 'bad request'}))
+            return
+
+        metadata = {}
+        if not opts.get('disable_ping'):
+            metadata['ping'] = list(dict.fromkeys(PING_RE.findall(md_input)))
+        if opts.get('stats'):
+            metadata['stats'] = {'signs': len(md_input), 'words': len(md_input.split())}
+        self._reply(200, json.dumps([renderer(md_input, opts), metadata, []]))
+
+
+class StandinZmdServer(ThreadingHTTPServer):
+    """
+    A lightweight stand-in for the zmarkdown server, implementing the endpoints of ``FORMAT_ENDPOINTS``.
+
+    It does not render markdown properly, but it answers like zmarkdown does (``[content, metadata, messages]``,
+    with the pings and the stats in the metadata). Use it to test the client or to measure the overhead of the
+    rendering pipeline without node:
+
+    - ``latency`` (and up to ``latency_jitter`` more) seconds are waited before each answer ;
+    - a proportion ``failure_rate`` of the requests get a 500 error ;
+    - payloads bigger than ``max_input_size`` bytes get a 413 error.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, latency_jitter=0, failure_rate=0, max_input_size=None):
+        super().__init__((host, port), StandinZmdHandler)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.max_input_size = max_input_size
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def record_request(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def start(self):
+        """
+        Serve in a background thread.
+
+        :return: the URL of the server
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name='zmd-standin', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
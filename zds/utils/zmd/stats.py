@@ -0,0 +1,150 @@
+import re
+
+# block level syntax
+FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,}|\$\$)')
+HEADING_RE = re.compile(r'^ {0,3}#{1,6}(?:\s+|$)(.*?)(?:\s+#+)?\s*$')
+SETEXT_OR_RULE_RE = re.compile(r'^ {0,3}(?:=+|-+|(?:\* *){3,}|(?:_ *){3,})\s*$')
+QUOTE_RE = re.compile(r'^ {0,3}> ?')
+LIST_ITEM_RE = re.compile(r'^\s*(?:[-*+]|\d+[.)])\s+(?:\[[ xX]\]\s+)?')
+CUSTOM_BLOCK_RE = re.compile(r'^ {0,3}\[\[[^\]]*\]\](.*)$')
+CUSTOM_BLOCK_LINE_RE = re.compile(r'^ {0,3}\| ?(?!.*\|\s*$)')
+TABLE_DELIMITER_RE = re.compile(r'^\s*\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?\s*$')
+FOOTNOTE_DEFINITION_RE = re.compile(r'^ {0,3}\[\^[^\]]+\]:\s*')
+LINK_DEFINITION_RE = re.compile(r'^ {0,3}\[[^\]^][^\]]*\]:\s*\S+')
+
+# inline syntax, in order of application
+INLINE_SUBSTITUTIONS = [
+    (re.compile(r'`+[^`]*`+'), ''),  # inline code
+    (re.compile(r'(?<!\\)\$[^$\n]+\$'), ''),  # inline math
+    (re.compile(r'!\[[^\]]*\](?:\([^)]*\)|\[[^\]]*\])'), ''),  # images
+    (re.compile(r'\[\^[^\]]+\]'), ''),  # footnote references
+    (re.compile(r'\[([^\]]*)\](?:\([^)]*\)|\[[^\]]*\])'), r'\1'),  # links
+    (re.compile(r'<((?:https?|ftp)://[^>\s]+|[^>\s@]+@[^>\s]+)>'), r'\1'),  # autolinks
+    (re.compile(r'</?[a-zA-Z][^>]*>'), ''),  # html
+    (re.compile(r'\|\|(.+?)\|\|'), r'\1'),  # keyboard keys
+    (re.compile(r'(\*{1,3}|(?<!\w)_{1,3}|~~)(?=\S)(.+?)(?<=\S)\1'), r'\2'),  # emphasis, strong, deleted
+    (re.compile(r'(\^|~)(\S+?)\1'), r'\2'),  # superscript, subscript
+    (re.compile(r'  +$', re.M), ''),  # hard breaks
+    (re.compile(r'\\([!-/:-@\[-`{-~])'), r'\1'),  # escapes
+]
+
+
+def _strip_inline(text):
+    for regex, replacement in INLINE_SUBSTITUTIONS:
+        text = regex.sub(replacement, text)
+    return text
+
+
+def _strip_table_row(line):
+    return ''.join(cell.strip() for cell in line.strip().strip('|').split('|'))
+
+
+def _flat_text_lines(lines):
+    """
+    Yield the paragraphs of a markdown document, once block level syntax has been removed.
+    """
+    paragraph = []
+    fence = None
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+
+        # code and math blocks
+        fence_match = FENCE_RE.match(line)
+        if fence is not None:
+            if fence_match and fence_match.group(1)[0] == fence[0] and len(fence_match.group(1)) >= len(fence):
+                fence = None
+            continue
+        if fence_match:
+            fence = fence_match.group(1)
+            yield paragraph
+            paragraph = []
+            continue
+
+        # containers: their content is a regular block, and each list item is a new one
+        while True:
+            list_item = LIST_ITEM_RE.match(line)
+            if list_item:
+                yield paragraph
+                paragraph = []
+            prefix = QUOTE_RE.match(line) or list_item or CUSTOM_BLOCK_LINE_RE.match(line)
+            if not prefix:
+                break
+            line = line[prefix.end():]
+
+        if not line.strip():
+            yield paragraph
+            paragraph = []
+            continue
+
+        if SETEXT_OR_RULE_RE.match(line):
+            # a setext heading underline closes the paragraph (the heading itself), a rule is not text
+            yield paragraph
+            paragraph = []
+            continue
+        if LINK_DEFINITION_RE.match(line) or (TABLE_DELIMITER_RE.match(line) and '-' in line):
+            continue
+
+        heading = HEADING_RE.match(line)
+        custom_block = CUSTOM_BLOCK_RE.match(line)
+        if heading or custom_block:
+            yield paragraph
+            yield [(heading or custom_block).group(1).strip()]
+            paragraph = []
+            continue
+
+        footnote = FOOTNOTE_DEFINITION_RE.match(line)
+        if footnote:
+            line = line[footnote.end():]
+        if line.count('|') >= 2 and line.strip().startswith('|'):
+            # each cell is a block of its own
+            yield paragraph
+            yield [_strip_table_row(line)]
+            paragraph = []
+            continue
+
+        paragraph.append(line.strip())
+
+    yield paragraph
+
+
+def markdown_stats(lines):
+    """
+    Count the characters and words of the text of a markdown document, without rendering it.
+
+    Like the ``stats`` of zmarkdown, only the text is counted: the markup, code, math, images and URLs are not,
+    and the lines of a paragraph are joined by a single line break. The document is read one line at a time,
+    so that big contents can be counted from the file without loading it at once.
+
+    :param lines: the lines of the document (an open file works)
+    :type lines: collections.abc.Iterable[str]
+    :return: ``{'signs': ..., 'words': ...}``
+    :rtype: dict
+    """
+    signs = words = 0
+    for paragraph in _flat_text_lines(lines):
+        if not paragraph:
+            continue
+        text = _strip_inline('\n'.join(paragraph))
+        signs += len(text)
+        words += len(text.split())
+    return {'signs': signs, 'words': words}
+
+
+def count_signs(lines):
+    """
+    :return: the number of characters of the text of the markdown document, see ``markdown_stats``
+    :rtype: int
+    """
+    return markdown_stats(lines)['signs']
+
+
+def count_file_signs(md_file_path):
+    """
+    :param md_file_path: path to a markdown file, encoded in UTF-8
+    :return: the number of characters of its text, see ``markdown_stats``
+    :rtype: int
+    :raise OSError: if the file cannot be read
+    """
+    with open(md_file_path, encoding='utf-8') as md_file:
+        return count_signs(md_file)